@@ -2,7 +2,7 @@ import geopandas as gpd
 
 import config
 import twitterGeoLoc as tgl
-from main import get_keywords
+from utils import get_keywords
 
 Chile = gpd.read_file('./Regiones/Regional.shp')
 
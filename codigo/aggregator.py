@@ -0,0 +1,278 @@
+import argparse
+import os
+import signal
+import threading
+import time
+import traceback
+
+from dashboard_config import TIME_INTERVAL, segment_configs
+from segment_engine import SegmentEngine, segment_feed
+from segments import SegmentRegistry
+from shared_state import SharedState
+from tweet_window import TweetWindow
+from wc_renderer import WordCloudRenderer
+from word_counter import retweet_key
+
+
+# phases of the warm-up, in order, see Aggregator.status()
+PHASES = ('starting', 'segments', 'tweets', 'counts', 'word clouds', 'ready')
+
+
+class Aggregator(object):
+    """
+    Owns the computation of the dashboard: the rolling window with the
+    newest tweets, the series and word frequencies of every segment (one
+    SegmentEngine pass per refresh) and the word cloud renders.
+
+    app.py runs it in the server process when it is started alone.  Under
+    gunicorn (see gunicorn.conf.py) it runs once, in its own process
+    (python aggregator.py), and writes a SharedState after every change;
+    the workers only serve that state, so mongo is read and the word clouds
+    are rendered once whatever the number of workers.
+
+    Nothing is read when it is created: start() warms it up (segment files,
+    the newest tweets, their counts and word clouds) in a background thread
+    and, until it is ready, the figures are empty placeholders and status()
+    reports the progress.
+    """
+
+    def __init__(self, configs, registry=None, tpm_engine='pandas', max_size=10 ** 5, workers=2, state=None,
+                 db='dbTweets', collection='tweets_chile', window=None):
+        """
+        :param configs: list of SegmentConfig
+        :param registry: SegmentRegistry, the one of segments.SEGMENT_FILES
+        (read during the warm-up) if None
+        :param tpm_engine: 'pandas', 'mongo' or 'rollup', see SegmentEngine
+        :param max_size: number of tweets of the rolling window
+        :param workers: number of word cloud rendering processes
+        :param state: SharedState written after every change, None to keep
+        the state in this process only
+        :param db: database of the tweets
+        :param collection: collection of the tweets
+        :param window: TweetWindow with the segments of the registry, the
+        one of db.collection if None
+        """
+        self.configs = list(configs)
+        self.registry = registry
+        self.tpm_engine = tpm_engine
+        self.max_size = max_size
+        self.db = db
+        self.collection = collection
+        self.window = window
+        self.engine = None  # built by the warm-up
+        # word clouds are rendered in the background, the callbacks show the last one
+        self.renderer = WordCloudRenderer(workers=workers)
+        self.state = state
+
+        # empty figures served until the warm-up is done
+        self._placeholders = {config.name: segment_feed(config) for config in self.configs}
+        self._token = '0'
+        self._published = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # one refresh at a time
+        self._thread = None
+
+        # warm-up progress #
+        self.phase = PHASES[0]
+        self.error = None
+        self._created = time.monotonic()
+        self._ready_after = None
+        self.ticked = None  # time.time() of the last successful refresh
+
+    @property
+    def ready(self):
+        """
+        True once the warm-up is done and the figures are computed.
+        """
+        return self._ready.is_set()
+
+    def start(self):
+        """
+        Starts the warm-up in a background thread, if it is not done or
+        running.  Returns self so it can be chained.
+        """
+        with self._lock:
+            if not self.ready and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self.warm_up, name='Aggregator warm-up', daemon=True)
+                self._thread.start()
+        return self
+
+    def warm_up(self):
+        """
+        Reads the segment files and the newest tweets, counts them in every
+        segment and asks for the word clouds.  A failed warm-up (e.g. mongo
+        is down) is reported by status() and tried again by the next tick().
+        :return: True if it is ready
+        """
+        try:
+            self._warm_up()
+        except Exception as e:
+            self.error = repr(e)
+            print('Error al iniciar el dashboard:', e)
+        return self.ready
+
+    def _warm_up(self):
+        self.error = None
+        # screen names of prensa and politicos, read again when the files
+        # change; every tweet gets its segment code when it is parsed
+        self.phase = 'segments'
+        if self.registry is None:
+            self.registry = SegmentRegistry()
+        if self.window is None:
+            # rolling window with the newest tweets, refreshed incrementally
+            self.window = TweetWindow(self.db, self.collection,
+                                      query_fields={"dateTweet": 1, "tweet": 1, "screenName": 1},
+                                      max_size=self.max_size, segments=self.registry)
+        else:
+            # a failed warm-up may have read the window already: the new engine must count all of it
+            self.window.reset()
+        self.phase = 'tweets'
+        new = self.window.refresh()
+
+        # series and word frequencies of every segment, computed in one pass per refresh
+        self.phase = 'counts'
+        engine = SegmentEngine(self.configs, self.registry, tpm_engine=self.tpm_engine, dedup_key=retweet_key)
+        engine.update(new, generation=self.window.generation)
+
+        self.phase = 'word clouds'
+        for config in self.configs:
+            self.renderer.submit(config.name, engine.frequencies(config.name))
+
+        self.engine = engine
+        self._token = str(self.window.generation)
+        self._ready_after = time.monotonic() - self._created
+        self.ticked = time.time()
+        self.phase = 'ready'
+        self._ready.set()
+        self.publish()
+
+    def status(self):
+        """
+        Returns a dict with the warm-up progress: ready, phase, progress
+        (0 to 1), seconds since it was created (or it took to be ready),
+        the last error, the tweets of the window and the pending renders.
+        """
+        ready = self.ready
+        return {'ready': ready,
+                'phase': self.phase,
+                'progress': PHASES.index(self.phase) / (len(PHASES) - 1),
+                'elapsed': self._ready_after if ready else time.monotonic() - self._created,
+                'error': self.error,
+                'last_tick': self.ticked,
+                'tweets': len(self.window) if self.window is not None else 0,
+                'word_clouds_pending': self.renderer.stats()['pending']}
+
+    def tick(self):
+        """
+        Reads only the tweets newer than the last one seen, appends them to
+        the rolling window, counts them in every segment at once and asks
+        for the word clouds of the segments that changed.  Before the
+        warm-up is done it only makes sure it is running.
+        :return: token of the refresh (the signal of the dashboard)
+        """
+        if not self.ready:
+            self.start()
+            return self._token
+        with self._lock:
+            self.registry.reload()
+            new = self.window.refresh()
+            for name in self.engine.update(new, generation=self.window.generation):
+                self.renderer.submit(name, self.engine.frequencies(name))
+            self._token = str(self.window.generation)
+            self.ticked = time.time()
+        self.publish()
+        return self._token
+
+    def publish(self):
+        """
+        Writes the state if the series or the word clouds changed since the
+        last write.
+        :return: True if it was written
+        """
+        if self.state is None or not self.ready:
+            return False
+        feeds = self.engine.feeds
+        images = {config.name: self.renderer.image(config.name) for config in self.configs}
+        signature = (self.window.generation, tuple(feed.revision for feed in feeds.values()),
+                     tuple(key for key, _ in images.values()))
+        if signature == self._published:
+            return False
+        self.state.write(self.window.generation, feeds, images, ticked=self.ticked)
+        self._published = signature
+        return True
+
+    def figure_update(self, name, state):
+        """
+        Returns what a client is missing of the tweets-per-minute figure of a
+        segment, see SeriesFeed.update().
+        """
+        if not self.ready:
+            return self._placeholders[name].update(state)
+        return self.engine.figure_update(name, state)
+
+    def word_cloud(self, name):
+        """
+        Returns (key, figure) of the last word cloud of a segment, an empty
+        figure if there is none yet.
+        """
+        # the key is read first: if the figure changes in between it is sent again next time
+        key = self.renderer.figure_key(name)
+        return key, self.renderer.figure(name)
+
+    def run(self, interval=TIME_INTERVAL, poll=1.0):
+        """
+        Refreshes every `interval` seconds until stop(), and writes the word
+        clouds every `poll` seconds as soon as they are rendered.
+        """
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_tick:
+                    next_tick = time.monotonic() + interval
+                    self.tick()
+                else:
+                    self.publish()
+            except Exception:
+                # the workers keep serving the last state, SharedState.status() reports it once it is stale
+                print('Error en el agregador:')
+                traceback.print_exc()
+            self._stop.wait(poll)
+
+    def stop(self):
+        """
+        Stops run().
+        """
+        self._stop.set()
+
+    def close(self):
+        """
+        Stops run() and the rendering processes.
+        """
+        self.stop()
+        self.renderer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calcula las figuras del dashboard para los workers de gunicorn')
+    parser.add_argument('--state', default=os.environ.get('DASH_STATE', 'dashboard_state.pkl'),
+                        help='archivo del estado compartido (DASH_STATE)')
+    parser.add_argument('--interval', type=float, default=TIME_INTERVAL, help='segundos entre actualizaciones')
+    parser.add_argument('--workers', type=int, default=2, help='procesos de las nubes de palabras')
+    args = parser.parse_args()
+
+    configs = segment_configs()
+    aggregator = Aggregator(configs, tpm_engine=os.environ.get('TPM_ENGINE', 'pandas'), workers=args.workers,
+                            state=SharedState(args.state, configs))
+    # gunicorn stops it with SIGTERM (see gunicorn.conf.py)
+    signal.signal(signal.SIGTERM, lambda signum, frame: aggregator.stop())
+    try:
+        aggregator.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,739 @@
+import argparse
+import copy
+import datetime
+import io
+import json
+import random
+import time
+
+import pandas as pd
+from bson.json_util import dumps
+
+from keyword_matcher import KeywordMatcher
+from pipeline import TweetPipeline
+from sinks import NullSink
+from utils import extract_hash_tags, get_full_text, local_offset, normalize_tweet, parse_created_at, parse_tweet
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# sample data
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# same shape as the payload in prueba.json, reduced to the fields we use
+SAMPLE_TWEET = {
+    'created_at': 'Thu Oct 24 14:39:39 +0000 2019',
+    'id': 1187378123702198274,
+    'id_str': '1187378123702198274',
+    'text': 'La verdad es que visto lo visto tendría que haber entrado aquí el presidente del gobierno a '
+            'preguntarnos a nosotros… https://t.co/4RCHTQqInj',
+    'truncated': True,
+    'extended_tweet': {'full_text': 'La verdad es que visto lo visto tendría que haber entrado aquí el presidente '
+                                    'del gobierno a preguntarnos a nosotros #PiñeraRenuncia #Chile'},
+    'entities': {'hashtags': [], 'symbols': [], 'user_mentions': [],
+                 'urls': [{'url': 'https://t.co/4RCHTQqInj',
+                           'expanded_url': 'https://twitter.com/i/web/status/1187378123702198274',
+                           'display_url': 'twitter.com/i/web/status/1…',
+                           'indices': [117, 140]}]},
+    'source': '<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>',
+    'user': {'id': 767225,
+             'id_str': '767225',
+             'name': 'Alejandro Liam',
+             'screen_name': 'alexliam',
+             'location': 'Málaga / Tallahassee',
+             'description': 'Amante de los carlinos, adicto al Monster Energy, @cineenserio @muteados',
+             'url': 'https://t.co/SfHR3IHDgk',
+             'verified': False,
+             'geo_enabled': True,
+             'followers_count': 1534,
+             'friends_count': 1012,
+             'statuses_count': 41520},
+    'geo': None,
+    'coordinates': None,
+    'place': None,
+    'retweet_count': 0,
+    'favorite_count': 0,
+    'lang': 'es',
+}
+
+
+def sample_tweets(n):
+    """
+    Returns a list of n copies of SAMPLE_TWEET with different ids.
+    """
+    tweets = []
+    for i in range(n):
+        tweet = copy.deepcopy(SAMPLE_TWEET)
+        tweet['id'] += i
+        tweet['id_str'] = str(tweet['id'])
+        tweets.append(tweet)
+    return tweets
+
+
+def report(name, n, elapsed):
+    print("{0:<30} {1:>10.3f} s {2:>12.0f} items/s".format(name, elapsed, n / elapsed if elapsed > 0 else 0))
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# benchmarks
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def legacy_normalize(raw, created_at):
+    """
+    Path used by CustomStreamListener.on_status before normalize_tweet:
+    dumps -> loads -> parse_tweet (dumps) -> loads.
+    """
+    json_obj = json.loads(json.dumps(raw))
+    json_obj['hash_tags'] = list(extract_hash_tags(get_full_text(raw)))
+    json_obj['created_at'] = str(created_at + local_offset())
+    return json.loads(parse_tweet(json_obj))
+
+
+def bench_normalize(n):
+    """
+    Compares the old JSON round trip path with normalize_tweet.
+    """
+    tweets = sample_tweets(n)
+    dates = [parse_created_at(t['created_at']) for t in tweets]
+
+    document = normalize_tweet(tweets[0], created_at=dates[0])
+    assert legacy_normalize(tweets[0], dates[0]) == dict(document, dateTweet=str(document['dateTweet']))
+
+    start = time.perf_counter()
+    for raw, created_at in zip(tweets, dates):
+        legacy_normalize(raw, created_at)
+    report('legacy dumps/loads', n, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for raw, created_at in zip(tweets, dates):
+        normalize_tweet(raw, created_at=created_at)
+    report('normalize_tweet', n, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for raw in tweets:
+        normalize_tweet(raw)
+    report('normalize_tweet (parse date)', n, time.perf_counter() - start)
+
+
+def bench_pipeline(n):
+    """
+    Throughput of TweetPipeline with 1, 2 and 4 workers and null sinks.
+    """
+    tweets = sample_tweets(n)
+    for workers in (1, 2, 4):
+        pipeline = TweetPipeline(writer=NullSink(), csv_sink=NullSink(), workers=workers).start()
+        start = time.perf_counter()
+        for raw in tweets:
+            pipeline.submit(raw)
+        pipeline.close()
+        report('pipeline, %d workers' % workers, n, time.perf_counter() - start)
+        stats = pipeline.stats()
+        print('    normalize mean latency %.4f s, persist mean latency %.4f s' %
+              (stats['normalize']['mean_latency'], stats['persist']['mean_latency']))
+
+
+def sample_texts(n, keywords, seed=0):
+    """
+    Returns n tweet-like texts mixing the words of SAMPLE_TWEET and keywords.
+    """
+    rnd = random.Random(seed)
+    words = SAMPLE_TWEET['extended_tweet']['full_text'].split()
+    return [' '.join(rnd.choice(words) if rnd.random() < 0.9 else rnd.choice(keywords) for _ in range(20))
+            for _ in range(n)]
+
+
+def bench_matcher(n):
+    """
+    One-pass KeywordMatcher against one str.contains per keyword, from 10
+    to 10,000 keywords.  str.contains is skipped above 1,000 keywords.
+    """
+    import pandas as pd
+
+    base = io.open('./kw.csv').read().split(', ')
+    rnd = random.Random(1)
+    for k in (10, 100, 1000, 10000):
+        keywords = base[:k]
+        while len(keywords) < k:
+            keywords.append(''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rnd.randint(4, 10))))
+        texts = pd.Series(sample_texts(n, keywords))
+
+        start = time.perf_counter()
+        incidence = KeywordMatcher(keywords).incidence(texts)
+        report('matcher, %d keywords' % k, n, time.perf_counter() - start)
+
+        if k <= 1000:
+            start = time.perf_counter()
+            counts = [texts.str.contains(kw, regex=False).sum() for kw in keywords]
+            report('str.contains, %d keywords' % k, n, time.perf_counter() - start)
+            assert list(incidence.counts()) == counts
+
+
+# texts that exercise every step of remove_non_plain (tests/test_npl_utils.py checks process_batch on them)
+TOKENIZER_TEXTS = ['RT @Juan_123: ¡Hola!! Piñera renuncia #PiñeraRenuncia https://t.co/4RCHTQqInj 2019 a1b',
+                   'naïve café — 100% “ok” ÉPOCA İstanbul ß ﬁ ² ',
+                   'Marcha   en\tla\nAlameda!!! 🇨🇱🇨🇱 #Chile #NoMasAFP @carabdechile',
+                   'ﾊﾝｶｸ 한국어 ᄀ ᅡ x\u0301y']
+
+
+def bench_tokenizer(n):
+    """
+    process() mapped over the tweets against process_batch() with 1 and 4 processes.
+    """
+    from npl_utils import process, process_batch
+
+    texts = sample_texts(n, TOKENIZER_TEXTS)
+
+    start = time.perf_counter()
+    list(map(process, texts))
+    report('map(process)', n, time.perf_counter() - start)
+
+    for n_jobs in (1, 4):
+        start = time.perf_counter()
+        process_batch(texts, n_jobs=n_jobs)
+        report('process_batch, %d jobs' % n_jobs, n, time.perf_counter() - start)
+
+
+def bench_word_window(n, refreshes=20, new_share=0.01):
+    """
+    Top 35 words of a rolling window of n tweets after each refresh:
+    Counter rebuilt from every bag against WindowCounter.add().
+    """
+    from npl_utils import init_counter, process_batch
+    from word_counter import WindowCounter
+
+    n_new = max(int(n * new_share), 1)
+    wordbags = process_batch(sample_texts(n + refreshes * n_new, TOKENIZER_TEXTS))
+
+    start = time.perf_counter()
+    for i in range(1, refreshes + 1):
+        top = init_counter(wordbags[i * n_new:i * n_new + n]).most_common(35)
+    report('init_counter per refresh', refreshes, time.perf_counter() - start)
+
+    window = WindowCounter(max_size=n)
+    window.add(wordbags[:n])
+    start = time.perf_counter()
+    for i in range(1, refreshes + 1):
+        window.add(wordbags[n + (i - 1) * n_new:n + i * n_new])
+        window_top = window.most_common(35)
+    report('WindowCounter per refresh', refreshes, time.perf_counter() - start)
+    assert [count for _, count in window_top] == [count for _, count in top]
+
+
+def bench_vocabulary(n):
+    """
+    Memory of n word bags as lists of strings against an interned Corpus,
+    and counting them with a Counter against numpy.bincount.
+    """
+    import tracemalloc
+
+    from npl_utils import init_counter, process_batch
+    from vocabulary import CountsView, Vocabulary
+
+    texts = sample_texts(n, TOKENIZER_TEXTS)
+    tracemalloc.start()
+    wordbags = process_batch(texts)
+    lists_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    vocabulary = Vocabulary()
+    corpus = vocabulary.encode(process_batch(texts))
+    corpus_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('lists of strings: {0:.1f} MB, corpus + vocabulary: {1:.1f} MB ({2:.1f}x)'.format(
+        lists_bytes / 2 ** 20, corpus_bytes / 2 ** 20, lists_bytes / corpus_bytes))
+
+    start = time.perf_counter()
+    top = init_counter(wordbags).most_common(35)
+    report('init_counter', n, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    corpus_top = CountsView(corpus.counts(), vocabulary).most_common(35)
+    report('bincount', n, time.perf_counter() - start)
+    assert [count for _, count in corpus_top] == [count for _, count in top]
+
+
+def bench_wordcloud(n):
+    """
+    Size of the word cloud sent to the browser as a raw PIL image (plotly
+    encodes it as an RGB PNG) and as a palette PNG, and the time of a
+    callback that asks for a word cloud already in the cache.
+    """
+    import plotly.graph_objs as go
+    from PIL import Image
+    from wordcloud import WordCloud
+
+    from utils_app import render_wc
+    from wc_renderer import WordCloudRenderer
+
+    rng = random.Random(0)
+    frequencies = {'palabra%d' % i: rng.randint(10, 3000) for i in range(35)}
+    word_cloud = WordCloud(background_color='white', colormap='plasma', width=1200, height=800)
+    raster = Image.fromarray(word_cloud.generate_from_frequencies(frequencies).to_array())
+    pil_source = go.layout.Image(source=raster).source
+    start = time.perf_counter()
+    png_source = render_wc(frequencies)
+    report('render_wc', 1, time.perf_counter() - start)
+    print('PIL image: {0} bytes, palette PNG: {1} bytes'.format(len(pil_source), len(png_source)))
+
+    renderer = WordCloudRenderer()
+    renderer.submit('bench', frequencies)
+    renderer.figure('bench', wait=True)
+    start = time.perf_counter()
+    for i in range(n):
+        # adding 1 to every count does not change the key
+        renderer.submit('bench', {word: value + i % 2 for word, value in frequencies.items()})
+        renderer.figure('bench')
+    report('cached submit + figure', n, time.perf_counter() - start)
+    print(renderer.stats())
+    renderer.close()
+
+
+def bench_collection(name='bench_read_mongo'):
+    """
+    Returns an empty collection of a local mongod, or of mongomock if
+    there is no mongod running, and whether it is mongomock.
+    """
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    try:
+        client = MongoClient('localhost', 27017, serverSelectionTimeoutMS=1000)
+        client.server_info()
+        mock = False
+    except PyMongoError:
+        import mongomock
+        client = mongomock.MongoClient()
+        mock = True
+    collection = client.dbBenchmarks[name]
+    collection.drop()
+    return collection, mock
+
+
+def bench_read_mongo(n):
+    """
+    Reading the newest documents of a collection of dashboard tweets with
+    pd.DataFrame(list(cursor)), with json_only + pd.read_json and with
+    cursor_columns, for 10k, 100k and 1M documents (up to n).
+
+    mongomock queries are much slower than decoding, so without a local
+    mongod the result of each query is read once, kept as BSON and decoded
+    again in every run, like pymongo does with the batches it receives.
+    """
+    import tracemalloc
+
+    import bson
+
+    from utils import cursor_columns
+
+    collection, mock = bench_collection()
+    print('mongomock' if mock else 'mongod local')
+    documents = [normalize_tweet(tweet) for tweet in sample_tweets(1000)]
+    fields = {'dateTweet': 1, 'tweet': 1, 'screenName': 1}
+    stored = 0
+    for size in (10 ** 4, 10 ** 5, 10 ** 6):
+        if size > n:
+            break
+        while stored < size:
+            collection.insert_many([dict(document) for document in documents])
+            stored += len(documents)
+
+        if mock:
+            raw = [bson.encode(document) for document in collection.find({}, fields).sort('_id', -1).limit(size)]
+
+            def find():
+                return (bson.decode(document) for document in raw)
+        else:
+            def find():
+                return collection.find({}, fields).sort('_id', -1).limit(size).batch_size(10000)
+
+        start = time.perf_counter()
+        expected = pd.DataFrame(list(find()))
+        report('DataFrame(list(cursor)), %d' % size, size, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pd.read_json(io.StringIO(dumps(find())))
+        report('dumps + read_json, %d' % size, size, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        df = cursor_columns(find())
+        report('cursor_columns, %d' % size, size, time.perf_counter() - start)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+        del df, expected
+
+        peaks = []
+        for read in (lambda: pd.DataFrame(list(find())), lambda: cursor_columns(find())):
+            tracemalloc.start()
+            read()
+            peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+        print('    peak memory: DataFrame(list(cursor)) {0:.1f} MB, cursor_columns {1:.1f} MB'.format(*peaks))
+    collection.drop()
+
+
+def bench_tpm_engines(n, minutes=150):
+    """
+    Tweets per minute of n tweets spread over `minutes` minutes, computed
+    in pandas (read the tweets, MinuteCounter) and in mongo (MongoTPM),
+    for every tweet and for a list of users.  Both give the same result.
+    """
+    from mongo_tpm import MongoTPM
+    from tpm_counter import MinuteCounter
+    from tweet_window import to_datetime
+    from utils import cursor_columns
+
+    collection, mock = bench_collection('bench_tpm')
+    print('mongomock' if mock else 'mongod local')
+    rnd = random.Random(0)
+    keywords = ['chile', 'gobierno', 'Piñera', 'presidente', 'marcha']
+    texts = sample_texts(1000, keywords)
+    start = datetime.datetime(2019, 10, 24, 12, 0)
+    collection.insert_many([{'dateTweet': start + datetime.timedelta(seconds=rnd.randrange(minutes * 60)),
+                             'tweet': texts[i % len(texts)], 'screenName': rnd.choice(['biobio', 'latercera', 'x'])}
+                            for i in range(n)])
+
+    for users in (None, ['biobio', 'latercera']):
+        label = 'users' if users else 'all'
+        begin = time.perf_counter()
+        df = cursor_columns(collection.find({}, {'dateTweet': 1, 'tweet': 1, 'screenName': 1}))
+        df['dateTweet'] = to_datetime(df['dateTweet'])
+        if users is not None:
+            df = df.loc[df['screenName'].isin(users)]
+        counter = MinuteCounter(keywords, max_length=100)
+        counter.add(df)
+        expected = counter.tpm()
+        report('pandas, %s' % label, n, time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        engine = MongoTPM('dbBenchmarks', collection, keywords, max_length=100, users=users)
+        engine.update()
+        result = engine.tpm()
+        report('mongo, %s' % label, n, time.perf_counter() - begin)
+        for key in expected:
+            pd.testing.assert_frame_equal(result[key], expected[key])
+    collection.drop()
+
+
+def bench_rollups(n, minutes=150, batch_size=100):
+    """
+    Counting n tweets in the per-minute rollups in batches of batch_size
+    (as the ingestion does) and reading the tweets-per-minute back with
+    RollupTPM, checked against MinuteCounter for every tweet and for a
+    segment.  The backfill is checked too with a local mongod.
+
+    mongomock has no bulk upserts, so with it the updates are sent one
+    by one.
+    """
+    from rollups import RollupTPM, RollupWriter, backfill
+    from tpm_counter import MinuteCounter
+    from utils import extract_hash_tags
+
+    tweets, mock = bench_collection('bench_rollup_tweets')
+    rollups = tweets.database['bench_rollups']
+    rollups.drop()
+    print('mongomock' if mock else 'mongod local')
+    rnd = random.Random(0)
+    keywords = ['chile', 'gobierno', 'Piñera', 'presidente', 'marcha']
+    texts = [text + ' #Chile' * (i % 3 == 0) for i, text in enumerate(sample_texts(1000, keywords))]
+    start = datetime.datetime(2019, 10, 24, 12, 0)
+    documents = [{'dateTweet': start + datetime.timedelta(seconds=rnd.randrange(minutes * 60)),
+                  'tweet': texts[i % len(texts)], 'screenName': rnd.choice(['biobio', 'latercera', 'x'])}
+                 for i in range(n)]
+    for document in documents:
+        document['hash_tags'] = list(extract_hash_tags(document['tweet']))
+    segments = {'prensa': ['biobio', 'latercera']}
+
+    def flush(writer):
+        if not mock:
+            return writer.flush()
+        updates = writer.drain()
+        for query, update in updates:
+            rollups.update_one(query, update, upsert=True)
+        return len(updates)
+
+    writer = RollupWriter(rollups, keywords, segments)
+    begin = time.perf_counter()
+    updates = 0
+    for i in range(0, n, batch_size):
+        writer.add(documents[i:i + batch_size])
+        if i % (50 * batch_size) == 0:
+            updates += flush(writer)
+    updates += flush(writer)
+    report('add + $inc (%d updates)' % updates, n, time.perf_counter() - begin)
+
+    df = pd.DataFrame(documents)
+    for segment, users in (('All', None), ('prensa', segments['prensa'])):
+        counter = MinuteCounter(keywords, max_length=100)
+        counter.add(df if users is None else df.loc[df['screenName'].isin(users)])
+        expected = counter.tpm()
+        begin = time.perf_counter()
+        engine = RollupTPM('dbBenchmarks', keywords, max_length=100, segment=segment, collection=rollups)
+        engine.update()
+        result = engine.tpm()
+        report('read rollups, %s' % segment, 100, time.perf_counter() - begin)
+        for key in expected:
+            pd.testing.assert_frame_equal(result[key], expected[key])
+
+    if not mock:
+        tweets.insert_many(documents)
+        live = list(rollups.find({}, {'_id': 0}).sort([('segment', 1), ('minute', 1)]))
+        begin = time.perf_counter()
+        backfill(tweets, rollups, keywords, segments)
+        report('backfill', n, time.perf_counter() - begin)
+        assert list(rollups.find({}, {'_id': 0}).sort([('segment', 1), ('minute', 1)])) == live
+    tweets.drop()
+    rollups.drop()
+
+
+def bench_segments(n, n_segments=8, users=200):
+    """
+    Selecting the tweets of n_segments segments of `users` screen names
+    each: Series.isin per segment against the codes of SegmentRegistry
+    (encoded once when the tweets are parsed) grouped with split().
+    """
+    import numpy as np
+    from segments import SegmentRegistry
+
+    rnd = random.Random(0)
+    everyone = ['user%d' % i for i in range(n_segments * users * 2)]
+    lists = {'segment%d' % i: rnd.sample(everyone, users) for i in range(n_segments)}
+    names = pd.Series([rnd.choice(everyone) for _ in range(n)])
+    registry = SegmentRegistry(lists=lists)
+
+    begin = time.perf_counter()
+    expected = {name: np.flatnonzero(names.isin(members).values) for name, members in lists.items()}
+    report('isin x %d' % n_segments, n, time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    codes = registry.encode(names)
+    report('encode (once)', n, time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    result = registry.split(codes)
+    report('split', n, time.perf_counter() - begin)
+    for name in lists:
+        assert np.array_equal(result[name], expected[name]), name
+
+
+def bench_segment_engine(n, batch_size=1000):
+    """
+    Counting n tweets, in batches of batch_size, in 1, 3 and 9 segments
+    with SegmentEngine (one shared pass per batch) and with one
+    MinuteCounter per segment that filters and matches on its own, as the
+    three tabs used to do.
+    """
+    from keyword_matcher import KeywordMatcher
+    from segment_engine import SegmentConfig, SegmentEngine
+    from segments import SegmentRegistry
+    from tpm_counter import MinuteCounter
+
+    rnd = random.Random(0)
+    keywords = ['chile', 'gobierno', 'Piñera', 'presidente', 'marcha']
+    texts = sample_texts(1000, keywords)
+    everyone = ['user%d' % i for i in range(2000)]
+    start = pd.Timestamp('2019-10-24 12:00', tz='UTC')
+    df = pd.DataFrame({'dateTweet': [start + pd.Timedelta(seconds=i * 3600 // n) for i in range(n)],
+                       'tweet': [texts[i % len(texts)] for i in range(n)],
+                       'screenName': [rnd.choice(everyone) for _ in range(n)]})
+    batches = [df.iloc[i:i + batch_size].reset_index(drop=True) for i in range(0, n, batch_size)]
+
+    for n_segments in (1, 3, 9):
+        lists = {'segment%d' % i: rnd.sample(everyone, 400) for i in range(n_segments - 1)}
+        registry = SegmentRegistry(lists=lists)
+        configs = [SegmentConfig('All', keywords)] + [SegmentConfig(name, keywords, segment=name) for name in lists]
+
+        begin = time.perf_counter()
+        engine = SegmentEngine(configs, registry)
+        for batch in batches:
+            engine.update(batch)
+        report('engine, %d segments' % n_segments, n, time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        counters = {config.name: MinuteCounter(keywords, matcher=KeywordMatcher(keywords)) for config in configs}
+        for batch in batches:
+            for config in configs:
+                rows = batch if config.segment == 'All' else batch.loc[batch['screenName'].isin(lists[config.segment])]
+                counters[config.name].add(rows)
+        report('per segment, %d segments' % n_segments, n, time.perf_counter() - begin)
+
+        for config in configs:
+            expected = counters[config.name].tpm()
+            for key in expected:
+                pd.testing.assert_frame_equal(engine.tpm(config.name)[key], expected[key])
+
+
+def bench_figure_patch(n, ticks=200):
+    """
+    Bytes and time per tick to send the tweets-per-minute figure of a
+    segment: the full figure against the SeriesFeed patch of a client
+    that shows the previous tick.  n tweets arrive in `ticks` ticks of 30
+    seconds, some of them late.
+    """
+    import plotly
+    from dash import no_update
+    from series_feed import SeriesFeed
+    from tpm_counter import MinuteCounter
+    from utils_app import create_graph
+
+    def encode(figure):
+        return plotly.io.json.to_json_plotly(figure.to_plotly_json())
+
+    rnd = random.Random(0)
+    keywords = ['chile', 'gobierno', 'Piñera', 'presidente', 'marcha', 'pension', 'metro', 'afp', 'pacos']
+    texts = sample_texts(1000, keywords)
+    counter = MinuteCounter(keywords, max_length=100)
+    feed = SeriesFeed(keywords + ['All'], lambda tpm: create_graph(tpm, keywords))
+    start = pd.Timestamp('2019-10-24 12:00', tz='UTC')
+    state = None
+    full_bytes = patch_bytes = 0
+    full_time = patch_time = 0.0
+    for tick in range(ticks):
+        now = start + pd.Timedelta(seconds=30 * tick)
+        df = pd.DataFrame({'dateTweet': [now - pd.Timedelta(seconds=rnd.randrange(90)) for _ in range(n // ticks)],
+                           'tweet': [rnd.choice(texts) for _ in range(n // ticks)]})
+        counter.add(df)
+        minutes, values = counter.table()
+        feed.set(minutes, values)
+
+        begin = time.perf_counter()
+        full_bytes += len(encode(create_graph(counter.tpm(), keywords)))
+        full_time += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        figure, state = feed.update(state)
+        if figure is not no_update:
+            patch_bytes += len(encode(figure))
+        patch_time += time.perf_counter() - begin
+
+    report('full figure (%d KB/tick)' % (full_bytes // ticks // 1024), ticks, full_time)
+    report('patch (%d B/tick)' % (patch_bytes // ticks), ticks, patch_time)
+
+
+def bench_shared_state(n, batch_size=1000, workers=4):
+    """
+    Cost per refresh of the dashboard under gunicorn with `workers`
+    workers: every worker counting the new tweets itself, as before, against
+    one aggregator that counts them and writes a SharedState that every
+    worker reads.  n tweets arrive in batches of batch_size, word clouds
+    are left out (a single render happens in the aggregator either way).
+    """
+    import os
+    import tempfile
+    from segment_engine import SegmentConfig, SegmentEngine
+    from segments import SegmentRegistry
+    from shared_state import SharedState
+
+    rnd = random.Random(0)
+    keywords = ['chile', 'gobierno', 'Piñera', 'presidente', 'marcha', 'pension', 'metro', 'afp', 'pacos']
+    texts = sample_texts(1000, keywords)
+    everyone = ['user%d' % i for i in range(2000)]
+    start = pd.Timestamp('2019-10-24 12:00', tz='UTC')
+    df = pd.DataFrame({'dateTweet': [start + pd.Timedelta(seconds=i * 3600 // n) for i in range(n)],
+                       'tweet': [texts[i % len(texts)] for i in range(n)],
+                       'screenName': [rnd.choice(everyone) for _ in range(n)]})
+    batches = [df.iloc[i:i + batch_size].reset_index(drop=True) for i in range(0, n, batch_size)]
+    registry = SegmentRegistry(lists={'prensa': rnd.sample(everyone, 100), 'politicos': rnd.sample(everyone, 300)})
+    configs = [SegmentConfig('prensa', keywords, segment='prensa'), SegmentConfig('chile', keywords),
+               SegmentConfig('politicos', keywords, segment='politicos')]
+
+    engines = [SegmentEngine(configs, registry) for _ in range(workers)]
+    begin = time.perf_counter()
+    for batch in batches:
+        for engine in engines:
+            engine.update(batch)
+    report('every worker computes (%d workers)' % workers, n, time.perf_counter() - begin)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.pkl')
+        engine = SegmentEngine(configs, registry)
+        writer = SharedState(path, configs)
+        readers = [SharedState(path, configs) for _ in range(workers)]
+        begin = time.perf_counter()
+        for batch in batches:
+            engine.update(batch)
+            writer.write(0, engine.feeds, {})
+            for reader in readers:
+                reader.refresh()
+        report('aggregator + shared state (%d KB)' % (os.path.getsize(path) // 1024), n, time.perf_counter() - begin)
+
+    for config in configs:
+        expected = engine.graph(config.name).to_json()
+        assert readers[0].feeds[config.name].figure().to_json() == expected
+
+
+def bench_startup(n):
+    """
+    Startup of the dashboard with n tweets in mongo: time until it can
+    answer (with placeholder figures) and until its figures are ready, for
+    the warm-up in a background thread (Aggregator.start) and for the
+    blocking load app.py used to do at import (Aggregator.warm_up).  The
+    word clouds are rendered in the background in both cases.
+    """
+    import npl_utils  # noqa: F401, imported once so both runs do the same work
+    from aggregator import Aggregator
+    from dashboard_config import segment_configs
+    from segments import SegmentRegistry
+    from tweet_window import TweetWindow
+    from utils import _find, cursor_columns
+
+    collection, mock = bench_collection('bench_startup')
+    print('mongomock' if mock else 'mongod local')
+    documents = [normalize_tweet(tweet) for tweet in sample_tweets(1000)]
+    for i in range(0, n, len(documents)):
+        collection.insert_many([dict(document) for document in documents[:n - i]])
+
+    class BenchWindow(TweetWindow):
+        # reads the benchmark collection, of mongomock too
+        def refresh(self):
+            query = {} if self.last_id is None else {'_id': {'$gt': self.last_id}}
+            return self.append(cursor_columns(_find(collection, query, self.query_fields, self.max_size)))
+
+    fields = {'dateTweet': 1, 'tweet': 1, 'screenName': 1}
+    for background in (False, True):
+        name = 'background warm-up' if background else 'blocking load'
+        begin = time.perf_counter()
+        registry = SegmentRegistry()
+        window = BenchWindow('dbBenchmarks', 'bench_startup', query_fields=fields, max_size=n, segments=registry)
+        aggregator = Aggregator(segment_configs(), registry=registry, window=window)
+        if background:
+            aggregator.start()
+        else:
+            aggregator.warm_up()
+        for config in aggregator.configs:
+            aggregator.figure_update(config.name, None)
+        report(name + ', serving', n, time.perf_counter() - begin)
+        while not aggregator.ready:
+            assert aggregator.error is None, aggregator.error
+            time.sleep(0.01)
+        report(name + ', ready', n, time.perf_counter() - begin)
+        aggregator.close()
+    collection.drop()
+
+
+BENCHMARKS = {'normalize': bench_normalize,
+              'pipeline': bench_pipeline,
+              'matcher': bench_matcher,
+              'tokenizer': bench_tokenizer,
+              'word_window': bench_word_window,
+              'vocabulary': bench_vocabulary,
+              'wordcloud': bench_wordcloud,
+              'read_mongo': bench_read_mongo,
+              'tpm_engines': bench_tpm_engines,
+              'rollups': bench_rollups,
+              'segments': bench_segments,
+              'segment_engine': bench_segment_engine,
+              'figure_patch': bench_figure_patch,
+              'shared_state': bench_shared_state,
+              'startup': bench_startup}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline de tweets')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('-n', type=int, default=100000, help='numero de tweets')
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]
+    for name in names:
+        print('== ' + name + ' ==')
+        BENCHMARKS[name](args.n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+from segment_engine import SegmentConfig
+from utils import get_keywords
+
+TIME_INTERVAL = 30  # seconds between two refreshes
+MAX_LENGTH = 100  # maximum number of points to plot
+
+
+def segment_configs(keywords=None, max_length=MAX_LENGTH):
+    """
+    Segments of the dashboard, one tab each and in the order of the tabs.
+    Shared by app.py (layout) and aggregator.py (computation), adding a
+    segment is adding an entry here.
+    :param keywords: list of keywords, the first 50 of kw.csv if None
+    :param max_length: number of minutes of the tweets-per-minute series
+    """
+    if keywords is None:
+        keywords = get_keywords()[:50]
+    return [
+        SegmentConfig('prensa', keywords, segment='prensa', max_length=max_length,
+                      intro="Los distintos medios de comunicación chilenos utilizan Twitter.  En tiempo real, se puede "
+                            "ver la cantidad de Tweets realizadas por la prensa:",
+                      words_intro="En donde las palabras que más usadas en sus tweets son:"),
+        # retweets of the same tweet are counted once in its word cloud
+        SegmentConfig('chile', keywords, max_length=max_length, wordcloud='words', window_size=10 ** 5,
+                      intro="Los chilenos también usan Twitter.  En tiempo real, se puede ver la frecuencia en que la "
+                            "gente utiliza la red social para expresarse:",
+                      words_intro="Las palabras que más usan los usuarios de twitter son:"),
+        SegmentConfig('politicos', keywords, segment='politicos', max_length=max_length,
+                      intro="Twitter se ha vuelto una plataforma importante para los políticos de hoy.  La frecuencia "
+                            "con la que publican en Twitter es:",
+                      words_intro="Las palabras que más usan los políticos para expresarse en Twitter son:"),
+    ]
@@ -0,0 +1,54 @@
+# gunicorn app:server reads this file from the working directory.
+#
+# The workers do not compute anything: one aggregator process (aggregator.py)
+# reads mongo, computes the figures and writes them to DASH_STATE, and every
+# worker serves that file (shared_state.py).  Adding workers does not add
+# mongo reads nor word cloud renders.
+import os
+import subprocess
+import sys
+import threading
+
+# inherited by the workers and the aggregator
+os.environ.setdefault('DASH_STATE', os.path.abspath('dashboard_state.pkl'))
+
+# seconds between two checks that the aggregator is alive
+AGGREGATOR_POLL = 5
+# seconds the aggregator has to stop before it is killed
+AGGREGATOR_STOP_TIMEOUT = 30
+
+
+def start_aggregator(server):
+    server.aggregator = subprocess.Popen([sys.executable, 'aggregator.py', '--state', os.environ['DASH_STATE']])
+    server.log.info('Aggregator started (pid: %s)', server.aggregator.pid)
+
+
+def watch_aggregator(server):
+    # a dead aggregator is started again; meanwhile the workers serve the last
+    # state and /health/ready reports it as stale
+    while not server.aggregator_stop.wait(AGGREGATOR_POLL):
+        with server.aggregator_lock:
+            code = server.aggregator.poll()
+            if code is not None and not server.aggregator_stop.is_set():
+                server.log.error('Aggregator (pid: %s) exited with code %s, restarting it',
+                                 server.aggregator.pid, code)
+                start_aggregator(server)
+
+
+def on_starting(server):
+    server.aggregator_stop = threading.Event()
+    server.aggregator_lock = threading.Lock()
+    start_aggregator(server)
+    threading.Thread(target=watch_aggregator, args=(server,), name='aggregator watcher', daemon=True).start()
+
+
+def on_exit(server):
+    server.aggregator_stop.set()
+    with server.aggregator_lock:
+        server.aggregator.terminate()
+        try:
+            server.aggregator.wait(AGGREGATOR_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.log.warning('Aggregator (pid: %s) did not stop, killing it', server.aggregator.pid)
+            server.aggregator.kill()
+            server.aggregator.wait()
@@ -0,0 +1,195 @@
+import re
+
+import numpy as np
+
+# pyahocorasick is optional, the trie regex below is used when it is missing
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class Incidence(object):
+    """
+    Sparse tweet x keyword incidence matrix in CSR form: the keywords
+    found in tweet i are indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, indptr, indices, keywords):
+        """
+        :param indptr: int64 array of length n_tweets + 1
+        :param indices: int32 array with the keyword ids of every tweet
+        :param keywords: list of keywords, keyword id -> keyword
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.keywords = keywords
+        self.shape = (len(indptr) - 1, len(keywords))
+        self._columns = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def counts(self):
+        """
+        Returns an array with the number of tweets that contain each keyword.
+        """
+        return np.bincount(self.indices, minlength=self.shape[1])
+
+    def rows(self, keyword):
+        """
+        Returns the positions of the tweets that contain a keyword.
+        :param keyword: keyword or keyword id
+        """
+        if self._columns is None:
+            # CSC view built once: tweet positions sorted by keyword id
+            tweets = np.repeat(np.arange(self.shape[0], dtype=np.int64), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            colptr = np.zeros(self.shape[1] + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=self.shape[1]), out=colptr[1:])
+            self._columns = (colptr, tweets[order])
+        j = keyword if isinstance(keyword, (int, np.integer)) else self.keywords.index(keyword)
+        colptr, tweets = self._columns
+        return tweets[colptr[j]:colptr[j + 1]]
+
+    def mask(self, keyword):
+        """
+        Returns a boolean array saying which tweets contain a keyword.
+        :param keyword: keyword or keyword id
+        """
+        mask = np.zeros(self.shape[0], dtype=bool)
+        mask[self.rows(keyword)] = True
+        return mask
+
+    def hits(self):
+        """
+        Returns a dict keyword -> boolean array over the tweets, the format
+        MinuteCounter.add() receives.
+        """
+        return {kw: self.mask(j) for j, kw in enumerate(self.keywords)}
+
+    def take(self, positions):
+        """
+        Returns the incidence of a subset of tweets.
+        :param positions: array of tweet positions or boolean mask
+        """
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if indptr[-1] == 0:
+            return Incidence(indptr, np.zeros(0, dtype=np.int32), self.keywords)
+        # position of every selected entry in self.indices
+        offsets = np.arange(indptr[-1], dtype=np.int64) - np.repeat(indptr[:-1], lengths)
+        indices = self.indices[np.repeat(starts, lengths) + offsets]
+        return Incidence(indptr, indices, self.keywords)
+
+
+class KeywordMatcher(object):
+    """
+    Finds every keyword contained in a text in a single pass.
+
+    Keywords are literals (not regexes) and match as substrings, like
+    str.contains did.  With pyahocorasick installed an Aho-Corasick
+    automaton is used.  Otherwise the keywords are compiled into one
+    trie-shaped regex that finds, at every position, the longest keyword
+    starting there; the shorter keywords contained in it are added from a
+    precomputed table, so the result is the same.
+    """
+
+    def __init__(self, keywords, ignore_case=False):
+        """
+        :param keywords: list of strings
+        :param ignore_case: match without case distinction
+        """
+        self.keywords = list(keywords)
+        self.ignore_case = ignore_case
+        self._ids = {}
+        for j, kw in enumerate(self.keywords):
+            key = kw.lower() if ignore_case else kw
+            if key:
+                self._ids.setdefault(key, []).append(j)
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for key, ids in self._ids.items():
+                self._automaton.add_word(key, ids)
+            self._automaton.make_automaton()
+            self._regex = None
+        else:
+            self._automaton = None
+            self._regex = re.compile('(?=(' + _trie_regex(self._ids) + '))') if self._ids else None
+            self._contained = {key: self._substrings(key) for key in self._ids}
+
+    def _substrings(self, key):
+        """ ids of every keyword contained in key, key included """
+        found = set()
+        for start in range(len(key)):
+            for end in range(start + 1, len(key) + 1):
+                ids = self._ids.get(key[start:end])
+                if ids:
+                    found.update(ids)
+        return frozenset(found)
+
+    def match(self, text):
+        """
+        Returns the set of keyword ids contained in text.
+        :param text: string
+        """
+        if not isinstance(text, str):
+            return set()
+        if self.ignore_case:
+            text = text.lower()
+        found = set()
+        if self._automaton is not None:
+            for _, ids in self._automaton.iter(text):
+                found.update(ids)
+        elif self._regex is not None:
+            contained = self._contained
+            for key in set(self._regex.findall(text)):
+                found |= contained[key]
+        return found
+
+    def incidence(self, texts):
+        """
+        Matches a column of texts.
+        :param texts: iterable of strings (e.g. df['tweet'])
+        :return: Incidence
+        """
+        indptr = [0]
+        indices = []
+        for text in texts:
+            found = self.match(text)
+            if found:
+                indices.extend(sorted(found))
+            indptr.append(len(indices))
+        return Incidence(np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32), self.keywords)
+
+
+def _trie_regex(words):
+    """
+    Builds a regex that matches any of words, shaped as a trie so the
+    regex engine branches on one character at a time, and that always
+    prefers the longest word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and not end:
+            return branches[0]
+        pattern = '(?:' + '|'.join(branches) + ')'
+        return pattern + '?' if end else pattern
+
+    return build(trie)
@@ -1,21 +1,8 @@
-import io
-
 import pandas as pd
 import tweepy
 
 import config
-
-
-def get_keywords():
-    """
-    Returns a Python list of strings read from the file kw.csv'
-    """
-    # Abrimos las keywords como string
-    keywordfile = io.open('./kw.csv').read()
-
-    #Convertimos a lista de Python
-    keywords = keywordfile.split(', ')
-    return keywords
+from utils import get_keywords
 
 
 def get_searchWords():
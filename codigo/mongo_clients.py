@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from urllib.parse import quote_plus
+
+from pymongo import MongoClient, monitoring
+
+# options of every client, see get_client()
+CLIENT_OPTIONS = {
+    'maxPoolSize': 20,
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 5 * 60 * 1000,
+    'serverSelectionTimeoutMS': 5000,
+    'connectTimeoutMS': 5000,
+    'socketTimeoutMS': 60 * 1000,
+    'waitQueueTimeoutMS': 10 * 1000,
+    'readPreference': 'primaryPreferred',
+}
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener that counts checkouts and the time spent
+    waiting for a connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checked_out = 0  # connections in use right now
+            self.created = 0
+            self.closed = 0
+            self.cleared = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {'checkouts': self.checkouts,
+                    'checkout_failures': self.checkout_failures,
+                    'checked_out': self.checked_out,
+                    'created': self.created,
+                    'closed': self.closed,
+                    'cleared': self.cleared,
+                    'mean_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+                    'max_wait': self.max_wait}
+
+    def _wait(self, event):
+        # pymongo >= 4.7 measures it, older versions only give the events
+        duration = getattr(event, 'duration', None)
+        if duration is None:
+            start = getattr(self._local, 'start', None)
+            duration = time.perf_counter() - start if start is not None else 0.0
+        return duration
+
+    def connection_check_out_started(self, event):
+        # the check out events are published in the thread that checks out
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._wait(event)
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+_clients = {}  # (uri, options) -> (label, MongoClient, PoolMetrics)
+_lock = threading.Lock()
+
+
+def mongo_uri(host='localhost', port=27017, username=None, password=None, db=None):
+    """
+    Builds the mongodb:// URI of a server.
+    """
+    if username and password:
+        return 'mongodb://%s:%s@%s:%s/%s' % (quote_plus(username), quote_plus(password), host, port, db or '')
+    return 'mongodb://%s:%s' % (host, port)
+
+
+def get_client(uri=None, host='localhost', port=27017, username=None, password=None, db=None, **options):
+    """
+    Returns the MongoClient of a server, creating it the first time.
+
+    Every call with the same URI and options shares one client and its
+    connection pool, instead of paying for a new connection, server
+    discovery and monitoring threads on every query.
+    :param uri: mongodb:// URI, built from host, port, username, password
+    and db if None
+    :param options: MongoClient options that replace CLIENT_OPTIONS
+    """
+    if uri is None:
+        uri = mongo_uri(host, port, username, password, db)
+    options = dict(CLIENT_OPTIONS, **options)
+    key = (uri, tuple(sorted(options.items())))
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None:
+            metrics = PoolMetrics()
+            client = MongoClient(uri, event_listeners=[metrics], **options)
+            # the password is not shown in the stats
+            label = uri.rsplit('@', 1)[-1] if '@' in uri else uri.split('//', 1)[-1]
+            entry = _clients[key] = (label, client, metrics)
+        return entry[1]
+
+
+def pool_stats():
+    """
+    Returns the pool metrics of every client, by host (without credentials).
+    """
+    with _lock:
+        entries = list(_clients.values())
+    return {label: metrics.stats() for label, _, metrics in entries}
+
+
+def ping(client=None):
+    """
+    Health check: runs the ping command, it fails after the client's
+    serverSelectionTimeoutMS if the server is down.
+    :param client: MongoClient, the default one if None
+    :return: dict with ok and the latency in seconds
+    """
+    client = client if client is not None else get_client()
+    start = time.perf_counter()
+    try:
+        client.admin.command('ping')
+        ok = True
+    except Exception:
+        ok = False
+    return {'ok': ok, 'latency': time.perf_counter() - start}
+
+
+def close_clients():
+    """
+    Closes every client of the registry.
+    """
+    with _lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for _, client, _ in entries:
+        client.close()
+
+
+def _after_fork():
+    # MongoClient is not fork-safe: a forked process (e.g. a gunicorn worker
+    # with --preload) must not use the parent's sockets and threads, so it
+    # forgets the inherited clients and opens its own on first use.
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
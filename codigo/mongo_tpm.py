@@ -0,0 +1,165 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
+
+from utils import _connect_mongo
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _minute(field):
+    """ $expr with the milliseconds since epoch of a date field, floored to the minute """
+    millis = {'$subtract': [field, EPOCH]}
+    return {'$subtract': [millis, {'$mod': [millis, 60000]}]}
+
+
+def minute_number(value):
+    """ minutes since epoch of a datetime, floored """
+    return int(pd.Timestamp(value).floor('min').value // (60 * 10 ** 9))
+
+
+def tpm_pipeline(keywords, start, users=None, text_column='tweet', time_column='dateTweet'):
+    """
+    Aggregation pipeline that counts the tweets of every minute since start,
+    all of them and the ones that contain each keyword.  Keywords are
+    matched as literal substrings, like KeywordMatcher and str.contains.
+    $regexMatch needs MongoDB 4.2 or newer.  Minutes are bucketed with
+    $subtract/$mod instead of $dateTrunc, which would require 5.0 and which
+    mongomock (used by the benchmarks without a mongod) does not have.
+    :param keywords: list of strings
+    :param start: datetime, first minute counted
+    :param users: list of screen names, None for every tweet
+    :return: list of stages; each result has _id (minute in ms since epoch),
+    All and k0, k1, ... (keyword i)
+    """
+    match = {time_column: {'$gte': start}}
+    if users is not None:
+        match['screenName'] = {'$in': list(users)}
+
+    text = {'$ifNull': ['$' + text_column, '']}
+    project = {'minute': _minute('$' + time_column)}
+    group = {'_id': '$minute', 'All': {'$sum': 1}}
+    for i, kw in enumerate(keywords):
+        project['k%d' % i] = {'$cond': [{'$regexMatch': {'input': text, 'regex': re.escape(kw)}}, 1, 0]}
+        group['k%d' % i] = {'$sum': '$k%d' % i}
+
+    return [{'$match': match}, {'$project': project}, {'$group': group}]
+
+
+class MongoTPM(object):
+    """
+    Tweets-per-minute computed by mongo with an aggregation pipeline, so
+    only max_length rows per series travel to the dashboard instead of
+    the tweets.  Same interface and results as MinuteCounter fed with every
+    tweet of the collection (of the users if any): the newest minute (still
+    being filled) and the first minute (partial) are not plotted.
+
+    It needs MongoDB 4.2 or newer (see tpm_pipeline) and dateTweet stored
+    as dates (see schema.migrate_dates), older string values are not counted.
+    """
+
+    def __init__(self, db, collection, keywords, max_length=100, users=None, column='dateTweet',
+                 text_column='tweet', **mongo_kwargs):
+        """
+        :param db: name of the database
+        :param collection: name of the collection (or a pymongo collection)
+        :param keywords: list of keywords, each one gets its own series
+        :param max_length: number of minutes kept per series
+        :param users: list of screen names, None for every tweet
+        :param mongo_kwargs: host, port, username, password
+        """
+        self.db = db
+        self.collection = collection
+        self.keywords = list(keywords)
+        self.keys = self.keywords + ['All']
+        self.max_length = max_length
+        self.users = users
+        self.column = column
+        self.text_column = text_column
+        self.mongo_kwargs = mongo_kwargs
+
+        self.counts = np.zeros((len(self.keys), 0), dtype=np.int64)
+        self.minutes = np.arange(0)
+        self.first = None  # first minute of the collection, partial so never plotted
+        self.watermark = None  # newest minute
+        self.changed = False
+
+    def _collection(self):
+        if not isinstance(self.collection, str):
+            return self.collection
+        kwargs = dict(host='localhost', port=27017, username=None, password=None)
+        kwargs.update(self.mongo_kwargs)
+        return _connect_mongo(db=self.db, **kwargs)[self.collection]
+
+    def _edge(self, collection, direction):
+        """ minute of the oldest (ASCENDING) or newest (DESCENDING) dated tweet, of the users if any """
+        query = {self.column: {'$type': 'date'}}
+        if self.users is not None:
+            query['screenName'] = {'$in': list(self.users)}
+        for document in collection.find(query, {self.column: 1}).sort(self.column, direction).limit(1):
+            return minute_number(document[self.column])
+        return None
+
+    def update(self):
+        """
+        Runs the aggregation again.
+        :return: True if tpm() changed
+        """
+        collection = self._collection()
+        if self.first is None:
+            self.first = self._edge(collection, ASCENDING)
+        # an empty collection has no watermark either, even if a tweet is inserted right now: the next update
+        # reads both
+        watermark = None if self.first is None else self._edge(collection, DESCENDING)
+        if watermark is None:
+            self.changed = False
+            return False
+
+        start = max(self.first + 1, watermark - self.max_length + 1)
+        minutes = np.arange(start, watermark)
+        counts = np.zeros((len(self.keys), len(minutes)), dtype=np.int64)
+        pipeline = tpm_pipeline(self.keywords, EPOCH + pd.Timedelta(minutes=int(start)), users=self.users,
+                                text_column=self.text_column, time_column=self.column)
+        for row in collection.aggregate(pipeline):
+            j = int(row['_id'] // 60000) - start
+            if 0 <= j < len(minutes):
+                counts[-1, j] = row['All']
+                for i in range(len(self.keywords)):
+                    counts[i, j] = row['k%d' % i]
+
+        self.changed = watermark != self.watermark or not np.array_equal(counts, self.counts)
+        self.watermark = watermark
+        self.minutes = minutes
+        self.counts = counts
+        return self.changed
+
+    def index(self):
+        """
+        Returns the array of plotted minutes (minutes since epoch), oldest first.
+        """
+        return self.minutes
+
+    @property
+    def datetime(self):
+        """
+        Last plotted minute as a Timestamp, NaT if there is none.
+        """
+        if len(self.minutes) == 0:
+            return pd.NaT
+        return pd.Timestamp(int(self.minutes[-1]) * 60, unit='s', tz='UTC')
+
+    def table(self):
+        """
+        Returns the same structure as MinuteCounter.table().
+        """
+        return self.minutes, self.counts
+
+    def tpm(self):
+        """
+        Returns the same structure as MinuteCounter.tpm().
+        """
+        x = pd.to_datetime(self.minutes * 60, unit='s', utc=True)
+        return {key: pd.DataFrame({'dateTweet': self.counts[i]}, index=x) for i, key in enumerate(self.keys)}
@@ -0,0 +1,241 @@
+import queue
+import threading
+import time
+import traceback
+
+from utils import normalize_tweet, tweet_csv_row
+
+
+def process_tweet(raw, csv=False):
+    """
+    Normalizes a raw tweet and builds its .csv row.
+    :param raw: dict with the tweet as sent by Twitter (status._json)
+    :param csv: build the .csv row too
+    :return: (mongo document, csv row or None)
+    """
+    document = normalize_tweet(raw)
+    row = tweet_csv_row(raw, document) if csv else None
+    return document, row
+
+
+class StageStats(object):
+    """
+    Thread-safe counters of one stage of the pipeline: number of items,
+    errors, busy time and latency (time an item took to get through the
+    stage, including the wait in its input queue).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.items = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, items, busy_time=0.0, latencies=(), errors=0):
+        with self._lock:
+            self.items += items
+            self.errors += errors
+            self.busy_time += busy_time
+            for latency in latencies:
+                self.total_latency += latency
+                if latency > self.max_latency:
+                    self.max_latency = latency
+
+    def as_dict(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._start
+            return {'items': self.items,
+                    'errors': self.errors,
+                    'throughput': self.items / elapsed if elapsed > 0 else 0.0,
+                    'busy_time': self.busy_time,
+                    'mean_latency': self.total_latency / self.items if self.items else 0.0,
+                    'max_latency': self.max_latency}
+
+
+class TweetPipeline(object):
+    """
+    Staged processing of the stream: the listener only calls submit()
+    with the raw payload and a pool of worker threads normalizes the
+    tweets and writes them to the .csv sink and the mongo writer.
+
+    Stages:
+        receive: submit() puts (time, raw) in a bounded queue.  When the
+        queue is full it waits block_timeout seconds and then drops the tweet.
+        normalize: each worker takes up to batch_size tweets at once and
+        normalizes them with process_tweet().
+        persist: the batch of rows is written to the csv sink under a single
+        lock, the documents are handed to the mongo writer and the ones it
+        accepted are counted in the per-minute rollups.  An error in one of them is printed and
+        counted in the errors of the stage, the worker keeps going.
+    """
+
+    def __init__(self, writer=None, csv_sink=None, workers=2, batch_size=100, max_queue=10000, block_timeout=1.0,
+                 process=process_tweet, rollups=None):
+        """
+        :param writer: object with a write(document) method (MongoBatchWriter)
+        :param csv_sink: object with a writerows(rows) method (CSVSink), or None
+        :param rollups: object with an add(documents) method (RollupWriter), or None
+        :param workers: number of worker threads
+        :param batch_size: maximum tweets a worker takes from the queue at once
+        :param max_queue: maximum number of raw tweets waiting to be processed
+        :param block_timeout: seconds submit() waits for room in the queue
+        :param process: function raw, csv -> (document, row)
+        """
+        self.writer = writer
+        self.csv_sink = csv_sink
+        self.n_workers = workers
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.process = process
+        self.rollups = rollups
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+        self.stages = {'receive': StageStats(),
+                       'normalize': StageStats(),
+                       'persist': StageStats()}
+
+    def start(self):
+        """
+        Starts the workers.  Returns self so it can be chained.
+        """
+        if not self._threads:
+            for i in range(self.n_workers):
+                thread = threading.Thread(target=self._run, name='TweetPipeline-%d' % i, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, raw):
+        """
+        Enqueues a raw tweet.
+        :param raw: dict with the tweet as sent by Twitter
+        :return: True if the tweet was queued, False if it was dropped
+        """
+        if not self._closed:
+            try:
+                self._queue.put((time.monotonic(), raw), timeout=self.block_timeout)
+                self.stages['receive'].add(1)
+                return True
+            except queue.Full:
+                pass
+        with self._lock:
+            self._dropped += 1
+        return False
+
+    def close(self, timeout=None):
+        """
+        Stops accepting tweets, waits for the workers to process everything
+        in the queue and flushes the csv sink.
+        :param timeout: seconds to wait for each worker
+        """
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.csv_sink is not None:
+            self.csv_sink.flush()
+
+    def stats(self):
+        """
+        Returns a dict with the queue depth, dropped tweets and the counters
+        of every stage (see StageStats).
+        """
+        stats = {name: stage.as_dict() for name, stage in self.stages.items()}
+        stats['queue_depth'] = self._queue.qsize()
+        with self._lock:
+            stats['dropped'] = self._dropped
+        return stats
+
+    def _next_batch(self):
+        """
+        Blocks for one item and then takes whatever else is ready, up to
+        batch_size.  Returns (batch, stop).
+        """
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        csv = self.csv_sink is not None
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if not batch:
+                continue
+
+            # NORMALIZE #
+            start = time.monotonic()
+            documents = []
+            rows = []
+            received = []
+            for t, raw in batch:
+                try:
+                    document, row = self.process(raw, csv=csv)
+                except Exception as e:
+                    print(e)
+                    continue
+                documents.append(document)
+                received.append(t)
+                if csv:
+                    rows.append(row)
+            end = time.monotonic()
+            self.stages['normalize'].add(len(batch), busy_time=end - start,
+                                         latencies=[end - t for t, _ in batch], errors=len(batch) - len(documents))
+
+            # PERSIST #
+            ok = True
+            if csv and rows:
+                ok &= _persist('csv', self.csv_sink.writerows, rows)
+            accepted = documents
+            if self.writer is not None:
+                # a document the writer drops (its queue is full) is never stored, so it is not counted either
+                accepted = []
+                ok &= _persist('mongo', _write, self.writer, documents, accepted)
+            if self.rollups is not None and accepted:
+                ok &= _persist('rollups', self.rollups.add, accepted)
+            done = time.monotonic()
+            self.stages['persist'].add(len(documents), busy_time=done - end,
+                                       latencies=[done - t for t in received], errors=0 if ok else len(documents))
+
+
+def _write(writer, documents, accepted):
+    # appends to accepted the documents the writer took, write() returns False for a dropped one
+    for document in documents:
+        if writer.write(document) is not False:
+            accepted.append(document)
+
+
+def _persist(name, function, *args):
+    """
+    Calls one output of the persist stage.  An exception (e.g. the csv sink
+    was closed) would end the worker and leave the queue without anyone to
+    drain it, so it is printed instead.
+    :return: True if it did not raise
+    """
+    try:
+        function(*args)
+        return True
+    except Exception:
+        print('Error en el pipeline (%s):' % name)
+        traceback.print_exc()
+        return False
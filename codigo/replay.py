@@ -0,0 +1,194 @@
+import argparse
+import calendar
+import gzip
+import time
+
+from pipeline import TweetPipeline
+from sinks import CSVSink, MongoBatchWriter, NullSink
+from twitterGeoLoc import CustomStreamListener
+from utils import CSV_HEADER, parse_created_at, parse_payload
+
+
+def read_payloads(path):
+    """
+    Yields the payloads recorded in path, one JSON document per line.
+    Files ending in .gz are decompressed on the fly.
+    :param path: newline-delimited JSON file
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def payload_time(data):
+    """
+    Returns the time of a payload in seconds since epoch, or None for
+    notices without a timestamp.
+    :param data: dict, the payload parsed by utils.parse_payload
+    """
+    if 'timestamp_ms' in data:
+        return int(data['timestamp_ms']) / 1000.0
+    if 'created_at' in data:
+        return calendar.timegm(parse_created_at(data['created_at']).timetuple())
+    return None
+
+
+class ReplaySource(object):
+    """
+    Replays recorded tweets from newline-delimited JSON files (optionally
+    gzip-compressed) as if they were coming from the Stream.
+
+    speed=None replays as fast as possible, speed=1 keeps the original
+    time between tweets and any other value accelerates (or slows down)
+    the replay by that factor.
+    """
+
+    def __init__(self, paths, speed=None, loops=1):
+        """
+        :param paths: list of files to replay, in order
+        :param speed: None for maximum speed or the acceleration factor
+        :param loops: number of times the files are replayed
+        """
+        self.paths = paths
+        self.speed = speed
+        self.loops = loops
+
+    def payloads(self):
+        """
+        Yields the payloads, sleeping between them when speed is not None.
+        """
+        for payload, _ in self.parsed_payloads():
+            yield payload
+
+    def parsed_payloads(self):
+        """
+        Yields (payload, data) pairs, sleeping between them when speed is
+        not None.  data is the parsed payload when speed is not None (its
+        time is read from it), None otherwise or if it is not valid JSON.
+        """
+        for _ in range(self.loops):
+            first = None
+            start = None
+            for path in self.paths:
+                for payload in read_payloads(path):
+                    data = None
+                    if self.speed is not None:
+                        try:
+                            data = parse_payload(payload)
+                        except ValueError:
+                            pass  # on_data counts it as invalid
+                        t = None if data is None else payload_time(data)
+                        if t is not None:
+                            if first is None:
+                                first = t
+                                start = time.monotonic()
+                            wait = (t - first) / self.speed - (time.monotonic() - start)
+                            if wait > 0:
+                                time.sleep(wait)
+                    yield payload, data
+
+    def run(self, listener):
+        """
+        Feeds the payloads to the listener, as tweepy's Stream does.  A
+        payload parsed for its time is not parsed again by a raw listener.
+        :param listener: CustomStreamListener
+        :return: (number of payloads, elapsed seconds)
+        """
+        return _replay(listener, self.parsed_payloads())
+
+
+def replay(listener, payloads):
+    """
+    Feeds recorded payloads to listener.on_data, as tweepy's Stream does.
+    Stops if on_data returns False.
+    :param listener: CustomStreamListener
+    :param payloads: iterable of strings
+    :return: (number of payloads, elapsed seconds)
+    """
+    return _replay(listener, ((payload, None) for payload in payloads))
+
+
+def _replay(listener, pairs):
+    # pairs of (payload, parsed payload or None)
+    n = 0
+    start = time.perf_counter()
+    for payload, data in pairs:
+        n += 1
+        if data is not None and listener.raw:
+            result = listener.on_payload(data)
+        else:
+            result = listener.on_data(payload)
+        if result is False:
+            break
+    return n, time.perf_counter() - start
+
+
+def make_writer(kind, collection='tweets_replay'):
+    """
+    Returns the stand-in for the mongo writer.
+    :param kind: 'null' (only counts), 'mongomock' (in-memory mongo, if
+    installed) or 'mongo' (local mongod, dbTweets.<collection>)
+    """
+    if kind == 'null':
+        return NullSink()
+    if kind == 'mongomock':
+        import mongomock
+        return MongoBatchWriter(mongomock.MongoClient().dbTweets[collection]).start()
+    if kind == 'mongo':
+        from twitterGeoLoc import db
+        return MongoBatchWriter(db[collection]).start()
+    raise ValueError('writer desconocido: ' + kind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproduce tweets grabados a traves del listener, sin Twitter')
+    parser.add_argument('paths', nargs='+', help='archivos con un payload JSON por linea (.gz permitido)')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='1 = tiempo real, 10 = 10x; sin especificar va a maxima velocidad')
+    parser.add_argument('--loops', type=int, default=1, help='veces que se reproducen los archivos')
+    parser.add_argument('--workers', type=int, default=2, help='0 procesa en el thread del listener')
+    parser.add_argument('--status', action='store_true', help='usar objetos Status de tweepy en vez del modo raw')
+    parser.add_argument('--mongo', choices=['null', 'mongomock', 'mongo'], default='null',
+                        help='destino de los documentos')
+    parser.add_argument('--csv', choices=['null', 'file', 'none'], default='null', help='destino del .csv')
+    args = parser.parse_args()
+
+    source = ReplaySource(args.paths, speed=args.speed, loops=args.loops)
+    if args.speed is None:
+        # Load everything first so reading the files is not measured #
+        source = [payload for _ in range(args.loops) for path in args.paths for payload in read_payloads(path)]
+
+    writer = make_writer(args.mongo)
+    csv_sink = None
+    if args.csv == 'null':
+        csv_sink = NullSink()
+    elif args.csv == 'file':
+        csv_sink = CSVSink(prefix='OutputReplay', header=CSV_HEADER)
+
+    pipeline = None
+    if args.workers > 0:
+        pipeline = TweetPipeline(writer=writer, csv_sink=csv_sink, workers=args.workers).start()
+    listener = CustomStreamListener(writer=writer, csv_sink=csv_sink, pipeline=pipeline, raw=not args.status)
+
+    # Measure until the workers are done with the last payload #
+    start = time.perf_counter()
+    if isinstance(source, ReplaySource):
+        n, _ = source.run(listener)
+    else:
+        n, _ = replay(listener, source)
+    if pipeline is not None:
+        pipeline.close()
+        print("Pipeline:", pipeline.stats())
+    listener.close()
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    print("{0} payloads en {1:.3f} s: {2:.0f} payloads/s".format(n, elapsed, n / elapsed if elapsed > 0 else 0))
+    print("Writer: {0}, notices: {1}".format(writer.stats(), listener.notice_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+import argparse
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from keyword_matcher import KeywordMatcher
+from mongo_tpm import MongoTPM, minute_number
+from segments import SegmentRegistry
+from utils import _connect_mongo, get_keywords
+
+# One document per (segment, minute):
+#   {segment: 'All', minute: datetime, tweets: n,
+#    keywords: {keyword: n, ...}, hash_tags: {hash_tag: n, ...}}
+# minute is the dateTweet of its tweets (local wall-clock) floored to the minute.
+ROLLUP_COLLECTION = 'tweets_rollup'
+ROLLUP_INDEXES = [
+    IndexModel([('segment', ASCENDING), ('minute', ASCENDING)], name='segment_minute', unique=True),
+]
+
+
+def ensure_rollup_indexes(collection):
+    """
+    Creates the indexes of ROLLUP_INDEXES that do not exist yet.
+    """
+    return collection.create_indexes(ROLLUP_INDEXES)
+
+
+def field_name(key):
+    """
+    Name of a keyword or hash tag as a mongo field: '.' and a leading '$'
+    are not allowed, they are replaced by their full width versions.
+    """
+    key = key.replace('.', '．')
+    return '＄' + key[1:] if key.startswith('$') else key
+
+
+class RollupWriter(object):
+    """
+    Keeps the per-minute rollups of the tweets written to mongo.
+
+    add() counts a batch of tweet documents in memory and a background
+    thread sends the counts every flush_interval seconds as one $inc upsert
+    per (segment, minute).  A busy minute gets one update per flush instead
+    of one per tweet, so the rollups do not become a write hot spot.
+    The segment files are read again when they change (see SegmentRegistry).
+    """
+
+    def __init__(self, collection, keywords, segments=None, flush_interval=5.0, column='dateTweet',
+                 text_column='tweet', matcher=None):
+        """
+        :param collection: pymongo collection of the rollups
+        :param keywords: list of keywords counted
+        :param segments: SegmentRegistry, or dict segment -> list of screen
+        names; the 'All' segment counts every tweet
+        :param flush_interval: seconds between two flushes
+        :param column: datetime column of the tweets
+        :param text_column: text column used to look for the keywords
+        :param matcher: KeywordMatcher for the keywords, built if None
+        """
+        self.collection = collection
+        self.keywords = list(keywords)
+        self.flush_interval = flush_interval
+        self.column = column
+        self.text_column = text_column
+        self.matcher = matcher if matcher is not None else KeywordMatcher(self.keywords)
+        self._keyword_fields = ['keywords.' + field_name(kw) for kw in self.keywords]
+
+        if not isinstance(segments, SegmentRegistry):
+            segments = SegmentRegistry(lists=segments or {})
+        self.segments = segments
+
+        self._pending = {}  # (segment, minute) -> Counter of field -> increment
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # counters #
+        self._tweets = 0
+        self._updates = 0
+        self._failed = 0
+        self._flushes = 0
+        self._flush_time = 0.0
+
+    def start(self):
+        """
+        Starts the flushing thread.  Returns self so it can be chained.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='RollupWriter', daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, documents):
+        """
+        Counts a batch of tweet documents (as written to tweets_chile).
+        """
+        documents = [document for document in documents if isinstance(document.get(self.column), datetime)]
+        if not documents:
+            return
+        hits = self.matcher.incidence([document.get(self.text_column) for document in documents])
+        indptr, indices, fields = hits.indptr, hits.indices, self._keyword_fields
+        codes = self.segments.encode([document.get('screenName') for document in documents]).tolist()
+        # segments of every code in the batch, 'All' included
+        labels = {code: ('All',) + self.segments.segments_of(code) for code in set(codes)}
+
+        with self._lock:
+            pending = self._pending
+            for i, document in enumerate(documents):
+                minute = document[self.column].replace(second=0, microsecond=0)
+                keywords = [fields[j] for j in indices[indptr[i]:indptr[i + 1]]]
+                # a lone '#' gives an empty tag, and mongo rejects the empty field name
+                hash_tags = ['hash_tags.' + field_name(tag) for tag in set(document.get('hash_tags') or ()) if tag]
+                for segment in labels[codes[i]]:
+                    counts = pending.get((segment, minute))
+                    if counts is None:
+                        counts = pending[segment, minute] = Counter()
+                    counts['tweets'] += 1
+                    counts.update(keywords)
+                    counts.update(hash_tags)
+            self._tweets += len(documents)
+
+    def drain(self):
+        """
+        Takes the pending counts.
+        :return: list of (filter, update) pairs, one $inc upsert per (segment, minute)
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [({'segment': segment, 'minute': minute}, {'$inc': dict(counts)})
+                for (segment, minute), counts in pending.items()]
+
+    def flush(self):
+        """
+        Sends the pending counts with one bulk_write.
+        :return: number of rollups updated
+        """
+        updates = self.drain()
+        if not updates:
+            return 0
+        start = time.monotonic()
+        failed = 0
+        try:
+            self.collection.bulk_write([UpdateOne(query, update, upsert=True) for query, update in updates],
+                                       ordered=False)
+        except BulkWriteError as e:
+            failed = len(e.details.get('writeErrors', []))
+            print('Error en los rollups:', failed, 'minutos con error')
+        except PyMongoError as e:
+            failed = len(updates)
+            print(e)
+        with self._lock:
+            self._updates += len(updates) - failed
+            self._failed += failed
+            self._flushes += 1
+            self._flush_time += time.monotonic() - start
+        return len(updates) - failed
+
+    def close(self, timeout=None):
+        """
+        Stops the flushing thread and sends what is pending.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        """
+        Returns a dict with the tweets counted, rollups updated and failed,
+        pending rollups and flush latency.
+        """
+        with self._lock:
+            return {'tweets': self._tweets,
+                    'updates': self._updates,
+                    'failed': self._failed,
+                    'pending': len(self._pending),
+                    'flushes': self._flushes,
+                    'mean_flush_latency': self._flush_time / self._flushes if self._flushes else 0.0}
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self.segments.reload()
+
+
+class RollupTPM(MongoTPM):
+    """
+    Tweets-per-minute of a segment read from the rollups: update() reads
+    at most max_length documents, whatever the number of tweets.  Same
+    interface and results as MongoTPM and MinuteCounter.
+    """
+
+    def __init__(self, db, keywords, max_length=100, segment='All', collection=ROLLUP_COLLECTION, **mongo_kwargs):
+        """
+        :param db: name of the database
+        :param keywords: list of keywords, each one gets its own series
+        :param max_length: number of minutes kept per series
+        :param segment: 'All', 'prensa', 'politicos'
+        :param collection: name of the rollup collection (or a pymongo collection)
+        :param mongo_kwargs: host, port, username, password
+        """
+        super(RollupTPM, self).__init__(db, collection, keywords, max_length=max_length, **mongo_kwargs)
+        self.segment = segment
+
+    def update(self):
+        """
+        Reads the rollups again.
+        :return: True if tpm() changed
+        """
+        collection = self._collection()
+        query = {'segment': self.segment}
+        if self.first is None:
+            for row in collection.find(query, {'minute': 1}).sort('minute', ASCENDING).limit(1):
+                self.first = minute_number(row['minute'])
+
+        if self.first is None:
+            # no rollups yet, the next update reads the first minute and the watermark
+            self.changed = False
+            return False
+
+        fields = ['keywords.' + field_name(kw) for kw in self.keywords]
+        projection = dict.fromkeys(['minute', 'tweets'] + fields, 1)
+        # the newest max_length minutes, the watermark included
+        rows = list(collection.find(query, projection).sort('minute', DESCENDING).limit(self.max_length))
+        if not rows:
+            self.changed = False
+            return False
+
+        watermark = minute_number(rows[0]['minute'])
+        start = max(self.first + 1, watermark - self.max_length + 1)
+        minutes = np.arange(start, watermark)
+        counts = np.zeros((len(self.keys), len(minutes)), dtype=np.int64)
+        for row in rows[1:]:
+            j = minute_number(row['minute']) - start
+            if 0 <= j < len(minutes):
+                counts[-1, j] = row.get('tweets', 0)
+                found = row.get('keywords', {})
+                for i, kw in enumerate(self.keywords):
+                    counts[i, j] = found.get(field_name(kw), 0)
+
+        self.changed = watermark != self.watermark or not np.array_equal(counts, self.counts)
+        self.watermark = watermark
+        self.minutes = minutes
+        self.counts = counts
+        return self.changed
+
+
+def ingestion_active(tweets, within=60):
+    """
+    True if a tweet was inserted in the last `within` seconds (by the time
+    of its ObjectId), i.e. twitterGeoLoc is probably writing.
+    :param tweets: pymongo collection of the tweets
+    """
+    for document in tweets.find({}, {'_id': 1}).sort('_id', DESCENDING).limit(1):
+        age = datetime.now(timezone.utc) - document['_id'].generation_time
+        return age.total_seconds() < within
+    return False
+
+
+def backfill(tweets, rollups, keywords, segments=None, until=None, batch_size=10000):
+    """
+    Builds the rollups of the tweets already in tweets_chile.  The rollups
+    of the minutes before `until` are deleted and counted again, so it can
+    be run more than once; newer minutes are left to the ingestion.
+
+    The ingestion must be stopped while it runs: a RollupWriter may still
+    hold counts of minutes before `until` for tweets that are already
+    stored, and flushing them after the recount would count those tweets
+    twice (see ingestion_active).
+    :param tweets: pymongo collection of the tweets
+    :param rollups: pymongo collection of the rollups
+    :param keywords: list of keywords counted
+    :param segments: SegmentRegistry, or dict segment -> list of screen names
+    :param until: datetime, start of the current minute if None
+    :param batch_size: tweets read and counted at a time
+    :return: RollupWriter stats
+    """
+    if until is None:
+        until = datetime.now().replace(second=0, microsecond=0)
+    ensure_rollup_indexes(rollups)
+    rollups.delete_many({'minute': {'$lt': until}})
+
+    writer = RollupWriter(rollups, keywords, segments)
+    fields = {'dateTweet': 1, 'tweet': 1, 'screenName': 1, 'hash_tags': 1}
+    cursor = tweets.find({'dateTweet': {'$type': 'date', '$lt': until}}, fields).batch_size(batch_size)
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) == batch_size:
+            writer.add(batch)
+            batch = []
+    writer.add(batch)
+    writer.flush()
+    return writer.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construye los rollups por minuto desde los tweets guardados')
+    parser.add_argument('--db', default='dbTweets')
+    parser.add_argument('--collection', default='tweets_chile')
+    parser.add_argument('--rollups', default=ROLLUP_COLLECTION)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--until', default=None, help='solo los minutos anteriores (YYYY-MM-DD HH:MM)')
+    parser.add_argument('--force', action='store_true', help='no verificar que la ingesta esté detenida')
+    args = parser.parse_args()
+
+    db = _connect_mongo(args.host, args.port, None, None, args.db)
+    if not args.force and ingestion_active(db[args.collection]):
+        parser.exit(1, 'Hay tweets de hace menos de un minuto: detenga twitterGeoLoc.py antes de reconstruir los '
+                       'rollups (o use --force)\n')
+    until = datetime.strptime(args.until, '%Y-%m-%d %H:%M') if args.until else None
+    print('rollups:', backfill(db[args.collection], db[args.rollups], get_keywords(), SegmentRegistry(), until=until))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import argparse
+from datetime import datetime
+
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+from utils import _connect_mongo
+
+# Indexes of tweets_chile.  dateTweet is a BSON date with the local time
+# of the tweet (the same wall-clock value the strings used to have).
+TWEET_INDEXES = [
+    IndexModel([('dateTweet', ASCENDING)], name='dateTweet'),
+    IndexModel([('screenName', ASCENDING), ('dateTweet', ASCENDING)], name='screenName_dateTweet'),
+    IndexModel([('hash_tags', ASCENDING)], name='hash_tags'),
+]
+
+
+def ensure_indexes(collection):
+    """
+    Creates the indexes of TWEET_INDEXES that do not exist yet.
+    :param collection: pymongo collection (e.g. dbTweets.tweets_chile)
+    :return: list with the names of the indexes
+    """
+    return collection.create_indexes(TWEET_INDEXES)
+
+
+def migrate_dates(collection, batch_size=1000):
+    """
+    Converts the dateTweet strings of older documents to BSON dates.
+    It can be stopped and run again, only strings are converted.
+    :param collection: pymongo collection
+    :param batch_size: updates sent at a time
+    :return: number of documents converted
+    """
+    converted = 0
+    updates = []
+    cursor = collection.find({'dateTweet': {'$type': 'string'}}, {'dateTweet': 1}).batch_size(batch_size)
+    for document in cursor:
+        date = pd.Timestamp(document['dateTweet']).to_pydatetime()
+        updates.append(UpdateOne({'_id': document['_id']}, {'$set': {'dateTweet': date}}))
+        if len(updates) == batch_size:
+            converted += collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        converted += collection.bulk_write(updates, ordered=False).modified_count
+    return converted
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# queries
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def _date_range(start=None, end=None):
+    condition = {}
+    if start is not None:
+        condition['$gte'] = start
+    if end is not None:
+        condition['$lt'] = end
+    return condition
+
+
+def find_between(collection, start=None, end=None, fields=None):
+    """
+    Tweets with start <= dateTweet < end, oldest first.  Uses the dateTweet index.
+    :param start: datetime, None for no lower bound
+    :param end: datetime, None for no upper bound
+    :param fields: projection
+    """
+    query = {}
+    dates = _date_range(start, end)
+    if dates:
+        query['dateTweet'] = dates
+    return collection.find(query, fields).sort('dateTweet', ASCENDING)
+
+
+def find_by_users(collection, users, start=None, end=None, fields=None):
+    """
+    Tweets of a list of users (e.g. prensa, politicos), optionally in a
+    time range.  Uses the (screenName, dateTweet) index.
+    :param users: list of screen names
+    """
+    query = {'screenName': {'$in': list(users)}}
+    dates = _date_range(start, end)
+    if dates:
+        query['dateTweet'] = dates
+    return collection.find(query, fields)
+
+
+def find_by_hashtags(collection, hash_tags, start=None, end=None, fields=None):
+    """
+    Tweets with any of hash_tags (without the #).  Uses the hash_tags index.
+    """
+    query = {'hash_tags': {'$in': list(hash_tags)}}
+    dates = _date_range(start, end)
+    if dates:
+        query['dateTweet'] = dates
+    return collection.find(query, fields)
+
+
+def find_newest(collection, num_limit, fields=None):
+    """
+    Newest num_limit tweets, newest first.  Uses the _id index.
+    """
+    return collection.find({}, fields).sort('_id', DESCENDING).limit(num_limit)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# explain
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def _stages(plan):
+    """ Yields every stage of a query plan """
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def index_scans(cursor):
+    """
+    Returns the names of the indexes the winning plan of a query scans, an
+    empty list if it is a collection scan.
+    :param cursor: pymongo cursor, not iterated yet
+    """
+    plan = cursor.explain()['queryPlanner']['winningPlan']
+    return [stage.get('indexName') for stage in _stages(plan) if stage['stage'] == 'IXSCAN']
+
+
+def check_query_plans(collection, users=('biobio',), hash_tags=('Chile',)):
+    """
+    Explains every query helper and checks that it uses its index (IXSCAN)
+    instead of scanning the whole collection.
+    :param collection: pymongo collection with TWEET_INDEXES
+    :return: dict helper -> (uses the index, index names scanned)
+    """
+    now = datetime.now()
+    start = now - pd.Timedelta(hours=1)
+    queries = {'find_between': (find_between(collection, start, now), 'dateTweet'),
+               'find_by_users': (find_by_users(collection, users, start, now), 'screenName_dateTweet'),
+               'find_by_hashtags': (find_by_hashtags(collection, hash_tags), 'hash_tags'),
+               'find_newest': (find_newest(collection, 10), '_id_')}
+    result = {}
+    for name, (cursor, index) in queries.items():
+        scans = index_scans(cursor)
+        result[name] = (index in scans, scans)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crea los indices de la coleccion de tweets')
+    parser.add_argument('--db', default='dbTweets')
+    parser.add_argument('--collection', default='tweets_chile')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--migrate', action='store_true', help='convierte los dateTweet de texto a fechas BSON')
+    parser.add_argument('--explain', action='store_true', help='verifica que las consultas usen los indices')
+    args = parser.parse_args()
+
+    collection = _connect_mongo(args.host, args.port, None, None, args.db)[args.collection]
+    if args.migrate:
+        print('dateTweet convertidos:', migrate_dates(collection))
+    print('indices:', ensure_indexes(collection))
+    if args.explain:
+        failed = False
+        for name, (ok, scans) in check_query_plans(collection).items():
+            print('{0:18} {1:4} {2}'.format(name, 'OK' if ok else 'MAL', scans))
+            failed = failed or not ok
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
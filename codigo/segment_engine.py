@@ -0,0 +1,202 @@
+from keyword_matcher import KeywordMatcher
+from mongo_tpm import MongoTPM
+from rollups import RollupTPM
+from series_feed import SeriesFeed
+from tpm_counter import MinuteCounter, minute_numbers
+from utils_app import create_graph, keyword_frequencies
+from vocabulary import Vocabulary
+from word_counter import WindowCounter, retweet_key
+
+
+class SegmentConfig(object):
+    """
+    Declarative description of a segment of the dashboard (one tab): the
+    users it follows, its keywords, how long its windows are and the
+    texts of its tab.  Adding a segment only needs a new SegmentConfig.
+    """
+
+    def __init__(self, name, keywords, segment='All', max_length=100, plotted=9, wordcloud='keywords',
+                 n_words=35, window_size=10 ** 5, label=None, intro='', words_intro=''):
+        """
+        :param name: name of the segment, used in the ids of the layout
+        :param keywords: list of keywords counted per minute
+        :param segment: segment of the SegmentRegistry, 'All' for every tweet
+        :param max_length: number of minutes of the tweets-per-minute series
+        :param plotted: number of keywords plotted, besides 'All'
+        :param wordcloud: 'words' for the most common words of the tweets,
+        'keywords' for the keywords of the series
+        :param n_words: number of words of the word cloud
+        :param window_size: tweets whose words are counted ('words' only)
+        :param label: label of the tab, name.title() if None
+        :param intro: text above the plot
+        :param words_intro: text above the word cloud
+        """
+        if wordcloud not in ('words', 'keywords'):
+            raise ValueError("wordcloud must be 'words' or 'keywords', not %r" % wordcloud)
+        self.name = name
+        self.keywords = list(keywords)
+        self.segment = segment
+        self.max_length = max_length
+        self.plotted = plotted
+        self.wordcloud = wordcloud
+        self.n_words = n_words
+        self.window_size = window_size
+        self.label = label if label is not None else name.title()
+        self.intro = intro
+        self.words_intro = words_intro
+
+
+def segment_feed(config):
+    """
+    SeriesFeed of the tweets-per-minute figure of a segment: its plotted
+    keywords and 'All'.
+    """
+    plotted = config.keywords[:config.plotted]
+    return SeriesFeed(plotted + ['All'], lambda tpm: create_graph(tpm, plotted))
+
+
+class SegmentEngine(object):
+    """
+    Computes the tweets-per-minute series and word frequencies of every
+    segment in one shared pass over each batch of new tweets.
+
+    The keywords of every segment are matched once (one KeywordMatcher for
+    their union), the tweets are grouped by segment code once
+    (SegmentRegistry.split), their minutes are computed once and they are
+    tokenized once into a shared Vocabulary.  Each segment then only takes
+    its rows, so the cost grows with the tweets, not with tweets x segments.
+    """
+
+    def __init__(self, configs, registry, tpm_engine='pandas', dedup_key=retweet_key, db='dbTweets',
+                 collection='tweets_chile', column='dateTweet', text_column='tweet'):
+        """
+        :param configs: list of SegmentConfig
+        :param registry: SegmentRegistry with the segments of the configs
+        :param tpm_engine: 'pandas' (MinuteCounter), 'mongo' (MongoTPM) or
+        'rollup' (RollupTPM)
+        :param dedup_key: function text -> key, retweets with the same key
+        are counted once in the word clouds; None counts every tweet
+        :param db: database of the tweets (mongo engines)
+        :param collection: collection of the tweets (mongo engine)
+        """
+        self.configs = list(configs)
+        self.registry = registry
+        self.tpm_engine = tpm_engine
+        self.dedup_key = dedup_key
+        self.db = db
+        self.collection = collection
+        self.column = column
+        self.text_column = text_column
+
+        keywords = []
+        for config in self.configs:
+            keywords.extend(kw for kw in config.keywords if kw not in keywords)
+        self.matcher = KeywordMatcher(keywords)
+        self.vocabulary = Vocabulary()
+
+        self.counters = {config.name: self._counter(config) for config in self.configs}
+        self.word_windows = {config.name: WindowCounter(max_size=config.window_size, vocabulary=self.vocabulary)
+                             for config in self.configs if config.wordcloud == 'words'}
+        self._configs = {config.name: config for config in self.configs}
+        self._tpm = {}  # name -> tpm of the last update, built on first use
+        self.feeds = {config.name: segment_feed(config) for config in self.configs}
+        self.generation = None
+
+    def _counter(self, config):
+        users = None if config.segment == 'All' else self.registry.users(config.segment)
+        if self.tpm_engine == 'rollup':
+            return RollupTPM(self.db, config.keywords, max_length=config.max_length, segment=config.segment)
+        if self.tpm_engine == 'mongo':
+            return MongoTPM(self.db, self.collection, config.keywords, max_length=config.max_length, users=users,
+                            column=self.column, text_column=self.text_column)
+        return MinuteCounter(config.keywords, max_length=config.max_length, column=self.column,
+                             text_column=self.text_column, matcher=self.matcher)
+
+    def update(self, df, generation=None):
+        """
+        Counts a batch of new tweets in every segment.
+        :param df: DataFrame with the new tweets, with the 'segment' codes
+        of TweetWindow(segments=registry) or screenName
+        :param generation: refresh number of df, a generation that was
+        already counted is ignored
+        :return: set with the names of the segments whose series changed
+        """
+        if generation is not None:
+            if self.generation is not None and generation <= self.generation:
+                return set()
+            self.generation = generation
+
+        # shared pass: keywords, minutes, segments and words of the batch
+        new = len(df.index) > 0
+        if new:
+            texts = df[self.text_column]
+            hits = self.matcher.incidence(texts)
+            minutes = minute_numbers(df[self.column])
+            codes = df['segment'] if 'segment' in df.columns else self.registry.encode(df['screenName'])
+            groups = self.registry.split(codes)
+            if self.word_windows:
+                # imported on first use: gensim takes about a second to import
+                from npl_utils import process_batch
+                corpus = self.vocabulary.encode(process_batch(texts))
+                keys = None if self.dedup_key is None else list(map(self.dedup_key, texts))
+
+        changed = set()
+        for config in self.configs:
+            name = config.name
+            counter = self.counters[name]
+            rows = groups[config.segment] if new and config.segment != 'All' else None
+
+            if new and name in self.word_windows:
+                words = corpus if rows is None else corpus.take(rows)
+                subset = keys if rows is None or keys is None else [keys[i] for i in rows]
+                self.word_windows[name].add(words, keys=subset)
+
+            if isinstance(counter, MongoTPM):
+                if counter.users is not None:
+                    counter.users = self.registry.users(config.segment)
+                tpm_changed = counter.update()
+            elif not new:
+                tpm_changed = False
+            elif rows is None:
+                tpm_changed = counter.add(df, hits=hits, minutes=minutes)
+            else:
+                tpm_changed = counter.add(df.iloc[rows], hits=hits.take(rows), minutes=minutes[rows])
+
+            if tpm_changed:
+                self._tpm.pop(name, None)
+                feed = self.feeds[name]
+                plotted, values = counter.table()
+                feed.set(plotted, values[[counter.keys.index(key) for key in feed.keys]])
+                changed.add(name)
+        return changed
+
+    def tpm(self, name):
+        """
+        Returns the tweets-per-minute of a segment, see MinuteCounter.tpm().
+        """
+        tpm = self._tpm.get(name)
+        if tpm is None:
+            tpm = self._tpm[name] = self.counters[name].tpm()
+        return tpm
+
+    def frequencies(self, name):
+        """
+        Returns the word frequencies of the word cloud of a segment.
+        """
+        config = self._configs[name]
+        if config.wordcloud == 'words':
+            return dict(self.word_windows[name].most_common(config.n_words))
+        return keyword_frequencies(self.tpm(name), config.keywords)
+
+    def graph(self, name):
+        """
+        Returns the full tweets-per-minute figure of a segment.
+        """
+        return self.feeds[name].figure()
+
+    def figure_update(self, name, state):
+        """
+        Returns what a client is missing of the tweets-per-minute figure of a
+        segment, see SeriesFeed.update().
+        """
+        return self.feeds[name].update(state)
@@ -0,0 +1,145 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# segment -> csv with the screen names (column Twitter, with the @)
+SEGMENT_FILES = {'prensa': 'data/Noticieros Twitter.csv',
+                 'politicos': 'data/Politicos-Twitter.csv'}
+
+
+class SegmentRegistry(object):
+    """
+    Maps screen names to a small integer segment code.
+
+    Bit i of the code is set when the user belongs to segment i, so a
+    user can be in several segments and 0 means no segment.  Codes are
+    computed once per tweet when it is parsed (TweetWindow, RollupWriter)
+    and every segment is then selected with integer operations instead of
+    comparing screen names again on every tick.
+
+    The lists are read from csv files with get_username_list and read
+    again by reload() when a file changes, without restarting the server.
+    Tweets keep the code they got when they were parsed.
+    """
+
+    def __init__(self, files=None, lists=None):
+        """
+        :param files: dict segment -> csv, SEGMENT_FILES if both are None
+        :param lists: dict segment -> list of screen names, fixed lists
+        that are not read from files
+        """
+        if files is None and lists is None:
+            files = SEGMENT_FILES
+        self.files = dict(files or {})
+        self.lists = {segment: list(users) for segment, users in (lists or {}).items()}
+        self.names = list(self.files) + [name for name in self.lists if name not in self.files]
+        if len(self.names) > 64:
+            raise ValueError('a SegmentRegistry holds at most 64 segments')
+        self.dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                          if np.iinfo(dtype).bits >= len(self.names))
+        self.bits = {name: 1 << i for i, name in enumerate(self.names)}
+        self.version = 0
+
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._state = None  # (users by segment, Index of screen names, codes + a trailing 0)
+        self.reload(force=True)
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self, force=False):
+        """
+        Reads the segment files again if any of them changed.
+        :param force: read them even if they did not change
+        :return: True if the lists were read again
+        """
+        with self._lock:
+            mtimes = {path: self._mtime(path) for path in self.files.values()}
+            if not force and mtimes == self._mtimes:
+                return False
+            users = dict(self.lists)
+            try:
+                if self.files:
+                    from utils_app import get_username_list
+                for name, path in self.files.items():
+                    users[name] = get_username_list(path)
+            except (OSError, ValueError, KeyError) as e:
+                # a file being written or removed: keep the lists we have
+                print('Error al leer los segmentos:', e)
+                if self._state is not None:
+                    return False
+                users.update({name: [] for name in self.files if name not in users})
+            self._mtimes = mtimes
+
+            codes = {}
+            for name in self.names:
+                for user in users[name]:
+                    codes[user] = codes.get(user, 0) | self.bits[name]
+            index = pd.Index(list(codes), dtype=object)
+            table = np.array(list(codes.values()) + [0], dtype=self.dtype)
+            self._state = (users, index, table)
+            self.version += 1
+            return True
+
+    def users(self, segment):
+        """
+        Returns the screen names of a segment.
+        """
+        return self._state[0][segment]
+
+    def segments(self):
+        """
+        Returns a dict segment -> list of screen names.
+        """
+        users = self._state[0]
+        return {name: users[name] for name in self.names}
+
+    def encode(self, screen_names):
+        """
+        Returns the segment code of every screen name.
+        :param screen_names: array-like of strings (e.g. df['screenName'])
+        :return: array of self.dtype, 0 for users of no segment
+        """
+        _, index, table = self._state
+        # unknown names give -1, the trailing 0 of the table
+        return table[index.get_indexer(np.asarray(screen_names, dtype=object))]
+
+    def segments_of(self, code):
+        """
+        Returns the names of the segments of a code.
+        """
+        return tuple(name for name in self.names if int(code) & self.bits[name])
+
+    def mask(self, codes, segment):
+        """
+        Returns a boolean array saying which codes belong to a segment.
+        """
+        return (np.asarray(codes) & self.bits[segment]) != 0
+
+    def split(self, codes):
+        """
+        Groups tweets by code once and returns the positions of the tweets
+        of every segment.
+        :param codes: array of segment codes (e.g. df['segment'])
+        :return: dict segment -> sorted int64 array of positions
+        """
+        codes = np.asarray(codes)
+        order = np.argsort(codes, kind='stable')
+        values, starts = np.unique(codes[order], return_index=True)
+        ends = np.append(starts[1:], len(codes))
+        result = {}
+        for name in self.names:
+            bit = self.bits[name]
+            groups = [order[start:end] for value, start, end in zip(values, starts, ends) if int(value) & bit]
+            if len(groups) == 1:
+                result[name] = groups[0].astype(np.int64)
+            else:
+                result[name] = np.sort(np.concatenate(groups)).astype(np.int64) if groups else \
+                    np.zeros(0, dtype=np.int64)
+        return result
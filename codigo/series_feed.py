@@ -0,0 +1,159 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from dash import Patch, no_update
+
+
+class SeriesFeed(object):
+    """
+    Plotted tweets-per-minute series of a figure, with the revision in
+    which every point last changed, so each browser only receives what it
+    is missing instead of the whole figure every tick.
+
+    Every client keeps the state() of the figure it shows (in a
+    dcc.Store).  update(state) returns a dash Patch that sets the points
+    that changed since that revision (late tweets), appends the new
+    minutes and removes the minutes that left the window.  The full
+    figure is only sent on first load, after a restart (the epoch
+    changes) or when the patch would not be smaller.
+    """
+
+    def __init__(self, keys, build):
+        """
+        :param keys: plotted keys, in the order of the traces
+        :param build: function that returns the full figure of a dict key ->
+        DataFrame, the format of MinuteCounter.tpm() (e.g. create_graph)
+        """
+        self.keys = list(keys)
+        self.build = build
+        self.epoch = os.urandom(4).hex()  # another process or a restart has another one
+        self.revision = 0
+        self.minutes = np.arange(0)
+        self.values = np.zeros((len(self.keys), 0), dtype=np.int64)
+        self.stamps = np.zeros(0, dtype=np.int64)  # revision of the last change of every minute
+
+        self._figure = None  # (revision, full figure)
+        self._lock = threading.Lock()
+
+    def set(self, minutes, values):
+        """
+        Stores the series after a refresh.
+        :param minutes: plotted minutes (since epoch), oldest first
+        :param values: array with one row per key and one column per minute
+        :return: True if anything changed
+        """
+        minutes = np.asarray(minutes)
+        values = np.asarray(values)
+        with self._lock:
+            if np.array_equal(minutes, self.minutes) and np.array_equal(values, self.values):
+                return False
+            revision = self.revision + 1
+            stamps = np.full(len(minutes), revision, dtype=np.int64)
+            # minutes already plotted keep their stamp if their points did not change
+            _, new, old = np.intersect1d(minutes, self.minutes, assume_unique=True, return_indices=True)
+            same = (values[:, new] == self.values[:, old]).all(axis=0)
+            stamps[new[same]] = self.stamps[old[same]]
+
+            self.minutes, self.values, self.stamps, self.revision = minutes, values, stamps, revision
+            return True
+
+    def dump(self):
+        """
+        Returns the series with their revision and epoch, as a dict that can
+        be pickled and given to restore() in another process.
+        """
+        with self._lock:
+            return {'epoch': self.epoch, 'revision': self.revision, 'minutes': self.minutes,
+                    'values': self.values, 'stamps': self.stamps}
+
+    def restore(self, data):
+        """
+        Replaces the series with the ones of dump(), keeping the epoch and
+        revision so the states of the clients stay valid in every process.
+        :return: True if anything changed
+        """
+        with self._lock:
+            if data['epoch'] == self.epoch and data['revision'] == self.revision:
+                return False
+            self.epoch, self.revision = data['epoch'], data['revision']
+            self.minutes, self.values, self.stamps = data['minutes'], data['values'], data['stamps']
+            self._figure = None
+            return True
+
+    def state(self):
+        """
+        Returns the state of the figure of the current revision, as a dict
+        that can be stored in the browser.
+        """
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        first, last = (int(self.minutes[0]), int(self.minutes[-1])) if len(self.minutes) else (None, None)
+        return {'epoch': self.epoch, 'revision': self.revision, 'first': first, 'last': last}
+
+    def figure(self):
+        """
+        Returns the full figure of the current revision, built once.
+        """
+        with self._lock:
+            return self._full()
+
+    def _full(self):
+        if self._figure is None or self._figure[0] != self.revision:
+            x = pd.to_datetime(self.minutes * 60, unit='s', utc=True)
+            tpm = {key: pd.DataFrame({'dateTweet': self.values[i]}, index=x) for i, key in enumerate(self.keys)}
+            self._figure = (self.revision, self.build(tpm))
+        return self._figure[1]
+
+    def update(self, state):
+        """
+        Returns what a client with a given state is missing.
+        :param state: state() of the figure shown by the client, None on first load
+        :return: (figure, state): no_update, a Patch or the full figure, and
+        the new state of the client
+        """
+        with self._lock:
+            current = self._state()
+            if state == current:
+                return no_update, current
+            if state and state.get('epoch') == self.epoch and state.get('revision', 0) > self.revision:
+                # the client was served by a process that already read a newer revision
+                return no_update, state
+            patch = self._patch(state)
+            return (self._full() if patch is None else patch), current
+
+    def _patch(self, state):
+        """ Patch from state to the current revision, None if the full figure must be sent """
+        if not state or state.get('epoch') != self.epoch or state.get('first') is None or not len(self.minutes):
+            return None
+        first, last = state['first'], state['last']
+        start, end = int(self.minutes[0]), int(self.minutes[-1])
+        # the client shows the contiguous minutes first..last, they must overlap or touch ours
+        if first > start or last > end or last < start - 1:
+            return None
+
+        kept = (self.minutes <= last)
+        changed = np.flatnonzero(kept & (self.stamps > state['revision']))
+        added = np.flatnonzero(self.minutes > last)
+        dropped = start - first
+        if (len(changed) + len(added) + dropped) * 2 > len(self.minutes):
+            return None
+
+        patch = Patch()
+        x = pd.to_datetime(self.minutes[added] * 60, unit='s', utc=True)
+        x = [timestamp.isoformat() for timestamp in x]
+        for i in range(len(self.keys)):
+            trace = patch['data'][i]
+            # positions in the client's arrays, before the oldest points are removed
+            for j in changed.tolist():
+                trace['y'][int(self.minutes[j]) - first] = int(self.values[i, j])
+            if len(added):
+                trace['x'].extend(x)
+                trace['y'].extend(self.values[i, added].tolist())
+            for _ in range(dropped):
+                del trace['x'][0]
+                del trace['y'][0]
+        return patch
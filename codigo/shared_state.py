@@ -0,0 +1,153 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from segment_engine import segment_feed
+from utils_app import wc_figure
+
+
+class SharedState(object):
+    """
+    Figures of the dashboard shared by processes through one file.
+
+    The aggregator (aggregator.py) is the only process that reads mongo and
+    computes the series and word clouds; after every change it writes them
+    with write().  The file is written to a temporary name and moved over
+    the old one with os.replace, so readers always find a whole state.
+
+    Every gunicorn worker only reads the file again when it changed and
+    serves the same figures and patches (see SeriesFeed) as the aggregator:
+    the series keep the epoch and revisions of the aggregator, so a browser
+    can be served by any worker.
+    """
+
+    def __init__(self, path, configs, max_age=90.0):
+        """
+        :param path: file of the state, in a directory every process can write to
+        :param configs: list of SegmentConfig of the dashboard
+        :param max_age: seconds after the last successful refresh of the
+        aggregator after which the state is stale (not ready)
+        """
+        self.path = os.path.abspath(path)
+        self.max_age = max_age
+        self.feeds = {config.name: segment_feed(config) for config in configs}
+        self.generation = 0
+        self.written = None  # time.time() of the write of the state read
+        self.ticked = None  # time.time() of the last successful refresh of the aggregator
+
+        self._word_clouds = {}  # name -> (key, figure)
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def write(self, generation, feeds, images, ticked=None):
+        """
+        Writes a new state (aggregator side).
+        :param generation: refresh number of the tweets the state comes from
+        :param feeds: dict name -> SeriesFeed
+        :param images: dict name -> (key, PNG data URI), see WordCloudRenderer.image()
+        :param ticked: time.time() of the last successful refresh, now if None
+        """
+        now = time.time()
+        state = {'generation': generation, 'written': now, 'ticked': now if ticked is None else ticked,
+                 'feeds': {name: feed.dump() for name, feed in feeds.items()},
+                 'images': dict(images)}
+        directory = os.path.dirname(self.path)
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path))
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def refresh(self):
+        """
+        Reads the file again if it changed since the last read.
+        :return: True if the state was read again
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat == self._stat:
+                return False
+            try:
+                with open(self.path, 'rb') as file:
+                    state = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                print('Error al leer el estado compartido:', e)
+                return False
+            self._stat = stat
+            for name, data in state['feeds'].items():
+                if name in self.feeds:
+                    self.feeds[name].restore(data)
+            for name, (key, source) in state['images'].items():
+                # the figure is built once per image, not once per request
+                current = self._word_clouds.get(name)
+                if current is None or current[0] != key:
+                    self._word_clouds[name] = (key, wc_figure(source))
+            self.generation = state['generation']
+            self.written = state['written']
+            self.ticked = state.get('ticked', self.written)
+            return True
+
+    def tick(self):
+        """
+        Reads the newest state.
+        :return: token of its generation (the signal of the dashboard)
+        """
+        self.refresh()
+        return str(self.generation)
+
+    def figure_update(self, name, state):
+        """
+        Returns what a client is missing of the tweets-per-minute figure of a
+        segment, see SeriesFeed.update().
+        """
+        return self.feeds[name].update(state)
+
+    def word_cloud(self, name):
+        """
+        Returns (key, figure) of the word cloud of a segment, an empty figure
+        if the aggregator did not render it yet.
+        """
+        with self._lock:
+            return self._word_clouds.get(name, (None, wc_figure(None)))
+
+    @property
+    def ready(self):
+        """
+        True once a state written by the aggregator was read, as long as the
+        aggregator refreshed it in the last max_age seconds.
+        """
+        return self.ticked is not None and time.time() - self.ticked <= self.max_age
+
+    def start(self):
+        """
+        Reads the state if the aggregator already wrote one, the figures are
+        empty placeholders until then.  Returns self so it can be chained.
+        """
+        self.refresh()
+        return self
+
+    def status(self):
+        """
+        Returns a dict with ready, the phase ('waiting for aggregator' until
+        the first state is read, 'stale' when the aggregator stopped
+        refreshing it), the generation read, the age of the state and the
+        time of the last successful refresh.
+        """
+        self.refresh()
+        ready = self.ready
+        return {'ready': ready,
+                'phase': 'ready' if ready else 'waiting for aggregator' if self.ticked is None else 'stale',
+                'progress': 1.0 if ready else 0.0,
+                'path': self.path,
+                'generation': self.generation,
+                'age': None if self.written is None else time.time() - self.written,
+                'last_tick': self.ticked}
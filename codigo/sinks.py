@@ -0,0 +1,460 @@
+import csv
+import gzip
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class NullSink(object):
+    """
+    Stand-in for MongoBatchWriter and CSVSink that only counts what it
+    receives.  Used to replay and benchmark the stream offline.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.filename = None
+
+    def write(self, document):
+        self.count += 1
+        return True
+
+    def writerow(self, row):
+        self.count += 1
+
+    def writerows(self, rows):
+        self.count += len(rows)
+
+    def flush(self):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+    def stats(self):
+        return {'count': self.count}
+
+
+class MongoBatchWriter(object):
+    """
+    Background writer that buffers documents and inserts them into a
+    MongoDB collection with insert_many(ordered=False).
+
+    A batch is flushed when it reaches batch_size documents or when
+    flush_interval seconds have passed since its first document,
+    whichever happens first.  The internal queue is bounded: when it is
+    full write() blocks up to block_timeout seconds (backpressure) and
+    then drops the document, counting it in stats()['dropped'].
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=1.0, max_queue=10000, block_timeout=5.0):
+        """
+        :param collection: pymongo Collection to insert into
+        :param batch_size: maximum number of documents per insert_many
+        :param flush_interval: maximum seconds a document waits in the buffer
+        :param max_queue: maximum number of documents waiting to be written
+        :param block_timeout: seconds write() waits for room in the queue
+        (None waits forever)
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # counters #
+        self._inserted = 0
+        self._failed = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._flush_time = 0.0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+
+    def start(self):
+        """
+        Starts the writer thread.  Returns self so it can be chained.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='MongoBatchWriter', daemon=True)
+            self._thread.start()
+        return self
+
+    def write(self, document):
+        """
+        Puts a document in the buffer.
+        :param document: dict to insert
+        :return: True if the document was queued, False if it was dropped
+        """
+        if self._stop.is_set():
+            with self._lock:
+                self._dropped += 1
+            return False
+        try:
+            self._queue.put(document, timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+    def close(self, timeout=None):
+        """
+        Stops accepting documents, flushes everything left in the buffer
+        and waits for the writer thread to finish.
+        :param timeout: seconds to wait for the final flush
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            # never started: flush synchronously
+            self._drain()
+
+    def stats(self):
+        """
+        Returns a dict with the writer counters: queue depth, inserted,
+        failed and dropped documents, number of flushes and flush latency
+        in seconds (last, max and mean).
+        """
+        with self._lock:
+            return {'queue_depth': self._queue.qsize(),
+                    'inserted': self._inserted,
+                    'failed': self._failed,
+                    'dropped': self._dropped,
+                    'flushes': self._flushes,
+                    'last_flush_latency': self._last_flush_latency,
+                    'max_flush_latency': self._max_flush_latency,
+                    'mean_flush_latency': self._flush_time / self._flushes if self._flushes else 0.0}
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while not self._stop.is_set():
+            timeout = self.flush_interval if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                document = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                document = None
+
+            if document is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(document)
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+        # shutdown: write what is buffered and what is still queued
+        if batch:
+            self._flush(batch)
+        self._drain()
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        inserted = 0
+        failed = 0
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            # with ordered=False every document without an error was inserted
+            inserted = e.details.get('nInserted', 0)
+            failed = len(batch) - inserted
+            print('Error en insert_many:', len(e.details.get('writeErrors', [])), 'documentos con error')
+        except PyMongoError as e:
+            failed = len(batch)
+            print(e)
+        except Exception as e:
+            # e.g. bson.errors.InvalidDocument: the batch is lost, the thread must keep writing
+            failed = len(batch)
+            print('Error inesperado en insert_many:', repr(e))
+        latency = time.monotonic() - start
+
+        with self._lock:
+            self._inserted += inserted
+            self._failed += failed
+            self._flushes += 1
+            self._flush_time += latency
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+
+
+class CSVSink(object):
+    """
+    Long-lived, buffered CSV output.
+
+    Rows are formatted into an in-memory buffer and written to disk in
+    blocks of buffer_size bytes; a background thread writes whatever is
+    buffered at least every flush_interval seconds if the stream is slow.
+    Writing after close() raises ValueError.  The output file is rotated when it grows
+    past max_bytes or after rotate_interval seconds (by the background
+    thread too, if no row arrives); rotated files can be gzip-compressed in
+    the background, a failed compression is logged, counted in stats() and
+    leaves the csv file in place.  fsync_interval controls how often
+    the data is forced to disk: None never calls fsync, 0 calls it on every
+    block written and any other value is the minimum number of seconds
+    between two fsync calls.
+    """
+
+    def __init__(self, prefix='OutputStreaming', header=None, max_bytes=None, rotate_interval=None, compress=False,
+                 fsync_interval=None, buffer_size=64 * 1024, flush_interval=1.0):
+        """
+        :param prefix: prefix of the files, followed by '_' and the current time
+        :param header: list with the names of the columns, written at the top of every file
+        :param max_bytes: rotate when the file reaches this size (None to disable)
+        :param rotate_interval: rotate every this many seconds (None to disable)
+        :param compress: gzip rotated files
+        :param fsync_interval: fsync schedule, see the class docstring
+        :param buffer_size: bytes buffered in memory before writing to disk
+        :param flush_interval: maximum seconds a row stays in the memory buffer
+        (None only writes full blocks and on flush/close)
+        """
+        self.prefix = prefix
+        self.header = header
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._compressors = []
+        self._compress_errors = 0
+
+        self.filename = None
+        self._file = None
+        self._file_bytes = 0
+        self._file_rows = 0
+        self._opened_at = 0.0
+        self._last_fsync = time.monotonic()
+        self._last_write = time.monotonic()
+
+        # counters #
+        self._start = time.monotonic()
+        self._rows = 0
+        self._bytes = 0
+        self._files = 0
+
+        self._open()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval is not None or rotate_interval is not None:
+            self._flusher = threading.Thread(target=self._run_flusher, name='CSVSink', daemon=True)
+            self._flusher.start()
+
+    def writerow(self, row):
+        """
+        Writes a row to the current file.
+        :param row: list of values
+        """
+        with self._lock:
+            self._check_open()
+            self._writer.writerow(row)
+            self._rows += 1
+            self._file_rows += 1
+            if self._should_write():
+                self._write_buffer()
+            if self._should_rotate():
+                self._rotate()
+
+    def writerows(self, rows):
+        """
+        Writes several rows taking the lock only once.
+        :param rows: list of lists of values
+        """
+        with self._lock:
+            self._check_open()
+            self._writer.writerows(rows)
+            self._rows += len(rows)
+            self._file_rows += len(rows)
+            if self._should_write():
+                self._write_buffer()
+            if self._should_rotate():
+                self._rotate()
+
+    def flush(self):
+        """
+        Writes the buffered rows to disk, calling fsync if it is due.
+        Does nothing once the sink is closed.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._write_buffer()
+
+    def close(self):
+        """
+        Flushes and closes the current file and waits for pending compressions.
+        """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._file is not None:
+                self._write_buffer()
+                self._close_file(force_fsync=self.fsync_interval is not None)
+        for thread in self._compressors:
+            thread.join()
+        self._compressors = []
+
+    def stats(self):
+        """
+        Returns a dict with the current filename, rows and bytes written,
+        bytes per second since the sink was created, number of files and of
+        failed compressions.
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._start
+            return {'filename': self.filename,
+                    'rows': self._rows,
+                    'bytes_written': self._bytes,
+                    'bytes_per_second': self._bytes / elapsed if elapsed > 0 else 0.0,
+                    'buffered_bytes': self._buffer.tell(),
+                    'files': self._files,
+                    'compress_errors': self._compress_errors}
+
+    def _check_open(self):
+        if self._file is None:
+            raise ValueError('el CSVSink está cerrado')
+
+    def _run_flusher(self):
+        # rows that wait in the buffer and files that are due for rotation
+        # because no new row arrived
+        while not self._stop.wait(self._next_check()):
+            try:
+                with self._lock:
+                    if self._file is None:
+                        continue
+                    if self._buffer.tell() and self._should_write():
+                        self._write_buffer()
+                    # a file without rows is not rotated, a quiet stream does not leave empty files
+                    if self._file_rows and self._should_rotate():
+                        self._rotate()
+            except Exception:
+                print('Error en el CSVSink:')
+                traceback.print_exc()
+
+    def _next_check(self):
+        # seconds until the next flush or rotation may be due
+        waits = []
+        if self.flush_interval is not None:
+            waits.append(self.flush_interval)
+        if self.rotate_interval is not None:
+            waits.append(self._opened_at + self.rotate_interval - time.monotonic())
+        return max(min(waits), 0.01)
+
+    def _should_write(self):
+        if self._buffer.tell() >= self.buffer_size:
+            return True
+        return self.flush_interval is not None and time.monotonic() - self._last_write >= self.flush_interval
+
+    def _new_filename(self):
+        filename = self.prefix + '_' + time.strftime('%Y%m%d-%H%M%S') + '.csv'
+        suffix = 1
+        while os.path.exists(filename) or os.path.exists(filename + '.gz'):
+            filename = self.prefix + '_' + time.strftime('%Y%m%d-%H%M%S') + '-' + str(suffix) + '.csv'
+            suffix += 1
+        return filename
+
+    def _open(self):
+        self.filename = self._new_filename()
+        self._file = open(self.filename, 'wb')
+        self._file_bytes = 0
+        self._file_rows = 0
+        self._opened_at = time.monotonic()
+        self._files += 1
+        if self.header is not None:
+            self._writer.writerow(self.header)
+
+    def _write_buffer(self):
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        now = time.monotonic()
+        self._last_write = now
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+            self._bytes += len(data)
+            if self.fsync_interval is not None and now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._file_bytes + self._buffer.tell() >= self.max_bytes:
+            return True
+        if self.rotate_interval is not None and time.monotonic() - self._opened_at >= self.rotate_interval:
+            return True
+        return False
+
+    def _rotate(self):
+        self._write_buffer()
+        self._close_file(force_fsync=self.fsync_interval is not None)
+        if self.compress:
+            thread = threading.Thread(target=self._compress, args=(self.filename,), daemon=True)
+            thread.start()
+            self._compressors = [t for t in self._compressors if t.is_alive()] + [thread]
+        self._open()
+
+    def _close_file(self, force_fsync=False):
+        self._file.flush()
+        if force_fsync:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+        self._file.close()
+        self._file = None
+
+    def _compress(self, filename):
+        try:
+            _gzip_file(filename)
+        except Exception:
+            print('Error al comprimir', filename + ':')
+            traceback.print_exc()
+            with self._lock:
+                self._compress_errors += 1
+
+
+def _gzip_file(filename):
+    """ Compresses filename into filename.gz and removes the original """
+    try:
+        with open(filename, 'rb') as src, gzip.open(filename + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    except BaseException:
+        # the csv file is kept, a partial .gz is not
+        if os.path.exists(filename + '.gz'):
+            os.remove(filename + '.gz')
+        raise
+    os.remove(filename)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules of codigo import each other by name and read their data files
+# (stopwords-es.txt, kw.csv, data/) from the working directory
+CODIGO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODIGO)
+os.chdir(CODIGO)
@@ -0,0 +1,46 @@
+import pandas as pd
+from bson import ObjectId
+
+from tweet_window import TweetWindow
+
+
+class FrameWindow(TweetWindow):
+    """
+    TweetWindow fed with DataFrames instead of mongo: every refresh()
+    appends the next frame of `frames`, an exception in it is raised.
+    """
+
+    def __init__(self, frames, **kwargs):
+        super(FrameWindow, self).__init__('dbTweets', 'tweets_chile', **kwargs)
+        self.frames = list(frames)
+        self.refreshes = 0
+
+    def refresh(self):
+        self.refreshes += 1
+        frame = self.frames.pop(0) if self.frames else tweets([])
+        if isinstance(frame, Exception):
+            raise frame
+        # new rows since last_id, newest first like read_mongo
+        if self.last_id is not None and len(frame.index):
+            frame = frame.loc[frame['_id'] > self.last_id]
+        return self.append(frame.iloc[::-1].reset_index(drop=True))
+
+
+def tweets(rows):
+    """
+    DataFrame of tweets, oldest first, from (dateTweet, tweet, screenName) tuples.
+    """
+    return pd.DataFrame({'_id': [ObjectId() for _ in rows],
+                         'dateTweet': [row[0] for row in rows],
+                         'tweet': [row[1] for row in rows],
+                         'screenName': [row[2] for row in rows]},
+                        columns=['_id', 'dateTweet', 'tweet', 'screenName'])
+
+
+def minute_rows(start, minutes, per_minute, text='marcha en chile', user='anon'):
+    """
+    per_minute tweets in each of `minutes` minutes since start (a string).
+    """
+    start = pd.Timestamp(start)
+    return [(str(start + pd.Timedelta(minutes=m, seconds=s * 60 // per_minute)), text, user)
+            for m in range(minutes) for s in range(per_minute)]
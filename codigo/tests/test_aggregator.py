@@ -0,0 +1,74 @@
+import threading
+import time
+
+from aggregator import Aggregator
+from segment_engine import SegmentConfig
+from segments import SegmentRegistry
+from shared_state import SharedState
+
+from helpers import FrameWindow, minute_rows, tweets
+
+KEYWORDS = ['marcha', 'chile']
+
+
+def configs():
+    return [SegmentConfig('chile', KEYWORDS), SegmentConfig('prensa', KEYWORDS, segment='prensa')]
+
+
+def aggregator(frames, **kwargs):
+    registry = SegmentRegistry(lists={'prensa': ['biobio']})
+    window = FrameWindow(frames, query_fields={'dateTweet': 1, 'tweet': 1, 'screenName': 1}, segments=registry)
+    return Aggregator(configs(), registry=registry, window=window, workers=1, **kwargs)
+
+
+def wait(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_run_survives_errors_and_the_state_goes_stale(tmp_path):
+    path = str(tmp_path / 'state.pkl')
+    frames = [tweets(minute_rows('2019-10-24 12:00', 5, 10))] + [ValueError('broken refresh')] * 1000
+    source = aggregator(frames, state=SharedState(path, configs()))
+    thread = threading.Thread(target=source.run, kwargs={'interval': 0.05, 'poll': 0.02})
+    thread.start()
+    try:
+        reader = SharedState(path, configs(), max_age=0.5)
+        assert wait(lambda: reader.status()['ready'])
+        assert wait(lambda: source.window.refreshes > 3)
+        assert thread.is_alive()
+        assert wait(lambda: not reader.status()['ready'])
+        assert reader.status()['phase'] == 'stale'
+    finally:
+        source.close()
+        thread.join(5)
+
+
+def test_warm_up_retry_counts_the_whole_window(monkeypatch):
+    first = tweets(minute_rows('2019-10-24 12:00', 5, 10))
+    # the retry reads the same window again, mongo does not change in between
+    source = aggregator([first, first])
+
+    import aggregator as module
+    calls = []
+    real = module.SegmentEngine
+
+    def failing_engine(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('after the refresh')
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(module, 'SegmentEngine', failing_engine)
+    assert not source.warm_up()
+    assert source.error is not None
+    assert source.warm_up()
+    try:
+        tpm = source.engine.tpm('chile')['All']['dateTweet']
+        # the first and the newest minutes are not plotted
+        assert tpm.tolist() == [10, 10, 10]
+        assert len(source.window) == 50
+    finally:
+        source.close()
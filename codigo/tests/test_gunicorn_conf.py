@@ -0,0 +1,61 @@
+import importlib.util
+import logging
+import subprocess
+import sys
+import time
+
+import pytest
+
+from dashboard_config import segment_configs
+
+
+def test_segment_configs_without_credentials():
+    # config.py (the Twitter credentials) is not needed to read kw.csv
+    with pytest.raises(ImportError):
+        import config  # noqa: F401
+    configs = segment_configs()
+    assert [config.name for config in configs] == ['prensa', 'chile', 'politicos']
+    assert len(configs[0].keywords) == 50
+
+
+@pytest.fixture
+def conf(monkeypatch):
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', 'gunicorn.conf.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, 'AGGREGATOR_POLL', 0.05)
+    monkeypatch.setattr(module, 'AGGREGATOR_STOP_TIMEOUT', 0.5)
+    return module
+
+
+class Server(object):
+    log = logging.getLogger('test_gunicorn_conf')
+
+
+def fake_aggregator(code):
+    # stands in for aggregator.py, ignores SIGTERM like a stuck aggregator
+    return lambda server: setattr(server, 'aggregator', subprocess.Popen(
+        [sys.executable, '-c', 'import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); ' + code]))
+
+
+def test_dead_aggregator_is_restarted_and_stuck_one_killed(conf, monkeypatch):
+    started = []
+
+    def start(server):
+        # the first one dies, the second one has to be killed
+        started.append(server)
+        fake_aggregator('time.sleep(0.1)' if len(started) == 1 else 'time.sleep(60)')(server)
+
+    monkeypatch.setattr(conf, 'start_aggregator', start)
+    server = Server()
+    conf.on_starting(server)
+    deadline = time.monotonic() + 5
+    while len(started) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(started) == 2
+
+    process = server.aggregator
+    conf.on_exit(server)
+    assert process.returncode is not None
+    time.sleep(0.2)
+    assert len(started) == 2
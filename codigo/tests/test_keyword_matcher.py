@@ -0,0 +1,67 @@
+import random
+
+import numpy as np
+import pytest
+
+import keyword_matcher
+from keyword_matcher import KeywordMatcher
+
+ALPHABET = 'abcñé '
+
+
+def random_keywords(rnd, n):
+    # short keywords over a small alphabet: many overlap, contain or repeat each other
+    return [''.join(rnd.choice(ALPHABET[:-1]) for _ in range(rnd.randint(1, 4))) for _ in range(n)]
+
+
+def random_texts(rnd, n):
+    return [''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 30))) for _ in range(n)]
+
+
+@pytest.fixture(params=['regex', 'ahocorasick'])
+def backend(request, monkeypatch):
+    if request.param == 'regex':
+        monkeypatch.setattr(keyword_matcher, 'ahocorasick', None)
+    elif keyword_matcher.ahocorasick is None:
+        pytest.skip('pyahocorasick is not installed')
+    return request.param
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matcher_matches_substrings(backend, seed):
+    rnd = random.Random(seed)
+    keywords = random_keywords(rnd, 40)
+    texts = random_texts(rnd, 300) + [None, 1.5]
+    matcher = KeywordMatcher(keywords)
+    for text in texts:
+        expected = {j for j, kw in enumerate(keywords) if isinstance(text, str) and kw in text}
+        assert matcher.match(text) == expected, (text, keywords)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matcher_ignore_case(backend, seed):
+    rnd = random.Random(seed)
+    keywords = [kw.upper() if rnd.random() < 0.5 else kw for kw in random_keywords(rnd, 30)]
+    texts = [text.upper() if rnd.random() < 0.5 else text for text in random_texts(rnd, 200)]
+    matcher = KeywordMatcher(keywords, ignore_case=True)
+    for text in texts:
+        assert matcher.match(text) == {j for j, kw in enumerate(keywords) if kw.lower() in text.lower()}
+
+
+def test_incidence(backend):
+    rnd = random.Random(7)
+    keywords = random_keywords(rnd, 20)
+    texts = random_texts(rnd, 200)
+    incidence = KeywordMatcher(keywords).incidence(texts)
+
+    expected = np.array([[kw in text for kw in keywords] for text in texts])
+    assert incidence.shape == expected.shape
+    assert incidence.counts().tolist() == expected.sum(axis=0).tolist()
+    for j, kw in enumerate(keywords):
+        assert incidence.mask(kw).tolist() == expected[:, j].tolist()
+        assert incidence.rows(j).tolist() == np.flatnonzero(expected[:, j]).tolist()
+
+    positions = np.flatnonzero(np.arange(len(texts)) % 3 == 0)
+    subset = incidence.take(positions)
+    assert subset.counts().tolist() == expected[positions].sum(axis=0).tolist()
+    assert incidence.take(np.arange(len(texts)) % 3 == 0).counts().tolist() == subset.counts().tolist()
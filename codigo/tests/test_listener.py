@@ -0,0 +1,49 @@
+import json
+
+from twitterGeoLoc import CustomStreamListener
+
+
+class Pipeline(object):
+    def __init__(self):
+        self.tweets = []
+
+    def submit(self, data):
+        self.tweets.append(data)
+
+
+def test_lone_surrogate_payload():
+    pipeline = Pipeline()
+    listener = CustomStreamListener(pipeline=pipeline)
+    # orjson rejects it, the stdlib decoder accepts it
+    listener.on_data('{"in_reply_to_status_id": null, "text": "hola \\ud83d"}')
+    assert pipeline.tweets == [{'in_reply_to_status_id': None, 'text': 'hola \ud83d'}]
+
+
+def test_invalid_payload_does_not_stop_the_stream():
+    listener = CustomStreamListener(pipeline=Pipeline())
+    assert listener.on_data('{"in_reply_to_status_id": ') is True
+    assert listener.notice_count['invalid'] == 1
+
+
+class DroppingWriter(object):
+    def write(self, document):
+        return False
+
+
+class Rollups(object):
+    def __init__(self):
+        self.documents = []
+
+    def add(self, documents):
+        self.documents.extend(documents)
+
+
+def test_dropped_tweet_is_not_counted_in_the_rollups():
+    rollups = Rollups()
+    listener = CustomStreamListener(writer=DroppingWriter(), rollups=rollups)
+    listener.on_data(json.dumps({'in_reply_to_status_id': None, 'created_at': 'Thu Oct 24 14:39:39 +0000 2019',
+                                 'text': 'Marcha en Santiago',
+                                 'user': {'screen_name': 'biobio', 'name': 'BioBio', 'url': None, 'description': '',
+                                          'location': 'Chile', 'verified': True, 'geo_enabled': False}}))
+    assert listener.notice_count['invalid'] == 0
+    assert rollups.documents == []
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import mongomock
+
+from mongo_tpm import MongoTPM
+from rollups import RollupTPM
+
+
+class RacingCollection(object):
+    """
+    Collection where a document is inserted right after the first find()
+    is read, like a tweet stored between the two queries of an update.
+    """
+
+    def __init__(self, collection, document):
+        self.collection = collection
+        self.document = document
+
+    def find(self, *args, **kwargs):
+        return RacingCursor(self.collection.find(*args, **kwargs), self)
+
+    def insert(self):
+        if self.document is not None:
+            self.collection.insert_one(self.document)
+            self.document = None
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RacingCursor(object):
+    def __init__(self, cursor, collection):
+        self.cursor = cursor
+        self.collection = collection
+
+    def sort(self, *args):
+        return RacingCursor(self.cursor.sort(*args), self.collection)
+
+    def limit(self, n):
+        return RacingCursor(self.cursor.limit(n), self.collection)
+
+    def __iter__(self):
+        documents = list(self.cursor)
+        self.collection.insert()
+        return iter(documents)
+
+
+def test_mongo_tpm_insert_between_queries():
+    collection = mongomock.MongoClient().dbTweets.tweets_chile
+    start = datetime(2019, 10, 24, 14, 0)
+    tpm = MongoTPM('dbTweets', RacingCollection(collection, {'dateTweet': start, 'tweet': 'marcha'}), ['marcha'])
+    assert not tpm.update()
+    assert tpm.first is None
+
+    collection.insert_many([{'dateTweet': start + timedelta(minutes=m), 'tweet': 'marcha'} for m in range(1, 4)])
+    assert tpm.update()
+    assert tpm.first == tpm.minutes[0] - 1
+    assert tpm.table()[1].tolist() == [[1, 1], [1, 1]]
+
+
+def test_rollup_tpm_insert_between_queries():
+    collection = mongomock.MongoClient().dbTweets.rollups
+    start = datetime(2019, 10, 24, 14, 0)
+    tpm = RollupTPM('dbTweets', ['marcha'], collection=RacingCollection(collection, {
+        'segment': 'All', 'minute': start, 'tweets': 2, 'keywords': {'marcha': 1}}))
+    assert not tpm.update()
+    assert tpm.first is None
+
+    collection.insert_many([{'segment': 'All', 'minute': start + timedelta(minutes=m), 'tweets': 2,
+                             'keywords': {'marcha': 1}} for m in range(1, 4)])
+    assert tpm.update()
+    assert tpm.table()[1].tolist() == [[1, 1], [2, 2]]
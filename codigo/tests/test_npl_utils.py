@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from benchmarks import TOKENIZER_TEXTS, sample_texts
+from npl_utils import process, process_batch
+
+# characters that process and process_batch handle in different steps:
+# accents, ligatures, compatibility forms, combining marks, digits, urls, handles, tags
+PIECES = ['Piñera', 'ÉPOCA', 'İstanbul', 'ß', 'ﬁn', '²', 'ﾊﾝｶｸ', '한국어', 'x́y', 'a1b', '2019', '🇨🇱',
+          'https://t.co/4RCHTQqInj', '@Juan_123', '#PiñeraRenuncia', 'RT', '¡Hola!!', '“ok”', '—', 'café', 'naïve',
+          '\t', '\n', '', 'de', 'la', 'Marcha', 'alameda']
+
+
+def bags(wordbags):
+    return [sorted(bag) for bag in wordbags]
+
+
+def random_texts(n, seed=0):
+    rnd = random.Random(seed)
+    return [' '.join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 15))) +
+            rnd.choice(['', '!', '.', ' ']) for _ in range(n)]
+
+
+@pytest.mark.parametrize('documents', [TOKENIZER_TEXTS, sample_texts(500, TOKENIZER_TEXTS), random_texts(2000)],
+                         ids=['tricky', 'sample', 'random'])
+def test_process_batch_matches_process(documents):
+    expected = [sorted(process(document)) for document in documents]
+    assert bags(process_batch(documents)) == expected
+
+
+def test_process_batch_in_processes():
+    documents = TOKENIZER_TEXTS + random_texts(400)
+    expected = bags(process_batch(documents))
+    assert bags(process_batch(documents, n_jobs=2, chunksize=100)) == expected
+
+
+def test_process_batch_missing_values():
+    assert process_batch([None, float('nan'), 'Marcha']) == [[], [], process('Marcha')]
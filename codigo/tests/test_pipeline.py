@@ -0,0 +1,56 @@
+from pipeline import TweetPipeline
+from sinks import CSVSink, NullSink
+
+
+def process(raw, csv=False):
+    return dict(raw), [raw['i']] if csv else None
+
+
+def test_persist_errors_do_not_stop_the_workers(tmp_path):
+    csv_sink = CSVSink(prefix=str(tmp_path / 'out'))
+    csv_sink.close()  # writerows raises ValueError from now on
+    writer = NullSink()
+    pipeline = TweetPipeline(writer=writer, csv_sink=csv_sink, workers=1, batch_size=10, process=process).start()
+    for i in range(50):
+        assert pipeline.submit({'i': i})
+    pipeline.close(timeout=5)
+
+    stats = pipeline.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['persist']['items'] == 50
+    assert stats['persist']['errors'] == 50
+    # the csv failed, the other outputs still got every document
+    assert writer.count == 50
+
+
+class DroppingWriter(object):
+    """ Writer whose queue is full for the odd documents """
+
+    def __init__(self):
+        self.documents = []
+
+    def write(self, document):
+        if document['i'] % 2:
+            return False
+        self.documents.append(document)
+        return True
+
+
+class Rollups(object):
+    def __init__(self):
+        self.documents = []
+
+    def add(self, documents):
+        self.documents.extend(documents)
+
+
+def test_rollups_count_only_what_the_writer_accepted():
+    writer = DroppingWriter()
+    rollups = Rollups()
+    pipeline = TweetPipeline(writer=writer, workers=2, batch_size=7, process=process, rollups=rollups).start()
+    for i in range(50):
+        assert pipeline.submit({'i': i})
+    pipeline.close(timeout=5)
+
+    assert len(writer.documents) == 25
+    assert sorted(document['i'] for document in rollups.documents) == list(range(0, 50, 2))
@@ -0,0 +1,63 @@
+import json
+
+import replay
+import twitterGeoLoc
+from replay import ReplaySource
+from twitterGeoLoc import CustomStreamListener
+from utils import parse_payload
+
+
+class Pipeline(object):
+    def __init__(self):
+        self.tweets = []
+
+    def submit(self, data):
+        self.tweets.append(data)
+
+
+def tweet(text, timestamp_ms):
+    return json.dumps({'in_reply_to_status_id': None, 'text': text, 'timestamp_ms': str(timestamp_ms)})
+
+
+PAYLOADS = [tweet('hola', 1571928000000),
+            # orjson rejects the lone surrogate, the stdlib decoder accepts it
+            '{"in_reply_to_status_id": null, "text": "hola \\ud83d", "timestamp_ms": "1571928000010"}',
+            '{"in_reply_to_status_id": ',
+            json.dumps({'limit': {'track': 3}}),
+            tweet('chao', 1571928000020)]
+
+
+def test_timed_replay_parses_each_payload_once(tmp_path, monkeypatch):
+    path = tmp_path / 'payloads.json'
+    path.write_text('\n'.join(PAYLOADS) + '\n', encoding='utf-8')
+
+    calls = []
+
+    def counting_parse(payload):
+        calls.append(payload)
+        return parse_payload(payload)
+
+    monkeypatch.setattr(replay, 'parse_payload', counting_parse)
+    monkeypatch.setattr(twitterGeoLoc, 'parse_payload', counting_parse)
+
+    pipeline = Pipeline()
+    listener = CustomStreamListener(pipeline=pipeline)
+    n, _ = ReplaySource([str(path)], speed=100).run(listener)
+
+    assert n == len(PAYLOADS)
+    assert [data['text'] for data in pipeline.tweets] == ['hola', 'hola \ud83d', 'chao']
+    assert listener.notice_count['invalid'] == 1
+    assert listener.notice_count['limit'] == 1
+    # the invalid payload is tried again by on_data, which counts it (lines are read stripped)
+    lines = [payload.strip() for payload in PAYLOADS]
+    assert sorted(calls) == sorted(lines + [lines[2]])
+
+
+def test_replay_as_fast_as_possible(tmp_path):
+    path = tmp_path / 'payloads.json'
+    path.write_text('\n'.join(PAYLOADS), encoding='utf-8')
+    pipeline = Pipeline()
+    listener = CustomStreamListener(pipeline=pipeline)
+    n, _ = ReplaySource([str(path)]).run(listener)
+    assert n == len(PAYLOADS)
+    assert len(pipeline.tweets) == 3
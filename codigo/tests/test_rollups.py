@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+from bson import ObjectId
+
+from rollups import RollupWriter, ingestion_active
+from utils import normalize_tweet
+
+TWEET = {'created_at': 'Thu Oct 24 14:39:39 +0000 2019',
+         'text': 'Marcha en # Santiago #Chile',
+         'user': {'screen_name': 'biobio', 'name': 'BioBio', 'url': None, 'description': '', 'location': 'Chile',
+                  'verified': True, 'geo_enabled': False}}
+
+
+def test_lone_hash_is_not_a_hash_tag():
+    document = normalize_tweet(TWEET)
+    writer = RollupWriter(None, ['Marcha'])
+    writer.add([document])
+
+    (query, update), = writer.drain()
+    assert query == {'segment': 'All', 'minute': document['dateTweet'].replace(second=0)}
+    assert isinstance(query['minute'], datetime)
+    # no empty field name: mongo would reject the whole $inc of the minute
+    assert update == {'$inc': {'tweets': 1, 'keywords.Marcha': 1, 'hash_tags.Chile': 1}}
+
+
+def test_ingestion_active():
+    tweets = mongomock.MongoClient().dbTweets.tweets_chile
+    assert not ingestion_active(tweets)
+    tweets.insert_one({'_id': ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(minutes=10))})
+    assert not ingestion_active(tweets)
+    tweets.insert_one({'tweet': 'nuevo'})
+    assert ingestion_active(tweets)
@@ -0,0 +1,141 @@
+import os
+from datetime import datetime, timedelta
+
+import mongomock
+import pymongo
+import pytest
+from pymongo.errors import PyMongoError
+
+from mongo_tpm import MongoTPM
+from rollups import RollupTPM, ensure_rollup_indexes
+from schema import _stages, check_query_plans, ensure_indexes
+
+# the query plans need a real mongod, mongomock does not explain
+MONGO_HOST = os.environ.get('MONGO_HOST', 'localhost')
+
+
+def index_keys(collection):
+    return {name: list(info['key']) for name, info in collection.index_information().items()}
+
+
+def test_tweet_indexes():
+    collection = mongomock.MongoClient().dbTweets.tweets_chile
+    ensure_indexes(collection)
+    ensure_indexes(collection)  # again: nothing changes
+    assert index_keys(collection) == {'_id_': [('_id', 1)],
+                                      'dateTweet': [('dateTweet', 1)],
+                                      'screenName_dateTweet': [('screenName', 1), ('dateTweet', 1)],
+                                      'hash_tags': [('hash_tags', 1)]}
+
+
+def test_rollup_indexes():
+    collection = mongomock.MongoClient().dbTweets.tweets_rollup
+    ensure_rollup_indexes(collection)
+    assert index_keys(collection)['segment_minute'] == [('segment', 1), ('minute', 1)]
+    assert collection.index_information()['segment_minute']['unique']
+
+
+class QueryRecorder(object):
+    """
+    pymongo collection that keeps the cursors and pipelines of the queries
+    run on it, to explain them afterwards.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.cursors = []
+        self.pipelines = []
+
+    def find(self, *args, **kwargs):
+        cursor = self.collection.find(*args, **kwargs)
+        self.cursors.append(cursor)
+        return cursor
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return self.collection.aggregate(pipeline, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def scanned_indexes(self):
+        """
+        Indexes scanned by the winning plan of every query recorded, an
+        empty set for a collection scan.
+        """
+        explained = [cursor.clone().explain() for cursor in self.cursors]
+        explained += [self.collection.database.command('aggregate', self.collection.name, pipeline=pipeline,
+                                                       explain=True) for pipeline in self.pipelines]
+        return [winning_indexes(explain) for explain in explained]
+
+
+def winning_indexes(explain):
+    # the winning plan is nested differently by each server version and for
+    # find and aggregate, the rejected plans are not looked at
+    names = set()
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == 'winningPlan':
+                names.update(stage.get('indexName') for stage in _stages(value) if stage['stage'] == 'IXSCAN')
+            elif key != 'rejectedPlans':
+                names.update(winning_indexes(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            names.update(winning_indexes(value))
+    return names
+
+
+@pytest.fixture(scope='module')
+def mongo_db():
+    client = pymongo.MongoClient(MONGO_HOST, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip('no mongod on ' + MONGO_HOST)
+    db = client['dbTestsSchema']
+    client.drop_database(db.name)
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+
+@pytest.fixture(scope='module')
+def tweets(mongo_db):
+    collection = mongo_db.tweets_chile
+    ensure_indexes(collection)
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+    collection.insert_many([{'dateTweet': start + timedelta(seconds=10 * i), 'tweet': 'marcha en chile #Chile',
+                             'screenName': 'biobio' if i % 10 == 0 else 'user%d' % (i % 50),
+                             'hash_tags': ['Chile']} for i in range(30 * 6)])
+    return collection
+
+
+def test_query_helpers_use_indexes(tweets):
+    for name, (ok, scans) in check_query_plans(tweets).items():
+        assert ok, (name, scans)
+
+
+@pytest.mark.parametrize('users, indexes', [(None, {'dateTweet'}),
+                                            (['biobio'], {'dateTweet', 'screenName_dateTweet'})],
+                         ids=['all', 'users'])
+def test_mongo_tpm_uses_indexes(tweets, users, indexes):
+    recorder = QueryRecorder(tweets)
+    tpm = MongoTPM('dbTestsSchema', recorder, ['marcha'], users=users)
+    assert tpm.update()
+    assert len(recorder.cursors) == 2 and len(recorder.pipelines) == 1
+    for scans in recorder.scanned_indexes():
+        assert scans and scans <= indexes, scans
+
+
+def test_rollup_tpm_uses_indexes(mongo_db):
+    collection = mongo_db.tweets_rollup
+    ensure_rollup_indexes(collection)
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+    collection.insert_many([{'segment': segment, 'minute': start + timedelta(minutes=m), 'tweets': 6,
+                             'keywords': {'marcha': 6}} for segment in ('All', 'prensa') for m in range(30)])
+    recorder = QueryRecorder(collection)
+    tpm = RollupTPM('dbTestsSchema', ['marcha'], segment='prensa', collection=recorder)
+    assert tpm.update()
+    assert len(recorder.cursors) == 2
+    for scans in recorder.scanned_indexes():
+        assert scans == {'segment_minute'}, scans
@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+import pytest
+
+from segments import SegmentRegistry
+
+USERS = ['biobio', 'cnnchile', 'latercera', 'sebastianpinera', 'mbachelet', 'anon', 'user1', 'user2']
+LISTS = {'prensa': ['biobio', 'cnnchile', 'latercera'],
+         'politicos': ['sebastianpinera', 'mbachelet'],
+         'biobio': ['biobio'],  # inside prensa
+         'nadie': []}
+
+
+def test_encode():
+    registry = SegmentRegistry(lists=LISTS)
+    codes = registry.encode(['biobio', 'mbachelet', 'anon', 'cnnchile'])
+    assert codes.dtype == registry.dtype
+    assert [registry.segments_of(code) for code in codes] == [('prensa', 'biobio'), ('politicos',), (),
+                                                              ('prensa',)]
+
+
+@pytest.mark.parametrize('n', [0, 1, 5, 500])
+def test_split_matches_masks(n):
+    rnd = random.Random(n)
+    registry = SegmentRegistry(lists=LISTS)
+    codes = registry.encode([rnd.choice(USERS) for _ in range(n)])
+    positions = registry.split(codes)
+    assert list(positions) == registry.names
+    for name in registry.names:
+        assert positions[name].dtype == np.int64
+        assert positions[name].tolist() == np.flatnonzero(registry.mask(codes, name)).tolist()
+
+
+def test_split_without_segments():
+    registry = SegmentRegistry(lists={'prensa': ['biobio']})
+    codes = registry.encode(['anon', 'user1'])
+    assert registry.split(codes)['prensa'].tolist() == []
+    assert registry.split(codes[:0])['prensa'].tolist() == []
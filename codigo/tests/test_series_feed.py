@@ -0,0 +1,128 @@
+import copy
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from dash import Patch, no_update
+
+from series_feed import SeriesFeed
+from utils_app import create_graph
+
+KEYS = ['marcha', 'paro', 'All']
+START = pd.Timestamp('2019-10-24 14:00', tz='UTC').value // (60 * 10 ** 9)
+
+
+def build(tpm):
+    # create_graph as a plain dict, the figure the browser keeps
+    return create_graph(tpm, KEYS[:-1]).to_dict()
+
+
+def normalize(figure):
+    return [([pd.Timestamp(x) for x in trace['x']], [int(y) for y in trace['y']]) for trace in figure['data']]
+
+
+def apply_patch(figure, patch):
+    """
+    Applies the operations of a dash Patch to a copy of a figure, the way
+    the browser does.
+    """
+    figure = copy.deepcopy(figure)
+    for operation in patch.to_plotly_json()['operations']:
+        *path, last = operation['location']
+        target = figure
+        for key in path:
+            target = target[key]
+        if operation['operation'] == 'Assign':
+            target[last] = operation['params']['value']
+        elif operation['operation'] == 'Extend':
+            target[last] = list(target[last]) + list(operation['params']['value'])
+        elif operation['operation'] == 'Delete':
+            del target[last]
+        else:
+            raise AssertionError('unexpected operation %s' % operation)
+    return figure
+
+
+class Client(object):
+    """ A browser: the figure it shows and its state in the dcc.Store """
+
+    def __init__(self):
+        self.figure = None
+        self.state = None
+        self.patches = 0
+
+    def update(self, feed):
+        figure, self.state = feed.update(self.state)
+        if isinstance(figure, Patch):
+            self.figure = apply_patch(self.figure, figure)
+            self.patches += 1
+        elif figure is not no_update:
+            self.figure = copy.deepcopy(figure)
+
+
+def random_series(rnd, steps, length):
+    """
+    Plotted series after every refresh: the window moves forward a few
+    minutes (sometimes many), late tweets change points already plotted.
+    """
+    counts = {}
+    end = START
+    series = []
+    for _ in range(steps):
+        end += rnd.choice([0, 0, 1, 1, 2, 3]) if rnd.random() > 0.03 else rnd.randint(length, 3 * length)
+        minutes = np.arange(max(START, end - length + 1), end + 1)
+        for minute in minutes:
+            if minute not in counts or (rnd.random() < 0.1 and minute >= end - 3):
+                counts[minute] = counts.get(minute, np.zeros(len(KEYS), dtype=np.int64)) + rnd.randint(1, 5)
+        series.append((minutes, np.column_stack([counts[minute] for minute in minutes])))
+    return series
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_patched_figures_match_full_figure(seed):
+    rnd = random.Random(seed)
+    feed = SeriesFeed(KEYS, build)
+    clients = [Client() for _ in range(6)]
+    for minutes, values in random_series(rnd, 150, 30):
+        feed.set(minutes, values)
+        expected = normalize(feed.figure())
+        for i, client in enumerate(clients):
+            # client 0 refreshes every tick, the others skip revisions
+            if i == 0 or rnd.random() < 1.0 / (i + 1):
+                client.update(feed)
+                assert client.state == feed.state()
+                assert normalize(client.figure) == expected
+    assert all(client.patches for client in clients)
+
+
+def test_client_of_another_epoch_gets_full_figure():
+    feed = SeriesFeed(KEYS, build)
+    minutes = np.arange(START, START + 20)
+    feed.set(minutes, np.ones((len(KEYS), 20), dtype=np.int64))
+    client = Client()
+    client.update(feed)
+
+    restarted = SeriesFeed(KEYS, build)
+    restarted.set(minutes + 1, np.ones((len(KEYS), 20), dtype=np.int64))
+    figure, state = restarted.update(client.state)
+    assert not isinstance(figure, Patch) and state == restarted.state()
+
+    # restore() keeps the epoch and the revision: the states stay valid
+    feed.set(minutes + 1, np.ones((len(KEYS), 20), dtype=np.int64))
+    restarted.restore(feed.dump())
+    figure, _ = restarted.update(client.state)
+    assert isinstance(figure, Patch)
+    assert normalize(apply_patch(client.figure, figure)) == normalize(feed.figure())
+
+
+def test_unchanged_client_gets_no_update():
+    feed = SeriesFeed(KEYS, build)
+    feed.set(np.arange(START, START + 5), np.ones((len(KEYS), 5), dtype=np.int64))
+    client = Client()
+    client.update(feed)
+    assert feed.update(client.state) == (no_update, client.state)
+    assert not feed.set(np.arange(START, START + 5), np.ones((len(KEYS), 5), dtype=np.int64))
+    # a newer revision served by another process is not undone
+    newer = dict(client.state, revision=client.state['revision'] + 1)
+    assert feed.update(newer) == (no_update, newer)
@@ -0,0 +1,97 @@
+import os
+import time
+
+import pytest
+
+import sinks
+from sinks import CSVSink, MongoBatchWriter
+
+
+class FailingCollection(object):
+    def insert_many(self, documents, ordered=True):
+        raise ValueError('cannot encode object')
+
+
+def test_writer_survives_unexpected_errors():
+    writer = MongoBatchWriter(FailingCollection(), batch_size=2, flush_interval=0.05, block_timeout=1.0).start()
+    assert writer.write({'i': 0})
+    deadline = time.monotonic() + 5
+    while writer.stats()['failed'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer._thread.is_alive()
+
+    for i in range(1, 4):
+        assert writer.write({'i': i})
+    writer.close(timeout=5)
+
+    stats = writer.stats()
+    assert stats['failed'] == 4
+    assert stats['dropped'] == 0
+
+
+def test_csv_rows_are_flushed_on_a_quiet_stream(tmp_path):
+    sink = CSVSink(prefix=str(tmp_path / 'out'), header=['a', 'b'], flush_interval=0.05)
+    try:
+        sink.writerow([1, 2])
+        deadline = time.monotonic() + 5
+        while sink.stats()['buffered_bytes'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with open(sink.filename) as file:
+            assert file.read().splitlines() == ['a,b', '1,2']
+    finally:
+        sink.close()
+
+
+def test_csv_write_after_close(tmp_path):
+    sink = CSVSink(prefix=str(tmp_path / 'out'))
+    sink.close()
+    sink.flush()
+    with pytest.raises(ValueError):
+        sink.writerow([1, 2])
+    with pytest.raises(ValueError):
+        sink.writerows([[1, 2]])
+
+
+def test_csv_without_flush_interval(tmp_path):
+    sink = CSVSink(prefix=str(tmp_path / 'out'), flush_interval=None)
+    sink.writerow([1, 2])
+    sink.writerows([[3, 4]])
+    assert sink.stats()['buffered_bytes'] > 0
+    sink.close()
+    with open(sink.filename) as file:
+        assert file.read().splitlines() == ['1,2', '3,4']
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_csv_quiet_stream_is_rotated(tmp_path):
+    sink = CSVSink(prefix=str(tmp_path / 'out'), rotate_interval=0.1, flush_interval=None)
+    try:
+        first = sink.filename
+        sink.writerow([1, 2])
+        assert wait_for(lambda: sink.stats()['files'] == 2)
+        with open(first) as file:
+            assert file.read().splitlines() == ['1,2']
+        # nothing was written to the new file: it is not rotated again
+        time.sleep(0.3)
+        assert sink.stats()['files'] == 2
+    finally:
+        sink.close()
+
+
+def test_csv_compression_errors_are_reported(tmp_path, monkeypatch):
+    def broken_gzip(filename):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(sinks, '_gzip_file', broken_gzip)
+    sink = CSVSink(prefix=str(tmp_path / 'out'), max_bytes=1, compress=True)
+    first = sink.filename
+    sink.writerow([1, 2])
+    sink.close()
+    assert sink.stats()['compress_errors'] == 1
+    assert os.path.exists(first)
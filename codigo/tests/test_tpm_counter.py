@@ -0,0 +1,124 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from keyword_matcher import KeywordMatcher
+from tpm_counter import MinuteCounter, minute_numbers
+
+KEYWORDS = ['marcha', 'paro', 'metro', 'chile']
+TEXTS = ['marcha en chile', 'paro nacional', 'metro cerrado', 'cacerolazo', 'marcha y paro en el metro', 'hola']
+START = pd.Timestamp('2019-10-24 14:00')
+
+
+def frame(rows):
+    return pd.DataFrame({'dateTweet': [time for time, _ in rows], 'tweet': [text for _, text in rows]},
+                        columns=['dateTweet', 'tweet'])
+
+
+class NaiveCounter(object):
+    """
+    Tweets-per-minute recounted from every accepted tweet: a batch is
+    accepted down to max(watermark - max_length + 1, previous watermark -
+    lateness) and the plotted minutes go from the first minute (excluded)
+    to the watermark (excluded), at most max_length - 1 of them.
+    """
+
+    def __init__(self, max_length, lateness):
+        self.max_length = max_length
+        self.lateness = lateness
+        self.tweets = []  # (minute, text)
+        self.first = None
+        self.watermark = None
+        self.late = 0
+
+    def add(self, rows):
+        if not rows:
+            return
+        minutes = [int(pd.Timestamp(time, tz='UTC').value // (60 * 10 ** 9)) for time, _ in rows]
+        previous = self.watermark
+        if previous is None:
+            self.first = min(minutes)
+            self.watermark = max(minutes)
+        else:
+            self.watermark = max(self.watermark, max(minutes))
+        oldest = self.watermark - self.max_length + 1
+        if previous is not None:
+            oldest = max(oldest, previous - self.lateness)
+        for minute, (_, text) in zip(minutes, rows):
+            if minute >= oldest:
+                self.tweets.append((minute, text))
+            else:
+                self.late += 1
+
+    def table(self):
+        if self.watermark is None:
+            return np.arange(0), np.zeros((len(KEYWORDS) + 1, 0), dtype=np.int64)
+        minutes = np.arange(max(self.first + 1, self.watermark - self.max_length + 1), self.watermark)
+        counts = np.zeros((len(KEYWORDS) + 1, len(minutes)), dtype=np.int64)
+        for minute, text in self.tweets:
+            j = minute - minutes[0] if len(minutes) else -1
+            if 0 <= j < len(minutes):
+                counts[-1, j] += 1
+                for i, kw in enumerate(KEYWORDS):
+                    counts[i, j] += kw in text
+        return minutes, counts
+
+
+def random_batches(rnd, n_batches, late, gaps):
+    clock = START
+    batches = []
+    for _ in range(n_batches):
+        batch = []
+        for _ in range(rnd.randint(0, 15)):
+            clock += pd.Timedelta(seconds=rnd.randint(0, 15))
+            if gaps and rnd.random() < 0.02:
+                clock += pd.Timedelta(minutes=rnd.randint(5, 40))  # quiet stream, the ring is cleared
+            time = clock
+            if late and rnd.random() < 0.2:
+                time = clock - pd.Timedelta(minutes=rnd.randint(0, 6))
+            batch.append((str(time), rnd.choice(TEXTS)))
+        batches.append(batch)
+    return batches
+
+
+@pytest.mark.parametrize('max_length, lateness', [(10, 2), (3, 0), (30, 5)])
+@pytest.mark.parametrize('late', [False, True], ids=['in-order', 'late'])
+@pytest.mark.parametrize('gaps', [False, True], ids=['steady', 'gaps'])
+@pytest.mark.parametrize('hits', ['matcher', 'incidence', 'dict'])
+def test_minute_counter_matches_recount(max_length, lateness, late, gaps, hits):
+    rnd = random.Random(hash((max_length, lateness, late, gaps)) & 0xffff)
+    counter = MinuteCounter(KEYWORDS, max_length=max_length, lateness=lateness)
+    naive = NaiveCounter(max_length, lateness)
+    matcher = KeywordMatcher(KEYWORDS)
+    for generation, rows in enumerate(random_batches(rnd, 80, late, gaps)):
+        df = frame(rows)
+        if hits == 'incidence':
+            found = matcher.incidence(df['tweet'])
+        elif hits == 'dict':
+            found = {kw: np.array([kw in text for text in df['tweet']], dtype=bool) for kw in KEYWORDS}
+        else:
+            found = None
+        counter.add(df, hits=found, generation=generation)
+        naive.add(rows)
+        # the same generation again is not counted twice
+        assert not counter.add(df, hits=found, generation=generation)
+
+        minutes, counts = counter.table()
+        expected_minutes, expected_counts = naive.table()
+        assert minutes.tolist() == expected_minutes.tolist()
+        assert counts.tolist() == expected_counts.tolist()
+        assert counter.late == naive.late
+
+
+def test_minute_numbers_and_tpm():
+    rows = [(str(START + pd.Timedelta(seconds=20 * i)), 'marcha') for i in range(10)]
+    counter = MinuteCounter(['marcha'], max_length=5)
+    assert counter.add(frame(rows))
+    assert minute_numbers(pd.Series([str(START)]))[0] == START.value // (60 * 10 ** 9)
+    # minute 0 is partial (the first one) and minute 3 is the watermark: only 1 and 2 are plotted
+    tpm = counter.tpm()
+    assert tpm['All']['dateTweet'].tolist() == [3, 3]
+    assert tpm['marcha'].index[0] == pd.Timestamp(START + pd.Timedelta(minutes=1), tz='UTC')
+    assert counter.datetime == pd.Timestamp(START + pd.Timedelta(minutes=2), tz='UTC')
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from utils import _arrow_values, cursor_columns
+
+
+def test_arrow_values_object_ids_after_missing_values():
+    ids = [ObjectId(), ObjectId()]
+    column = np.array([None, ids[0], None, ids[1]], dtype=object)
+    assert list(_arrow_values(column)) == [None, str(ids[0]), None, str(ids[1])]
+
+
+def test_arrow_values_other_columns_are_kept():
+    column = np.array([None, 'a', 'b'], dtype=object)
+    assert _arrow_values(column) is column
+    column = np.array([None, None], dtype=object)
+    assert _arrow_values(column) is column
+
+
+def test_cursor_columns_arrow_object_ids_after_missing_values():
+    pyarrow = pytest.importorskip('pyarrow')
+    ids = [ObjectId(), ObjectId()]
+    table = cursor_columns([{'a': 1}, {'a': 2, 'ref': ids[0]}, {'a': 3, 'ref': ids[1]}], batch_size=1, arrow=True)
+    assert isinstance(table, pyarrow.Table)
+    assert table.column('ref').to_pylist() == [None, str(ids[0]), str(ids[1])]
+
+
+def test_cursor_columns_list_values():
+    # lists of the same length in a batch are values, not a second dimension
+    df = cursor_columns([{'hash_tags': ['Chile', 'Marcha']}, {'hash_tags': ['Paro', 'Metro']}])
+    assert df['hash_tags'].tolist() == [['Chile', 'Marcha'], ['Paro', 'Metro']]
+
+
+def documents():
+    # fields missing in whole batches, missing values and mixed types
+    start = datetime(2019, 10, 24, 14)
+    docs = []
+    for i in range(23):
+        doc = {'_id': ObjectId(), 'dateTweet': start + timedelta(seconds=i), 'tweet': 'marcha %d' % i}
+        if i % 4:
+            doc['retweets'] = i
+        if i >= 10:
+            doc['hash_tags'] = ['Chile'] * (i % 3)
+        if i % 7 == 0:
+            doc['place'] = None if i % 2 else 'Santiago'
+        if i == 20:
+            doc['tweet'] = 1.5
+        docs.append(doc)
+    return docs
+
+
+@pytest.mark.parametrize('batch_size', [1, 4, 10, 100])
+def test_cursor_columns_matches_dataframe(batch_size):
+    docs = documents()
+    df = cursor_columns(iter(docs), batch_size=batch_size)
+    expected = pd.DataFrame(docs)
+    assert list(df.columns) == list(expected.columns)
+    assert len(df.index) == len(docs)
+    for key in expected.columns:
+        assert df[key].isna().tolist() == expected[key].isna().tolist(), key
+        assert df[key].dropna().tolist() == expected[key].dropna().tolist(), key
+    assert df['retweets'].dtype == np.float64
+    assert df['dateTweet'].dtype.kind == 'M'
+
+
+def test_cursor_columns_typed_columns():
+    df = cursor_columns([{'a': 1, 'b': True, 'c': 'x'}, {'a': 2, 'b': False, 'c': 'y'}], batch_size=1)
+    assert df['a'].dtype == np.int64 and df['b'].dtype == bool and df['c'].tolist() == ['x', 'y']
+    assert cursor_columns([]).empty
@@ -0,0 +1,122 @@
+import random
+from collections import Counter, deque
+
+import pandas as pd
+import pytest
+
+from word_counter import RankedCounts, WindowCounter, retweet_key
+
+WORDS = ['marcha', 'chile', 'piñera', 'alameda', 'paro', 'metro', 'santiago', 'cacerolazo', 'plaza', 'dignidad',
+         'carabineros', 'estudiantes', 'evade', 'toque', 'queda', 'ley', 'constitucion', 'afp', 'salud', 'agua']
+START = pd.Timestamp('2019-10-24 14:00', tz='UTC')
+
+
+class NaiveWindow(object):
+    """
+    The window of WindowCounter recounted from scratch: tweets leave it
+    oldest first (in order of arrival) while there are more than max_size
+    or the oldest one is more than max_age behind the newest time seen.
+    """
+
+    def __init__(self, max_size=None, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.tweets = deque()  # (bag, time, key)
+        self.newest = None
+
+    def add(self, tweets):
+        self.tweets.extend(tweets)
+        times = [t for _, t, _ in tweets if t is not None]
+        if times:
+            self.newest = max(times) if self.newest is None else max(self.newest, max(times))
+        while self.tweets and ((self.max_size is not None and len(self.tweets) > self.max_size) or
+                               (self.max_age is not None and self.newest - self.tweets[0][1] > self.max_age)):
+            self.tweets.popleft()
+
+    def counts(self):
+        counter = Counter()
+        seen = set()
+        for bag, _, key in self.tweets:
+            if key is None or key not in seen:
+                counter.update(bag)
+            seen.add(key)
+        return counter
+
+
+def random_batches(rnd, n_batches, dedup, late):
+    """
+    Batches of (bag, time, key) tweets; with dedup the tweets of a key share
+    their bag, like retweets; with late some tweets are older than the ones
+    before them.
+    """
+    bags = {key: rnd.sample(WORDS, rnd.randint(0, 5)) for key in range(40)}
+    clock = START
+    batches = []
+    for _ in range(n_batches):
+        batch = []
+        for _ in range(rnd.randint(0, 12)):
+            clock += pd.Timedelta(seconds=rnd.randint(0, 20))
+            time = clock - pd.Timedelta(seconds=rnd.randint(0, 120)) if late and rnd.random() < 0.2 else clock
+            key = rnd.randrange(40)
+            bag = bags[key] if dedup else rnd.sample(WORDS, rnd.randint(0, 5))
+            batch.append((bag, time, key if dedup else None))
+        batches.append(batch)
+    return batches
+
+
+def check(counter, naive):
+    expected = naive.counts()
+    assert len(counter) == len(naive.tweets)
+    assert dict(counter.most_common()) == {word: n for word, n in expected.items() if n}
+    for word in WORDS:
+        assert counter[word] == expected[word]
+    top = counter.most_common(5)
+    assert [n for _, n in top] == sorted(expected.values(), reverse=True)[:5]
+
+
+@pytest.mark.parametrize('max_size, max_age', [(25, None), (None, 300), (25, 300), (1, None)],
+                         ids=['count', 'time', 'both', 'one'])
+@pytest.mark.parametrize('dedup', [False, True], ids=['all', 'dedup'])
+@pytest.mark.parametrize('late', [False, True], ids=['in-order', 'late'])
+def test_window_counter_matches_recount(max_size, max_age, dedup, late):
+    rnd = random.Random(hash((max_size, max_age, dedup, late)) & 0xffff)
+    counter = WindowCounter(max_size=max_size, max_age=max_age)
+    naive = NaiveWindow(max_size=max_size, max_age=None if max_age is None else pd.Timedelta(seconds=max_age))
+    for generation, batch in enumerate(random_batches(rnd, 60, dedup, late)):
+        bags = [bag for bag, _, _ in batch]
+        times = [time for _, time, _ in batch] if max_age is not None else None
+        keys = [key for _, _, key in batch] if dedup else None
+        counter.add(bags, times=times, keys=keys, generation=generation)
+        naive.add(batch)
+        check(counter, naive)
+        # the same generation again is not counted twice
+        counter.add(bags, times=times, keys=keys, generation=generation)
+        check(counter, naive)
+
+
+def test_retweets_are_counted_once():
+    counter = WindowCounter(max_size=2)
+    texts = ['marcha en la alameda', 'RT @biobio: marcha en la alameda', 'RT @cnn: marcha en la alameda']
+    bags = [['marcha', 'alameda']] * 3
+    counter.add(bags[:2], keys=list(map(retweet_key, texts[:2])))
+    assert counter.most_common() == [('marcha', 1), ('alameda', 1)]
+    # the original left the window, its retweets keep the words counted once
+    counter.add(bags[2:], keys=list(map(retweet_key, texts[2:])))
+    assert counter['marcha'] == 1
+    counter.add([['paro']], keys=['paro'])
+    counter.add([['metro']], keys=['metro'])
+    assert sorted(counter.most_common()) == [('metro', 1), ('paro', 1)]
+
+
+def test_ranked_counts_most_common():
+    rnd = random.Random(3)
+    ranked = RankedCounts()
+    expected = Counter()
+    for _ in range(500):
+        deltas = {rnd.randrange(30): rnd.randint(-3, 4) for _ in range(rnd.randint(1, 6))}
+        deltas = {key: max(delta, -expected[key]) for key, delta in deltas.items()}
+        ranked.update(deltas)
+        expected.update(deltas)
+        expected = +expected
+        assert ranked.most_common() == sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+        assert ranked.most_common(3) == ranked.most_common()[:3]
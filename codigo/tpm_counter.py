@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from keyword_matcher import Incidence, KeywordMatcher
+
+
+class MinuteCounter(object):
+    """
+    Streaming tweets-per-minute counter for 'All' and a list of keywords.
+
+    Counts live in a ring buffer of max_length minutes per series, so
+    add() costs O(new tweets) and memory does not grow with time.  The
+    newest minute seen is the watermark: it is still being filled, so it
+    is not part of tpm(), the same way get_tpm() drops the last minute.
+    Tweets that arrive late are still counted if their minute is at most
+    `lateness` minutes older than the watermark; older ones are dropped
+    and counted in `late`.
+    """
+
+    def __init__(self, keywords, max_length=100, lateness=2, column='dateTweet', text_column='tweet', matcher=None):
+        """
+        :param keywords: list of keywords, each one gets its own series
+        :param max_length: number of minutes kept per series
+        :param lateness: minutes a late tweet can be behind the watermark
+        :param column: datetime column of the tweets
+        :param text_column: text column used to look for the keywords
+        :param matcher: KeywordMatcher for the keywords, built if None
+        """
+        self.keywords = list(keywords)
+        self.keys = self.keywords + ['All']
+        self.max_length = max_length
+        self.lateness = lateness
+        self.column = column
+        self.text_column = text_column
+        self.matcher = matcher if matcher is not None else KeywordMatcher(self.keywords)
+
+        self.counts = np.zeros((len(self.keys), max_length), dtype=np.int64)
+        self.first = None  # first minute seen, partial so never plotted
+        self.watermark = None  # newest minute seen
+        self.changed = False
+        self.late = 0
+        self.generation = None  # last generation counted
+
+    def add(self, df, hits=None, generation=None, minutes=None):
+        """
+        Counts new tweets.
+        :param df: DataFrame with the new tweets
+        :param hits: Incidence of the tweets, or dict keyword -> boolean array
+        saying which tweets contain it; computed with the matcher if None
+        :param generation: refresh number of df, a generation that was
+        already counted is ignored
+        :param minutes: minutes since epoch of the tweets (minute_numbers()
+        of the datetime column), computed from df if None
+        :return: True if tpm() changed
+        """
+        self.changed = False
+        if generation is not None:
+            if self.generation is not None and generation <= self.generation:
+                return False
+            self.generation = generation
+        if len(df.index) == 0:
+            return False
+
+        minutes = minute_numbers(df[self.column]) if minutes is None else np.asarray(minutes)
+        newest = int(minutes.max())
+        previous = self.watermark
+
+        # move the watermark, clearing the slots of the minutes that enter the ring
+        if previous is None:
+            self.first = int(minutes.min())
+            self.watermark = newest
+        elif newest > previous:
+            if newest - previous >= self.max_length:
+                self.counts[:, :] = 0
+            else:
+                slots = np.arange(previous + 1, newest + 1) % self.max_length
+                self.counts[:, slots] = 0
+            self.watermark = newest
+
+        # keep only the minutes still in the ring and not too late
+        oldest = self.watermark - self.max_length + 1
+        if previous is not None:
+            oldest = max(oldest, previous - self.lateness)
+        accepted = minutes >= oldest
+        self.late += int(len(minutes) - accepted.sum())
+
+        slots = minutes % self.max_length
+        self.counts[-1] += np.bincount(slots[accepted], minlength=self.max_length)
+
+        if hits is None:
+            hits = self.matcher.incidence(df[self.text_column])
+        if isinstance(hits, Incidence):
+            # one bincount over (keyword, slot) pairs for every keyword at once
+            tweets = np.repeat(np.arange(len(minutes)), np.diff(hits.indptr))
+            position = {kw: i for i, kw in enumerate(self.keywords)}
+            rows = np.array([position.get(kw, -1) for kw in hits.keywords], dtype=np.int64)
+            keyword_rows = rows[hits.indices]
+            keep = (keyword_rows >= 0) & accepted[tweets]
+            pairs = keyword_rows[keep] * self.max_length + slots[tweets[keep]]
+            self.counts[:-1] += np.bincount(pairs, minlength=len(self.keywords) * self.max_length) \
+                .reshape(len(self.keywords), self.max_length)
+        else:
+            for i, kw in enumerate(self.keywords):
+                mask = np.asarray(hits[kw], dtype=bool) & accepted
+                if mask.any():
+                    self.counts[i] += np.bincount(slots[mask], minlength=self.max_length)
+
+        self.changed = self.watermark != previous or bool((minutes[accepted] < self.watermark).any())
+        return self.changed
+
+    def index(self):
+        """
+        Returns the array of plotted minutes (minutes since epoch), oldest first.
+        """
+        if self.watermark is None:
+            return np.arange(0)
+        start = max(self.first + 1, self.watermark - self.max_length + 1)
+        return np.arange(start, self.watermark)
+
+    @property
+    def datetime(self):
+        """
+        Last plotted minute as a Timestamp, NaT if there is none.
+        """
+        minutes = self.index()
+        if len(minutes) == 0:
+            return pd.NaT
+        return pd.Timestamp(int(minutes[-1]) * 60, unit='s', tz='UTC')
+
+    def series(self, key):
+        """
+        Returns (x, y) of a series, ready to plot.
+        :param key: keyword or 'All'
+        """
+        minutes = self.index()
+        x = pd.to_datetime(minutes * 60, unit='s', utc=True)
+        return x, self.counts[self.keys.index(key), minutes % self.max_length]
+
+    def tpm(self):
+        """
+        Returns the same structure as get_tpm(df, keywords): a dict keyword ->
+        DataFrame indexed by minute with the counts in the 'dateTweet' column,
+        plus the 'All' series.
+        """
+        minutes, values = self.table()
+        x = pd.to_datetime(minutes * 60, unit='s', utc=True)
+        return {key: pd.DataFrame({'dateTweet': values[i]}, index=x) for i, key in enumerate(self.keys)}
+
+    def table(self):
+        """
+        Returns (minutes, counts): the plotted minutes, oldest first, and an
+        array with one row per key (in self.keys order) and one column per minute.
+        """
+        minutes = self.index()
+        return minutes, self.counts[:, minutes % self.max_length]
+
+
+def minute_numbers(times):
+    """
+    Converts a datetime column to integer minutes since epoch (UTC).
+    """
+    times = pd.to_datetime(times, utc=True)
+    return times.values.astype('datetime64[m]').astype(np.int64)
@@ -0,0 +1,98 @@
+import pandas as pd
+
+from utils import read_mongo
+
+
+class TweetWindow(object):
+    """
+    Rolling window with the newest tweets of a collection.
+
+    Keeps a high-water mark on _id so every refresh() only asks mongo for
+    documents inserted after the last one seen, so the cost of a refresh
+    depends on the new traffic and not on the size of the window.  The rows
+    are not kept: refresh() returns the new ones and their consumers
+    (SegmentEngine, WindowCounter) keep their own counts of the last
+    max_size tweets.
+    """
+
+    def __init__(self, db, collection, query_fields=None, max_size=10 ** 5, time_column='dateTweet',
+                 segments=None, **mongo_kwargs):
+        """
+        :param db: name of the database
+        :param collection: name of the collection
+        :param query_fields: projection used in the queries
+        :param max_size: maximum number of tweets kept in the window
+        :param time_column: column parsed to datetime
+        :param segments: SegmentRegistry, adds the 'segment' column with the
+        segment code of screenName to the new rows
+        :param mongo_kwargs: host, port, username, password for read_mongo
+        """
+        self.db = db
+        self.collection = collection
+        self.query_fields = query_fields or {}
+        self.max_size = max_size
+        self.time_column = time_column
+        self.segments = segments
+        self.mongo_kwargs = mongo_kwargs
+
+        self.last_id = None
+        self.generation = 0
+        self._size = 0
+
+    def __len__(self):
+        # number of tweets of the window, at most max_size
+        return self._size
+
+    def reset(self):
+        """
+        Empties the window: the next refresh() reads the newest max_size
+        documents again.  The generation keeps growing.
+        """
+        self.last_id = None
+        self._size = 0
+
+    def refresh(self):
+        """
+        Reads the documents newer than last_id and appends them to the window.
+        The first call reads the newest max_size documents.
+        :return: DataFrame with the new rows, oldest first
+        """
+        query = {} if self.last_id is None else {'_id': {'$gt': self.last_id}}
+        new = read_mongo(self.db, self.collection, query_condition=query, query_fields=self.query_fields,
+                         num_limit=self.max_size, **self.mongo_kwargs)
+        return self.append(new)
+
+    def append(self, new):
+        """
+        Appends rows (sorted by _id, newest first as read_mongo returns them)
+        to the window.
+        :param new: DataFrame
+        :return: DataFrame with the new rows, oldest first
+        """
+        # every refresh is a new generation, even without new tweets
+        self.generation += 1
+
+        if len(new.index) == 0:
+            return new
+
+        new = new.iloc[::-1].reset_index(drop=True)
+        if self.time_column in new.columns:
+            new[self.time_column] = to_datetime(new[self.time_column])
+        if self.segments is not None and 'screenName' in new.columns:
+            new['segment'] = self.segments.encode(new['screenName'])
+
+        self.last_id = new['_id'].iloc[-1]
+        self._size = min(self._size + len(new.index), self.max_size)
+        return new
+
+
+def to_datetime(values):
+    """
+    Parses the dateTweet strings to UTC datetimes.  Older documents mix
+    values with and without microseconds, so the format is not fixed.
+    """
+    try:
+        return pd.to_datetime(values, utc=True, format='ISO8601')
+    except (TypeError, ValueError):
+        # pandas < 2.0 does not know format='ISO8601'
+        return pd.to_datetime(values, utc=True)
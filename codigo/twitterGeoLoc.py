@@ -1,168 +1,131 @@
-import csv
-import json
 import sys
 import time
-from datetime import datetime
 
-from pymongo import MongoClient
 from tweepy import OAuthHandler
 from tweepy import Stream
 from tweepy.streaming import StreamListener
 
-import config
-from main import get_keywords
-from utils import extract_hash_tags, parse_tweet
-
-csv_prompt = input("Quiere crear un .csv?: [Y/n] ").lower()
-
-if csv_prompt == "":
-    csv_prompt = "y"
-
-# Region #
-region = config.region_CHILE
+from mongo_clients import get_client
+from pipeline import TweetPipeline, process_tweet
+from rollups import ROLLUP_COLLECTION, RollupWriter, ensure_rollup_indexes
+from schema import ensure_indexes
+from segments import SegmentRegistry
+from sinks import CSVSink, MongoBatchWriter
+from utils import CSV_HEADER, get_keywords, parse_payload
 
 # Connect to mongoDB #
-client = MongoClient("127.0.0.1:27017")
+client = get_client(host="127.0.0.1", port=27017)
 db = client.dbTweets
 coll = db['tweets_' + 'chile']
+rollup_coll = db[ROLLUP_COLLECTION]
 
 
 class CustomStreamListener(StreamListener):
 
     # Define a function that is initialized when the miner is called
-    def __init__(self, api=None):
+    def __init__(self, api=None, writer=None, csv_sink=None, pipeline=None, raw=True, notices=None, rollups=None):
         super(StreamListener, self).__init__()
         
         # That sets the api
         self.api = api
 
-        self.csv = False
-
-        if csv_prompt == "y":
-            self.csv = True
-
-        if self.csv:
-            # Create a file with 'data_' and the current time
-            self.filename = 'OutputStreaming' + '_' + time.strftime('%Y%m%d-%H%M%S') + '.csv'
-            print("Se crea el csv " + self.filename)
-
-            # Create a new file with that filename
-            file = open(self.filename, 'w')
-
-            # Create a csv writer
-            writer = csv.writer(file)
-
-            # Write a single row with the headers of the columns
-            writer.writerow(['text',
-                             'created_at',
-                             'geo',
-                             'lang',
-                             'place',
-                             'user.favourites_count',
-                             'user.statuses_count',
-                             'user.description',
-                             'user.location',
-                             'user.id',
-                             'user.created_at',
-                             'user.verified',
-                             'user.url',
-                             'user.listed_count',
-                             'user.friends_count',
-                             'user.name',
-                             'user.screen_name',
-                             'user.geo_enabled',
-                             'id',
-                             'favorite_count',
-                             'retweeted',
-                             'source',
-                             'favorited',
-                             'retweet_count',
-                             'hash_tags'])
+        # Buffered writer for mongoDB, one insert_one per tweet if None
+        self.writer = writer
 
-    def on_status(self, status):
-        """
-        Receives tweets that check the filters of the Stream.
-        Prints them on screen.
-        Writes them on .txt file.
-        """
+        # Long-lived csv sink owned by the listener, no csv if None
+        self.csv_sink = csv_sink
+        self.csv = csv_sink is not None
 
-        global writer, file
+        # Worker pool, tweets are processed in this thread if None
+        self.pipeline = pipeline
 
-        if self.csv:
-            # Open the csv file created previously
-            file = open(self.filename, 'a')
-            # Create a csv writer
-            writer = csv.writer(file)
+        # Per-minute rollups, not kept if None
+        self.rollups = rollups
 
+        # Parse the payloads in on_data instead of building tweepy Status objects
+        self.raw = raw
+
+        # Writer for delete and limit notices, they are only counted if None
+        self.notices = notices
+        self.notice_count = {'delete': 0, 'limit': 0, 'other': 0, 'invalid': 0}
+
+    def on_data(self, raw_data):
+        """
+        Receives every payload of the Stream as a string.  In raw mode it is
+        parsed once with the fastest JSON decoder available and routed
+        without building tweepy objects: tweets go to on_raw_status, delete
+        and limit notices to on_delete and on_limit.
+        """
+        if not self.raw:
+            return StreamListener.on_data(self, raw_data)
 
         try:
+            data = parse_payload(raw_data)
+        except ValueError:
+            # an exception here would stop the Stream, so a bad payload is only counted
+            self.notice_count['invalid'] += 1
+            return True
+        return self.on_payload(data)
+
+    def on_payload(self, data):
+        """
+        Routes a parsed payload (raw mode): tweets go to on_raw_status,
+        delete and limit notices to on_delete and on_limit.
+        :param data: dict, see utils.parse_payload
+        """
+        if 'in_reply_to_status_id' in data:
+            return self.on_raw_status(data)
+        if 'delete' in data:
+            delete = data['delete']['status']
+            return self.on_delete(delete['id'], delete['user_id'])
+        if 'limit' in data:
+            return self.on_limit(data['limit']['track'])
+        if 'disconnect' in data:
+            return self.on_disconnect(data['disconnect'])
+        if 'warning' in data:
+            return self.on_warning(data['warning'])
+
+        self.notice_count['other'] += 1
+        return True
 
-            # Retrieve full text in case it is truncated
-            if hasattr(status, "retweeted_status"):
-                try:
-                    text = status.retweeted_status.extended_tweet["full_text"]
-                except AttributeError:
-                    text = status.retweeted_status.text
+    def on_status(self, status):
+        """
+        Receives tweets that check the filters of the Stream
+        (only when raw is False).
+        """
+        return self.on_raw_status(status._json)
 
-            else:
-                try:
-                    text = status.extended_tweet['full_text']
-                except AttributeError:
-                    text = status.text
+    def on_raw_status(self, data):
+        """
+        Receives the tweet as a dict.
+        With a pipeline the raw tweet is only enqueued, otherwise it is
+        normalized and written to the .csv file and mongo right here.
+        """
 
-            hash_tags = extract_hash_tags(text)
+        # Hand the raw payload to the workers #
+        if self.pipeline is not None:
+            self.pipeline.submit(data)
+            return
+
+        try:
+
+            # Build the mongo document and the csv row from the raw dict #
+            json_obj, row = process_tweet(data, csv=self.csv)
 
             # Write the tweet's information to the csv file
             if self.csv:
-                writer.writerow([text,
-                                 status.created_at + (datetime.now() - datetime.utcnow()),
-                                 status.geo,
-                                 status.lang,
-                                 status.place,
-                                 status.user.favourites_count,
-                                 status.user.statuses_count,
-                                 status.user.description,
-                                 status.user.location,
-                                 status.user.id,
-                                 status.user.created_at,
-                                 status.user.verified,
-                                 status.user.url,
-                                 status.user.listed_count,
-                                 status.user.friends_count,
-                                 status.user.name,
-                                 status.user.screen_name,
-                                 status.user.geo_enabled,
-                                 status.id,
-                                 status.favorite_count,
-                                 status.retweeted,
-                                 status.source,
-                                 status.favorited,
-                                 status.retweet_count,
-                                 hash_tags,
-                                 ])
-
-            # PREPROCESS #
-
-            # SAVE TO EDIT #
-            json_str = json.dumps(status._json)
-
-            # MAKE IT A DICT #
-            json_obj = json.loads(json_str)
-
-            # MODIFY #
-            json_obj['hash_tags'] = list(hash_tags)
-            json_obj['created_at'] = str(status.created_at + (datetime.now() - datetime.utcnow()))
-
-            # PARSE #
-            json_str = parse_tweet(json_obj)
-
-            # MAKE IT A DICT AGAIN #
-            json_obj = json.loads(json_str)
-
-            # print(json_obj)
+                self.csv_sink.writerow(row)
 
             # Insert to db #
-            coll.insert_one(json_obj)
+            if self.writer is not None:
+                stored = self.writer.write(json_obj) is not False
+            else:
+                coll.insert_one(json_obj)
+                stored = True
+
+            # Count it in the per-minute rollups, unless the writer dropped it #
+            if self.rollups is not None and stored:
+                self.rollups.add([json_obj])
 
         # If some error occurs
         except Exception as e:
@@ -170,13 +133,36 @@ class CustomStreamListener(StreamListener):
             print(e)
             # and continue
 
-        if self.csv:
-            # Close the csv file
-            file.close()
-
         # Return nothing
         return
 
+    def on_delete(self, status_id, user_id):
+        """
+        Called when a delete notice arrives.
+        """
+        self.notice_count['delete'] += 1
+        if self.notices is not None:
+            self.notices.write({'type': 'delete', 'id': status_id, 'user_id': user_id})
+        return
+
+    def on_limit(self, track):
+        """
+        Called when a limit notice arrives, track is the number of
+        tweets that matched the filters but were not delivered.
+        """
+        self.notice_count['limit'] += 1
+        if self.notices is not None:
+            self.notices.write({'type': 'limit', 'track': track})
+        return
+
+    def close(self):
+        """
+        Flushes and closes the csv file, if any.
+        """
+        if self.csv_sink is not None:
+            self.csv_sink.close()
+            print("CSV:", self.csv_sink.stats())
+
     def on_error(self, status_code):
         # Print the error code
         print('Encountered error with status code:', status_code)
@@ -197,32 +183,38 @@ class CustomStreamListener(StreamListener):
 
         return True  # Don't kill the stream
 
-    '''
-    # NOT WORKING YET#
-    def on_data(self, data):
-        json_data = json.loads(data)
-        print(json_data)
-        if data[0].isdigit():
-            pass
-        try:
-            if json_data['geo'] is not None:
-                tt = parse_tweet(json_data)
-                print(tt)
-        except Exception:
-            print("error in geo")
-    '''
 
+def read_tweets(region, track, workers=2, csv=True):
+    # config holds the credentials, only needed for the live stream
+    import config
 
-def read_tweets(region, track):
     # AUTH #
     auth = OAuthHandler(config.CONSUMER_KEY, config.CONSUMER_SECRET)
     auth.set_access_token(config.ACCESS_TOKEN, config.ACCESS_TOKEN_SECRET)
 
-    # API #
-    l = CustomStreamListener()
+    # INDEXES #
+    ensure_indexes(coll)
+    ensure_rollup_indexes(rollup_coll)
+
+    # WRITER #
+    writer = MongoBatchWriter(coll).start()
+
+    # ROLLUPS #
+    rollups = RollupWriter(rollup_coll, track, SegmentRegistry()).start()
 
     # OUTPUT #
     filename = 'OutputStreaming'
+    csv_sink = None
+    if csv:
+        # Create a file with 'OutputStreaming_' and the current time
+        csv_sink = CSVSink(prefix=filename, header=CSV_HEADER)
+        print("Se crea el csv " + csv_sink.filename)
+
+    # WORKERS #
+    pipeline = TweetPipeline(writer=writer, csv_sink=csv_sink, workers=workers, rollups=rollups).start()
+
+    # API #
+    l = CustomStreamListener(writer=writer, csv_sink=csv_sink, pipeline=pipeline, rollups=rollups)
 
     # INIT STREAM #
     # streamer = Stream(auth=auth, listener=l, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
@@ -232,15 +224,33 @@ def read_tweets(region, track):
     print("")
 
     # FILTERS #
-    streamer.filter(locations=region, languages=['es'], track=track)
+    try:
+        streamer.filter(locations=region, languages=['es'], track=track)
+    finally:
+        # Flush buffered tweets before leaving #
+        pipeline.close()
+        l.close()
+        writer.close()
+        rollups.close()
+        print("Pipeline:", pipeline.stats())
+        print("Mongo writer:", writer.stats())
+        print("Rollups:", rollups.stats())
+        print("Notices:", l.notice_count)
 
 
 def main():
+    import config
+
+    csv_prompt = input("Quiere crear un .csv?: [Y/n] ").lower()
+
+    if csv_prompt == "":
+        csv_prompt = "y"
+
     # Parametros de busqueda #
     search_words = get_keywords()
 
     # Get Tweets #
-    read_tweets(config.region_CHILE, search_words)
+    read_tweets(config.region_CHILE, search_words, csv=csv_prompt == "y")
 
 
 if __name__ == "__main__":
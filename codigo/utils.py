@@ -3,10 +3,31 @@ import json
 import os
 import sys
 import time
+from datetime import datetime, timedelta
+from itertools import chain, islice
 
+import numpy as np
 import pandas as pd
+from bson import ObjectId
+from pandas.api.types import infer_dtype
 from bson.json_util import dumps
-from pymongo import MongoClient
+
+from mongo_clients import get_client
+
+# fastest JSON decoder available for the raw stream payloads
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+
+# pyarrow is optional, only needed by read_mongo_columns(..., arrow=True)
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 def today():
@@ -17,6 +38,165 @@ def hour():
     return '' + time.strftime('%H%M%S')
 
 
+def parse_payload(payload):
+    """
+    Parses a payload of the Stream with the fastest JSON decoder available.
+    orjson rejects lone surrogates ("\\ud83d") that Twitter sends and json
+    accepts, those payloads are parsed again with json.
+    :param payload: JSON string
+    :return: dict
+    :raises ValueError: if it is not valid JSON
+    """
+    try:
+        return json_loads(payload)
+    except ValueError:
+        return json.loads(payload)
+
+
+def get_full_text(j):
+    """
+    Retrieves the full text of a tweet in case it is truncated.  For
+    retweets the text of the original tweet is used.
+    :param j: dict with the tweet as sent by Twitter (status._json)
+    :return: string
+    """
+    if "retweeted_status" in j:
+        j = j["retweeted_status"]
+    try:
+        return j["extended_tweet"]["full_text"]
+    except KeyError:
+        return j["text"]
+
+
+# cached (monotonic time, offset) used by local_offset()
+_offset_cache = [float('-inf'), None]
+
+
+def local_offset():
+    """
+    Returns the difference between local time and UTC, rounded to the minute.
+    The value is cached for a minute so it can be called once per tweet.
+    """
+    now = time.monotonic()
+    if now - _offset_cache[0] > 60:
+        seconds = (datetime.now() - datetime.utcnow()).total_seconds()
+        _offset_cache[0] = now
+        _offset_cache[1] = timedelta(minutes=round(seconds / 60))
+    return _offset_cache[1]
+
+
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+def parse_created_at(created_at):
+    """
+    Parses Twitter's created_at ('Thu Oct 24 14:39:39 +0000 2019')
+    into a naive UTC datetime.  Slices the fixed-width string instead of
+    calling strptime, which is several times slower.
+    :param created_at: string
+    """
+    try:
+        return datetime(int(created_at[26:30]), _MONTHS[created_at[4:7]], int(created_at[8:10]),
+                        int(created_at[11:13]), int(created_at[14:16]), int(created_at[17:19]))
+    except (KeyError, ValueError):
+        return datetime.strptime(created_at, '%a %b %d %H:%M:%S +0000 %Y')
+
+
+def normalize_tweet(j, created_at=None, offset=None):
+    """
+    Builds the document stored in mongo straight from the raw tweet
+    dictionary, in a single pass and without JSON round trips.
+    :param j: dict with the tweet as sent by Twitter (status._json)
+    :param created_at: UTC datetime of the tweet, parsed from j if None
+    :param offset: timedelta added to created_at, local_offset() if None
+    :return: dict, dateTweet is a naive datetime with the local time (a BSON date)
+    """
+    if created_at is None:
+        created_at = parse_created_at(j['created_at'])
+    if offset is None:
+        offset = local_offset()
+
+    text = get_full_text(j)
+    user = j['user']
+
+    return {'dateTweet': created_at + offset,
+            'tweet': text,
+            'screenName': user['screen_name'],
+            'name': user['name'],
+            'user_url': user['url'],
+            'description': user['description'],
+            'location': user['location'],
+            'verified': user['verified'],
+            'geoEnabled': user['geo_enabled'],
+            'hash_tags': list(extract_hash_tags(text))
+            }
+
+
+# Columns of the .csv output #
+CSV_HEADER = ['text',
+              'created_at',
+              'geo',
+              'lang',
+              'place',
+              'user.favourites_count',
+              'user.statuses_count',
+              'user.description',
+              'user.location',
+              'user.id',
+              'user.created_at',
+              'user.verified',
+              'user.url',
+              'user.listed_count',
+              'user.friends_count',
+              'user.name',
+              'user.screen_name',
+              'user.geo_enabled',
+              'id',
+              'favorite_count',
+              'retweeted',
+              'source',
+              'favorited',
+              'retweet_count',
+              'hash_tags']
+
+
+def tweet_csv_row(j, document):
+    """
+    Builds the .csv row (columns in CSV_HEADER) of a tweet.
+    :param j: dict with the tweet as sent by Twitter (status._json)
+    :param document: dict returned by normalize_tweet(j)
+    :return: list
+    """
+    user = j['user']
+    return [document['tweet'],
+            str(document['dateTweet']),
+            j.get('geo'),
+            j.get('lang'),
+            j.get('place'),
+            user.get('favourites_count'),
+            user.get('statuses_count'),
+            user['description'],
+            user['location'],
+            user.get('id'),
+            user.get('created_at'),
+            user['verified'],
+            user['url'],
+            user.get('listed_count'),
+            user.get('friends_count'),
+            user['name'],
+            user['screen_name'],
+            user['geo_enabled'],
+            j.get('id'),
+            j.get('favorite_count'),
+            j.get('retweeted'),
+            j.get('source'),
+            j.get('favorited'),
+            j.get('retweet_count'),
+            document['hash_tags'],
+            ]
+
+
 def parse_tweet(j):
     """
     Parses a dictionary created from a tweepy Status object
@@ -25,16 +205,7 @@ def parse_tweet(j):
     """
 
     # Retrieve full text in case it is truncated
-    if "retweeted_status" in j.keys():
-        try:
-            text = j["retweeted_status"]["extended_tweet"]["full_text"]
-        except KeyError:
-            text = j["retweeted_status"]["text"]
-    else:
-        try:
-            text = j["extended_tweet"]["full_text"]
-        except KeyError:
-            text =  j["text"]
+    text = get_full_text(j)
 
     # Create custom json with only the useful info.
     try:
@@ -55,6 +226,16 @@ def parse_tweet(j):
         return json.dumps(j)
 
 
+def get_keywords(path='./kw.csv'):
+    """
+    Returns a Python list of strings read from the file kw.csv
+    """
+    # Abrimos las keywords como string
+    with open(path, encoding='utf-8') as keywordfile:
+        # Convertimos a lista de Python
+        return keywordfile.read().split(', ')
+
+
 def get_latest_output():
     cwd = os.getcwd()
 
@@ -78,43 +259,130 @@ def extract_hash_tags(s):
 
 
 def _connect_mongo(host, port, username, password, db):
-    """ A util for making a connection to mongo """
+    """ A util for making a connection to mongo, the client is shared by every call """
 
-    if username and password:
-        mongo_uri = 'mongodb://%s:%s@%s:%s/%s' % (username, password, host, port, db)
-        conn = MongoClient(mongo_uri)
-    else:
-        conn = MongoClient(host, port)
+    conn = get_client(host=host, port=port, username=username, password=password, db=db)
 
     return conn[db]
 
 
 def read_mongo(db, collection, query_condition={}, query_fields={}, host='localhost', port=27017, username=None,
-               password=None, no_id=True, num_limit=None, json_only=False):
+               password=None, no_id=True, num_limit=None, json_only=False, batch_size=10000):
     """ Read from Mongo and Store into DataFrame or return JSON """
 
+    # JSON return
+    if json_only:
+        # Connect to MongoDB
+        db = _connect_mongo(host=host, port=port, username=username, password=password, db=db)
+        return dumps(_find(db[collection], query_condition, query_fields, num_limit))
+
+    # Read the cursor column by column and construct the DataFrame
+    return read_mongo_columns(db, collection, query_condition=query_condition, query_fields=query_fields, host=host,
+                              port=port, username=username, password=password, num_limit=num_limit,
+                              batch_size=batch_size)
+
+
+def _find(collection, query_condition, query_fields, num_limit=None, batch_size=None):
+    """ Makes the query of read_mongo: everything, or the newest num_limit documents """
+    if num_limit is None:
+        cursor = collection.find(query_condition, query_fields)
+    else:
+        cursor = collection.find(query_condition, query_fields).sort('_id', -1).limit(num_limit)
+    if batch_size is not None:
+        cursor = cursor.batch_size(batch_size)
+    return cursor
+
+
+# numpy type of the columns by pandas.api.types.infer_dtype() kind
+_COLUMN_TYPES = {'string': object, 'boolean': bool, 'integer': np.int64, 'floating': np.float64,
+                 'datetime': 'datetime64[us]'}
+
+
+def _column_array(values):
+    """
+    Converts the values of a column in one batch to a typed numpy array, or
+    returns the list itself if some are missing (None) and the type has to
+    be inferred from the whole column.
+    """
+    dtype = _COLUMN_TYPES.get(infer_dtype(values, skipna=False))
+    if dtype is None:
+        # fromiter keeps lists (hash_tags) as values, np.array would nest them
+        return values if None in values else np.fromiter(values, dtype=object, count=len(values))
+    try:
+        return np.array(values, dtype=dtype)
+    except (OverflowError, ValueError):
+        return values
+
+
+def read_mongo_columns(db, collection, query_condition={}, query_fields={}, host='localhost', port=27017,
+                       username=None, password=None, num_limit=None, batch_size=10000, arrow=False):
+    """
+    Same query as read_mongo, but reads the cursor in batches of batch_size
+    documents and stores every field in a typed column buffer as it goes,
+    instead of keeping every document as a dict until the end.  Columns are
+    in order of first appearance and missing values are None/NaN, as with
+    pd.DataFrame(list(cursor)).
+    :param batch_size: documents read from the cursor at a time
+    :param arrow: return a pyarrow.Table (ObjectIds as strings) instead of
+    a DataFrame
+    :return: DataFrame or pyarrow.Table
+    """
     # Connect to MongoDB
     db = _connect_mongo(host=host, port=port, username=username, password=password, db=db)
-    
-    #if no_id:
-    #    suppress = 0
-    #else:
-    #    suppress = 1
-    
-    # query_fields["_id"] = suppress
-
-    # Make a query to the specific DB and Collection
-    if(num_limit is None):
-        cursor = db[collection].find(query_condition, query_fields)
-    else:
-        cursor = db[collection].find(query_condition, query_fields).sort('_id',-1).limit(num_limit)
+    cursor = _find(db[collection], query_condition, query_fields, num_limit, batch_size)
+    return cursor_columns(cursor, batch_size=batch_size, arrow=arrow)
+
+
+def cursor_columns(cursor, batch_size=10000, arrow=False):
+    """
+    Reads a cursor (or any iterable of documents) in batches into typed
+    columns, see read_mongo_columns.
+    :param cursor: pymongo cursor
+    :param batch_size: documents read at a time
+    :param arrow: return a pyarrow.Table instead of a DataFrame
+    :return: DataFrame or pyarrow.Table
+    """
+    if arrow and pyarrow is None:
+        raise ImportError('cursor_columns(..., arrow=True) necesita pyarrow')
+
+    cursor = iter(cursor)
+    columns = {}  # name -> list of batches (typed arrays or lists)
+    rows = 0
+    batch = list(islice(cursor, batch_size))
+    while batch:
+        # fields of the batch in order of first appearance
+        keys = dict.fromkeys(chain.from_iterable(batch))
+        for key in keys:
+            if key not in columns:
+                columns[key] = [[None] * rows] if rows else []
+            columns[key].append(_column_array([document.get(key) for document in batch]))
+        for key in columns.keys() - keys.keys():
+            columns[key].append([None] * len(batch))
+
+        rows += len(batch)
+        batch = list(islice(cursor, batch_size))
+
+    data = {}
+    for key, batches in columns.items():
+        if all(isinstance(part, np.ndarray) for part in batches) and len({part.dtype for part in batches}) == 1:
+            data[key] = batches[0] if len(batches) == 1 else np.concatenate(batches)
+        else:
+            data[key] = pd.Series(list(chain.from_iterable(batches))).values
+
+    if arrow:
+        return pyarrow.table({key: pyarrow.array(_arrow_values(column), from_pandas=True)
+                              for key, column in data.items()})
+    return pd.DataFrame(data, copy=False)
 
-    # JSON return
-    if json_only:
-        return dumps(cursor)
 
-    # Expand the cursor and construct the DataFrame
-    return pd.DataFrame(list(cursor))
+def _arrow_values(column):
+    """ Arrow has no ObjectId type, they are converted to their hex string """
+    if column.dtype == object:
+        # the type of the column is the one of its first value, missing values are None
+        first = next((value for value in column if value is not None), None)
+        if isinstance(first, ObjectId):
+            return np.array([None if value is None else str(value) for value in column], dtype=object)
+    return column
 
 
 def json_pandas(json_string):
@@ -1,9 +1,14 @@
+import base64
+import io
+
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 from PIL import Image
 from wordcloud import WordCloud
 
+from keyword_matcher import KeywordMatcher
+
 
 def get_users(direction):
     '''
@@ -19,12 +24,16 @@ def get_time_text(direction):
     pd.read_csv(direction, usecols=['dateTweet', 'tweet'])
 
 
-def get_kw_dict(df, keywords, col='tweet'):
+def get_kw_dict(df, keywords, col='tweet', matcher=None):
     '''
         devuelve un diccionario con los índices del df que contienen cada una de las palabras clave
         ojo, eso no tiene pq sumar el total, ya que puden haber tweets con ambas palabras
+        las palabras clave se buscan como texto literal, todas en una sola pasada por tweet
     '''
-    return {kw: df[df[col].str.contains(kw)].index for kw in keywords}
+    if matcher is None:
+        matcher = KeywordMatcher(keywords)
+    incidence = matcher.incidence(df[col])
+    return {kw: df.index[incidence.rows(kw)] for kw in keywords}
 
 
 def get_tpm(df, keywords=None, column='dateTweet', wholedf=None):
@@ -52,20 +61,21 @@ def get_tpm(df, keywords=None, column='dateTweet', wholedf=None):
 
 def get_users_indices(df, users, col='screenName'):
     '''
-    crea una lista con los indices correspondientes a cada todos los usuarios solicitados
+    crea una lista con las posiciones (no las etiquetas del indice) de los tweets de todos los usuarios solicitados
     :param df: dataframe de la db
     :param users: lista de usuarios para buscar
-    :return: devuelve una lista con las caracteristicas descritas
+    :return: arreglo de posiciones, para usar con df.iloc
     '''
-    return df[df[col].isin(users)].index
+    return np.flatnonzero(df[col].isin(users).values)
 
 
-def get_tpm_users(df, users, keywords):
+def get_tpm_users(df, users, keywords, matcher=None):
     '''
     function that gets a df and the indices of interest to filter users
     :param df: dataframe from db
     :param users: lista de usuarios para buscar
     :param key_words: keywords to look for
+    :param matcher: KeywordMatcher for the keywords, built if None
     :return: return a dataframe with the words frequency but for username filter
     '''
     # return get_tpm(df.loc[df['screenName'].isin(users)], keywords)
@@ -74,8 +84,11 @@ def get_tpm_users(df, users, keywords):
     politicosdf = df.iloc[indices].filter(['tweet', 'dateTweet'])
     politicosdf['All'] = 1
 
+    if matcher is None:
+        matcher = KeywordMatcher(keywords)
+    incidence = matcher.incidence(politicosdf['tweet'])
     for word in keywords:
-        politicosdf[word] = politicosdf['tweet'].str.contains(word).astype(int)
+        politicosdf[word] = incidence.mask(word).astype(int)
     politicosdf = politicosdf.loc[:, politicosdf.columns != 'tweet']
     politicosdf = politicosdf.groupby('dateTweet').sum()
 
@@ -107,7 +120,8 @@ def get_word_frequency(tpm, keywords):
 
 
 def create_graph(tpm, keywords):
-    traces = [go.Scatter(x=tpm[key].index, y=tpm[key]['dateTweet'].values,
+    # y as plain lists (not typed arrays) so SeriesFeed can patch single points
+    traces = [go.Scatter(x=tpm[key].index, y=tpm[key]['dateTweet'].tolist(),
               mode='lines+markers', text=key, name=key)
               for key in keywords + ['All']]
 
@@ -116,116 +130,51 @@ def create_graph(tpm, keywords):
     return graph
 
 
-def create_wc(tpm: object, keywords: object, wc_kwargs: object = {"background_color": 'white', "colormap": 'plasma',
-                                                  "width": 1200, "height": 800}) -> object:
+def keyword_frequencies(tpm, keywords):
     """
-    Generate a wordcloud of the keywords given, wheighted by the number of
-    unique tweets they appear in. Returns a go.Figure() instance.
-
+    Frequencies of the keywords that appear at least once, the input of
+    the word cloud of create_wc().
     :param tpm: Dataframe with the words frequency per minute.
-    :param keywords: list of strings to plot in the word cloud.
-    :param wc_kwargs: dict of keyword arguments to give to the WordCloud
-    constructor.
+    :param keywords: list of strings
     """
-    # Build the word cloud from the data
     wf = get_word_frequency(tpm, keywords)
-    new_keywords = []
-    for key in keywords:
-        if wf[key] > 0:
-            new_keywords.append(key)
-
-    keywords = new_keywords
-    wf = {key:wf[key] for key in keywords}
-    if len(wf) == 0:
-        return go.Figure()
-    else:
-        word_cloud = WordCloud(**wc_kwargs).generate_from_frequencies(wf)
-
-        wc_raster = Image.fromarray(word_cloud.to_array())
-
-        # Call the constructor of Figure object
-        fig = go.Figure()
-
-        # Constants
-        img_width = 1600
-        img_height = 900
-        scale_factor = 0.5
-
-        # Add invisible scatter trace.
-        # This trace is added to help the autoresize logic work.
-        fig.add_trace(
-            go.Scatter(
-                x=[0, img_width * scale_factor],
-                y=[0, img_height * scale_factor],
-                mode="markers",
-                marker_opacity=0
-            )
-        )
-
-        # Configure axes
-        fig.update_xaxes(
-            visible=False,
-            range=[0, img_width * scale_factor]
-        )
+    return {key: wf[key] for key in keywords if wf[key] > 0}
 
-        fig.update_yaxes(
-            visible=False,
-            range=[0, img_height * scale_factor],
-            # the scaleanchor attribute ensures that the aspect ratio stays constant
-            scaleanchor="x"
-        )
 
-        # Add image
-        fig.update_layout(
-            images=[go.layout.Image(
-                x=0,
-                sizex=img_width * scale_factor,
-                y=img_height * scale_factor,
-                sizey=img_height * scale_factor,
-                xref="x",
-                yref="y",
-                opacity=1.0,
-                layer="below",
-                sizing="stretch",
-                source=wc_raster)]
-        )
+def png_data_uri(image, colors=256):
+    """
+    Encodes an image as a base64 PNG data URI, the format plotly sends to
+    the browser.  Word clouds have few colors, so the image is quantized to
+    a palette of `colors` colors, which makes the PNG about 3 times smaller.
+    :param image: PIL Image
+    :param colors: palette size, None to keep the RGB image
+    """
+    if colors is not None:
+        image = image.quantize(colors)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
 
-        # Configure other layout
-        fig.update_layout(
-            width=img_width * scale_factor,
-            height=img_height * scale_factor,
-            margin={"l": 0, "r": 0, "t": 0, "b": 0}
-        )
-        return fig
 
-def create_wc2(counter: object, n: object = 35, wc_kwargs: object = {"background_color": 'white', "colormap": 'plasma',
-                                                  "width": 1200, "height": 800}) -> object:
+def render_wc(frequencies, wc_kwargs={"background_color": 'white', "colormap": 'plasma', "width": 1200, "height": 800}):
     """
-    Generate a wordcloud of the keywords given, wheighted by the number of
-    unique tweets they appear in. Returns a go.Figure() instance.
-
-    :param counter: Counter with the processed words
-    :param n: Number of most common words to display
+    Rasterizes a word cloud.  Returns the image as a PNG data URI, which is
+    small and cheap to send between processes.
+    :param frequencies: dict word -> frequency
     :param wc_kwargs: dict of keyword arguments to give to the WordCloud
     constructor.
-    TODO: test corner cases
     """
-    # Build the word cloud from the data
-    #wf = get_word_frequency(tpm, keywords)
-    #new_keywords = []
-    #for key in keywords:
-    #    if wf[key] > 0:
-    #        new_keywords.append(key)
-
-    #keywords = new_keywords
-    #wf = {key:wf[key] for key in keywords}
-    #if len(wf) == 0:
-    #    return go.Figure()
-    #else:
-    filtered_ctr = dict(counter.most_common(n))
-    word_cloud = WordCloud(**wc_kwargs).generate_from_frequencies(filtered_ctr)
+    word_cloud = WordCloud(**wc_kwargs).generate_from_frequencies(frequencies)
+    return png_data_uri(Image.fromarray(word_cloud.to_array()))
+
 
-    wc_raster = Image.fromarray(word_cloud.to_array())
+def wc_figure(source):
+    """
+    Wraps a word cloud image in a go.Figure() instance.
+    :param source: image as returned by render_wc(), None for an empty figure
+    """
+    if source is None:
+        return go.Figure()
 
     # Call the constructor of Figure object
     fig = go.Figure()
@@ -271,7 +220,7 @@ def create_wc2(counter: object, n: object = 35, wc_kwargs: object = {"background
             opacity=1.0,
             layer="below",
             sizing="stretch",
-            source=wc_raster)]
+            source=source)]
     )
 
     # Configure other layout
@@ -282,6 +231,40 @@ def create_wc2(counter: object, n: object = 35, wc_kwargs: object = {"background
     )
     return fig
 
+
+def create_wc(tpm: object, keywords: object, wc_kwargs: object = {"background_color": 'white', "colormap": 'plasma',
+                                                  "width": 1200, "height": 800}) -> object:
+    """
+    Generate a wordcloud of the keywords given, wheighted by the number of
+    unique tweets they appear in. Returns a go.Figure() instance.
+
+    :param tpm: Dataframe with the words frequency per minute.
+    :param keywords: list of strings to plot in the word cloud.
+    :param wc_kwargs: dict of keyword arguments to give to the WordCloud
+    constructor.
+    """
+    # Build the word cloud from the data
+    wf = keyword_frequencies(tpm, keywords)
+    if len(wf) == 0:
+        return go.Figure()
+    else:
+        return wc_figure(render_wc(wf, wc_kwargs))
+
+def create_wc2(counter: object, n: object = 35, wc_kwargs: object = {"background_color": 'white', "colormap": 'plasma',
+                                                  "width": 1200, "height": 800}) -> object:
+    """
+    Generate a wordcloud of the keywords given, wheighted by the number of
+    unique tweets they appear in. Returns a go.Figure() instance.
+
+    :param counter: Counter with the processed words
+    :param n: Number of most common words to display
+    :param wc_kwargs: dict of keyword arguments to give to the WordCloud
+    constructor.
+    TODO: test corner cases
+    """
+    filtered_ctr = dict(counter.most_common(n))
+    return wc_figure(render_wc(filtered_ctr, wc_kwargs))
+
 def get_username_list(direction):
     '''
     get a list of usernames given a direction of a csv file containing the list of usernames of interest
@@ -0,0 +1,155 @@
+from collections import Counter
+from itertools import chain, islice
+
+import numpy as np
+
+
+class Vocabulary(object):
+    """
+    Interns words to consecutive integer ids.  Every word is stored once,
+    corpora only keep int32 ids.
+    """
+
+    def __init__(self, words=()):
+        """
+        :param words: iterable of words to intern first
+        """
+        self.index = {}  # word -> id
+        self.words = []  # id -> word
+        self.intern(words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def intern(self, words):
+        """
+        Returns the ids of words, adding the words not seen before.
+        :param words: iterable of strings
+        :returns: int32 array
+        """
+        index = self.index
+        ids = np.fromiter((index.setdefault(word, len(index)) for word in words), dtype=np.int32)
+        if len(index) > len(self.words):
+            self.words.extend(islice(index, len(self.words), None))
+        return ids
+
+    def lookup(self, ids):
+        """
+        Returns the words of a sequence of ids.
+        """
+        words = self.words
+        return [words[i] for i in ids]
+
+    def encode(self, wordbags):
+        """
+        Interns a list of word bags.
+        :param wordbags: list of lists of strings
+        :returns: Corpus
+        """
+        indptr = np.zeros(len(wordbags) + 1, dtype=np.int64)
+        np.cumsum([len(wordbag) for wordbag in wordbags], out=indptr[1:])
+        return Corpus(indptr, self.intern(chain.from_iterable(wordbags)), self)
+
+
+class Corpus(object):
+    """
+    Word bags of a list of tweets stored CSR style: the word ids of tweet i
+    are indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, indptr, indices, vocabulary):
+        """
+        :param indptr: int64 array of length n_tweets + 1
+        :param indices: int32 array with the word ids of every tweet
+        :param vocabulary: Vocabulary of the ids
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def wordbag(self, i):
+        """
+        Returns the words of tweet i.
+        """
+        return self.vocabulary.lookup(self.indices[self.indptr[i]:self.indptr[i + 1]])
+
+    def take(self, positions):
+        """
+        Returns the corpus of a subset of tweets.
+        :param positions: array of tweet positions or boolean mask
+        """
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # position of every selected entry in self.indices
+        offsets = np.arange(indptr[-1], dtype=np.int64) - np.repeat(indptr[:-1], lengths)
+        return Corpus(indptr, self.indices[np.repeat(starts, lengths) + offsets], self.vocabulary)
+
+    def counts(self, minlength=None):
+        """
+        Returns an array with the number of tweets that contain each word id.
+        :param minlength: length of the result, the vocabulary size if None
+        """
+        if minlength is None:
+            minlength = len(self.vocabulary)
+        return np.bincount(self.indices, minlength=minlength)
+
+    def counter(self):
+        """
+        Returns the counts as a collections.Counter of words.
+        """
+        return CountsView(self.counts(), self.vocabulary).counter()
+
+
+class CountsView(object):
+    """
+    Read-only Counter-like view of an array of counts indexed by word id.
+    """
+
+    def __init__(self, counts, vocabulary):
+        self.counts = counts
+        self.vocabulary = vocabulary
+
+    def __getitem__(self, word):
+        i = self.vocabulary.index.get(word)
+        return int(self.counts[i]) if i is not None and i < len(self.counts) else 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.counts))
+
+    def most_common(self, n=None):
+        """
+        Same as Counter.most_common(n).
+        :param n: number of words, None for every word
+        """
+        if n is not None and n <= 0:
+            return []
+        nonzero = np.flatnonzero(self.counts)
+        if n is not None and n < len(nonzero):
+            nonzero = nonzero[np.argpartition(-self.counts[nonzero], n - 1)[:n]]
+        # highest count first, ties by id (first seen first); which of the
+        # words tied at the n-th count are kept is arbitrary
+        order = np.lexsort((nonzero, -self.counts[nonzero]))
+        words = self.vocabulary.words
+        return [(words[i], int(self.counts[i])) for i in nonzero[order]]
+
+    def counter(self, n=None):
+        """
+        Returns a collections.Counter with the n most common words.
+        :param n: number of words, None for every word
+        """
+        return Counter(dict(self.most_common(n)))
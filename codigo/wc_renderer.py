@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+
+from utils_app import render_wc, wc_figure
+
+
+def frequency_key(frequencies, digits=2):
+    """
+    Cache key of a word cloud: the words with their frequencies relative to
+    the highest one, rounded to `digits` decimals.  WordCloud only uses
+    relative frequencies, so frequencies with the same key give the same
+    picture (up to the random placement of the words).
+    :param frequencies: dict word -> frequency
+    :param digits: decimals kept
+    :return: int, None if there are no frequencies
+    """
+    if not frequencies:
+        return None
+    top = max(frequencies.values())
+    return hash(tuple(sorted((word, round(value / top, digits)) for word, value in frequencies.items())))
+
+
+class WordCloudRenderer(object):
+    """
+    Renders word clouds in a persistent pool of processes.
+
+    submit() returns right away and figure() always returns the last word
+    cloud rendered for a name, so the callbacks never wait for WordCloud:
+    the new picture replaces the old one as soon as it is ready.  Rendered
+    images are cached by frequency_key(), so frequencies that did not
+    change enough to give a different picture are not rendered again.
+    """
+
+    def __init__(self, workers=1, cache_size=32, digits=2, wc_kwargs=None):
+        """
+        :param workers: number of rendering processes
+        :param cache_size: number of rendered images kept
+        :param digits: decimals of the relative frequencies in the cache key
+        :param wc_kwargs: dict of keyword arguments for WordCloud, render_wc()
+        defaults if None
+        """
+        self.workers = workers
+        self.cache_size = cache_size
+        self.digits = digits
+        self.wc_kwargs = wc_kwargs
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        self._executor = None
+        self._cache = OrderedDict()  # key -> PNG data URI
+        self._figures = {}  # name -> (key, figure, PNG data URI)
+        self._pending = {}  # name -> (key, future)
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # started on first use, so forked web workers create their own
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, name, frequencies):
+        """
+        Asks for the word cloud of name to show frequencies.
+        :param name: name of the word cloud (e.g. the tab)
+        :param frequencies: dict word -> frequency
+        :return: True if a render was started, False if the figure was
+        updated from the cache (or is already being rendered)
+        """
+        key = frequency_key(frequencies, self.digits)
+        with self._lock:
+            current = self._figures.get(name)
+            if current is not None and current[0] == key:
+                self.hits += 1
+                return False
+            if key is None or key in self._cache:
+                self.hits += 1
+                source = None if key is None else self._cache[key]
+                if key is not None:
+                    self._cache.move_to_end(key)
+                self._figures[name] = (key, wc_figure(source), source)
+                self._pending.pop(name, None)
+                return False
+            pending = self._pending.get(name)
+            if pending is not None and pending[0] == key:
+                return False
+
+            self.misses += 1
+            args = (dict(frequencies),) if self.wc_kwargs is None else (dict(frequencies), self.wc_kwargs)
+            future = self._pool().submit(render_wc, *args)
+            self._pending[name] = (key, future)
+        future.add_done_callback(lambda done: self._done(name, key, done))
+        return True
+
+    def _done(self, name, key, future):
+        # called once the future is done, more than once is harmless
+        try:
+            source = future.result()
+        except Exception as error:
+            with self._lock:
+                if self._pending.get(name, (None, None))[1] is not future:
+                    return
+                del self._pending[name]
+                self.errors += 1
+            print("Error al generar la nube de palabras '{0}': {1!r}".format(name, error))
+            return
+
+        figure = wc_figure(source)
+        with self._lock:
+            self._cache[key] = source
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            # an older render that finishes late only fills the cache
+            if self._pending.get(name, (None, None))[1] is future:
+                del self._pending[name]
+                self._figures[name] = (key, figure, source)
+            elif name not in self._figures:
+                self._figures[name] = (key, figure, source)
+
+    def figure(self, name, wait=False, timeout=None):
+        """
+        Returns the last word cloud rendered for name, an empty figure if
+        there is none yet.
+        :param name: name of the word cloud
+        :param wait: wait for the render in progress, if any
+        :param timeout: seconds to wait
+        """
+        if wait:
+            with self._lock:
+                pending = self._pending.get(name)
+            if pending is not None and wait_futures([pending[1]], timeout).done:
+                # do not depend on the done callback having run already
+                self._done(name, pending[0], pending[1])
+        with self._lock:
+            current = self._figures.get(name)
+        return current[1] if current is not None else wc_figure(None)
+
+    def figure_key(self, name):
+        """
+        Returns the frequency_key() of the word cloud figure() returns for
+        name, None if there is none yet.  It changes when the figure does.
+        """
+        with self._lock:
+            current = self._figures.get(name)
+        return current[0] if current is not None else None
+
+    def image(self, name):
+        """
+        Returns (frequency_key(), PNG data URI) of the word cloud figure()
+        returns for name, (None, None) if there is none yet.  The image is
+        what other processes need to build the same figure (wc_figure()).
+        """
+        with self._lock:
+            current = self._figures.get(name)
+        return (current[0], current[2]) if current is not None else (None, None)
+
+    def stats(self):
+        """
+        Returns a dict with the cache hits, renders and pending renders.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors,
+                    'cached': len(self._cache), 'pending': len(self._pending)}
+
+    def close(self):
+        """
+        Stops the rendering processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
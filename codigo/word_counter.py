@@ -0,0 +1,258 @@
+import re
+from bisect import bisect_left, insort
+from collections import Counter, deque
+from heapq import nsmallest
+
+import numpy as np
+import pandas as pd
+
+from vocabulary import Corpus, Vocabulary
+
+# "RT @user: " prefix added by Twitter to the text of a retweet
+retweet_re = re.compile(r'^RT @\w+: ')
+
+
+def retweet_key(text):
+    """
+    Dedup key that gives a retweet the same key as the original tweet
+    (and as every other retweet of it): the text without the RT prefix.
+    :param text: string
+    """
+    if not isinstance(text, str):
+        return text
+    return retweet_re.sub('', text, count=1)
+
+
+class RankedCounts(object):
+    """
+    Counts that keep the keys (words or word ids) grouped by count, so
+    most_common(n) only looks at the highest counts instead of sorting
+    every key.  Updates cost O(changed keys * log(distinct counts)).
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._buckets = {}  # count -> set of words
+        self._levels = []  # distinct counts, ascending
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def _remove(self, word, value):
+        bucket = self._buckets[value]
+        bucket.discard(word)
+        if not bucket:
+            del self._buckets[value]
+            del self._levels[bisect_left(self._levels, value)]
+
+    def _insert(self, word, value):
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            bucket = self._buckets[value] = set()
+            insort(self._levels, value)
+        bucket.add(word)
+
+    def update(self, deltas):
+        """
+        Adds deltas to the counts, keys that reach 0 are removed.
+        :param deltas: dict key -> int (negative to subtract)
+        """
+        for word, delta in deltas.items():
+            if delta == 0:
+                continue
+            old = self.counts.get(word, 0)
+            new = old + delta
+            if old > 0:
+                self._remove(word, old)
+            if new > 0:
+                self.counts[word] = new
+                self._insert(word, new)
+            else:
+                self.counts.pop(word, None)
+
+    def most_common(self, n=None):
+        """
+        Same as Counter.most_common(n), ties are sorted by key.
+        :param n: number of keys, None for every key
+        """
+        if n is None:
+            n = len(self.counts)
+        result = []
+        for value in reversed(self._levels):
+            needed = n - len(result)
+            if needed <= 0:
+                break
+            bucket = self._buckets[value]
+            words = sorted(bucket) if len(bucket) <= needed else nsmallest(needed, bucket)
+            result.extend((word, value) for word in words)
+        return result
+
+
+class _Chunk(object):
+    """ tweets added by one call to WindowCounter.add() """
+    __slots__ = ('corpus', 'times', 'keys', 'start')
+
+    def __init__(self, corpus, times, keys):
+        self.corpus = corpus
+        self.times = times  # int64 ns since epoch, or None
+        self.keys = keys  # int64 hashes of the dedup keys, or None
+        self.start = 0  # tweets before start already left the window
+
+    def __len__(self):
+        return len(self.corpus) - self.start
+
+
+class WindowCounter(object):
+    """
+    Word counter of a sliding window of tweets.
+
+    add() counts the word bags of the new tweets and subtracts the ones
+    of the tweets that leave the window, so an update costs O(new tweets)
+    instead of rebuilding a Counter of the whole window.  The window keeps
+    the newest max_size tweets and/or the tweets not older than max_age
+    from the newest one.
+
+    Word bags are kept as int32 ids of a Vocabulary in one Corpus per
+    add(), and counted with numpy.bincount.
+
+    Tweets with the same dedup key (e.g. retweet_key of the text) are
+    counted once while any of them is in the window; they must have the
+    same word bag, as retweets do.
+    """
+
+    def __init__(self, max_size=None, max_age=None, vocabulary=None):
+        """
+        :param max_size: number of tweets kept, None for no limit
+        :param max_age: Timedelta (or seconds) kept behind the newest tweet,
+        None for no limit
+        :param vocabulary: Vocabulary of the word ids, a new one if None
+        """
+        if max_age is not None and not isinstance(max_age, pd.Timedelta):
+            max_age = pd.Timedelta(seconds=max_age)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.generation = None  # last generation counted
+        self.newest = None  # time of the newest tweet, ns since epoch
+
+        self.ranked = RankedCounts()  # word id -> count
+        self._chunks = deque()  # oldest first
+        self._size = 0
+        self._refs = {}  # dedup key hash -> number of tweets in the window
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, word):
+        i = self.vocabulary.index.get(word)
+        return 0 if i is None else self.ranked[i]
+
+    @property
+    def nbytes(self):
+        """
+        Bytes used by the word ids, times and keys of the window.
+        """
+        return sum(chunk.corpus.nbytes + (0 if chunk.times is None else chunk.times.nbytes) +
+                   (0 if chunk.keys is None else chunk.keys.nbytes) for chunk in self._chunks)
+
+    def add(self, wordbags, times=None, keys=None, generation=None):
+        """
+        Counts the word bags of new tweets, oldest first, and drops the
+        tweets that leave the window.
+        :param wordbags: Corpus or list of lists of words
+        :param times: datetimes of the tweets, needed with max_age
+        :param keys: dedup keys of the tweets, None to count every tweet
+        :param generation: refresh number of the tweets, a generation that
+        was already counted is ignored
+        :return: number of tweets in the window
+        """
+        if generation is not None:
+            if self.generation is not None and generation <= self.generation:
+                return self._size
+            self.generation = generation
+
+        corpus = wordbags if isinstance(wordbags, Corpus) else self.vocabulary.encode(wordbags)
+        if len(corpus) == 0:
+            return self._size
+
+        if times is not None:
+            times = pd.to_datetime(pd.Series(times), utc=True).values.astype('datetime64[ns]').astype(np.int64)
+            newest = int(times.max())
+            self.newest = newest if self.newest is None else max(self.newest, newest)
+
+        added = corpus.indices
+        if keys is not None:
+            keys = np.fromiter((hash(key) for key in keys), dtype=np.int64, count=len(corpus))
+            refs = self._refs
+            counted = np.zeros(len(keys), dtype=bool)
+            for i, key in enumerate(keys.tolist()):
+                n = refs.get(key, 0)
+                refs[key] = n + 1
+                counted[i] = n == 0
+            if not counted.all():
+                added = corpus.take(counted).indices
+
+        self._chunks.append(_Chunk(corpus, times, keys))
+        self._size += len(corpus)
+
+        delta = np.bincount(added, minlength=len(self.vocabulary))
+        for removed in self._expire():
+            delta[:len(removed)] -= removed
+        changed = np.flatnonzero(delta)
+        self.ranked.update(dict(zip(changed.tolist(), delta[changed].tolist())))
+        return self._size
+
+    def _expire(self):
+        """
+        Drops the tweets outside the window and yields the counts to subtract.
+        """
+        max_age = None if self.max_age is None else self.max_age.value
+        while self._chunks:
+            chunk = self._chunks[0]
+            drop = 0
+            if self.max_size is not None:
+                drop = min(len(chunk), max(self._size - self.max_size, 0))
+            if max_age is not None and chunk.times is not None:
+                old = self.newest - chunk.times[chunk.start + drop:] > max_age
+                drop += len(old) if old.all() else int(np.argmin(old))
+            if drop == 0:
+                return
+
+            start, stop = chunk.start, chunk.start + drop
+            counted = np.zeros(len(chunk.corpus), dtype=bool)
+            counted[start:stop] = True
+            if chunk.keys is not None:
+                refs = self._refs
+                for i, key in enumerate(chunk.keys[start:stop].tolist(), start):
+                    n = refs[key] - 1
+                    if n:
+                        refs[key] = n
+                        counted[i] = False
+                    else:
+                        del refs[key]
+            yield chunk.corpus.take(counted).counts()
+
+            chunk.start = stop
+            self._size -= drop
+            if len(chunk):
+                return
+            self._chunks.popleft()
+
+    def most_common(self, n=None):
+        """
+        Returns the n most common words of the window and their counts.
+        :param n: number of words, None for every word
+        """
+        words = self.vocabulary.words
+        return [(words[i], value) for i, value in self.ranked.most_common(n)]
+
+    def counter(self, n=None):
+        """
+        Returns a Counter with the n most common words (every word if None),
+        for the code that expects a Counter like create_wc2().
+        :param n: number of words
+        """
+        return Counter(dict(self.most_common(n)))